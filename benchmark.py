@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+"""
+	Benchmarks for the ParsingTestPipe converters and scoring stages.
+
+	Each stage is run on the original corpus and on corpora replicated
+	10 and 100 times, to see how it scales with the amount of data:
+
+		general, split, func	general_clean, general_clean_split and general_clean_func on Annotald files
+		general+split+func	all three schemas in one pass, as annotald_to_general_multi does
+		ipclean	general_ipclean on an IceParser file
+		delete_lines	delete_lines on the gold and test bracketed files
+		combine_reports	combine_reports on a folder of evalb reports
+
+	A replicated corpus repeats each file, so a 10x corpus has ten copies of
+	every file, written to a temporary folder and read from there as the stage
+	runs, so that the input read grows with the scale. For each stage and scale the benchmark reports trees per second,
+	percentiles of the time taken per file, or the total time for combine_reports,
+	which takes the whole folder at once, and the peak memory (RSS) of the
+	process running the stage. Each stage and scale runs in its own process,
+	so that the peak memory of one doesn't hide that of the next.
+
+	Stages whose input can't be found are skipped. The evalb reports are
+	expected in the reports folder of the data folder, where eval.py puts them.
+
+	The results are saved as JSON, along with the current commit,
+	so that they can be compared between commits.
+
+	The program expects GreynirCorpus and icenlp to be symlinked into the main
+	directory, as described in eval.py. To run the benchmark on the development set:
+
+	$ python benchmark.py
+
+	To run only the converters, on the original corpus and a 10x corpus,
+	repeating each measurement 5 times:
+	$ python benchmark.py -t general split func -x 1 10 -r 5
+
+	To compare with the results saved before a change:
+	$ python benchmark.py -o after.json -c before.json
+
+"""
+
+import os
+import abc
+import sys
+import json
+import shutil
+import pathlib
+import argparse
+import datetime
+import platform
+import resource
+import tempfile
+import subprocess
+import concurrent.futures
+import multiprocessing
+from timeit import default_timer as timer
+
+import numpy as np
+
+import helpers
+import results
+import scorer
+import treefiles
+
+DEVGOLD = pathlib.Path().absolute() / 'GreynirCorpus' / 'devset' / 'psd'
+DEVDATA = pathlib.Path().absolute() / 'data' / 'devset'
+SHALLOWGOLD = pathlib.Path().absolute() / 'icenlp' / 'core' / 'bat' / 'iceparser' / 'testData' / 'test.gold.sent.gold'
+
+STAGES = ("general", "split", "func", "general+split+func", "ipclean", "delete_lines", "combine_reports")
+PERCENTILES = (50, 90, 99)
+
+parser = argparse.ArgumentParser(
+	description=(
+		"This program measures the speed of the converters and scoring stages in ParsingTestPipe"
+	)
+)
+
+parser.add_argument(
+	"-i",
+	"--infolder",
+	type=pathlib.Path,
+	default=DEVGOLD,
+	help="Folder with Annotald files",
+)
+
+parser.add_argument(
+	"-s",
+	"--suffix",
+	default=".gld",
+	help="Suffix of the Annotald files",
+)
+
+parser.add_argument(
+	"-p",
+	"--icenlp",
+	type=pathlib.Path,
+	default=SHALLOWGOLD,
+	help="IceParser file",
+)
+
+parser.add_argument(
+	"-d",
+	"--data",
+	type=pathlib.Path,
+	default=DEVDATA,
+	help="Data folder with goldbrackets, genbrackets and reports",
+)
+
+parser.add_argument(
+	"-t",
+	"--stages",
+	nargs="+",
+	choices=STAGES,
+	default=STAGES,
+	help="Stages to measure",
+)
+
+parser.add_argument(
+	"-x",
+	"--scales",
+	nargs="+",
+	type=int,
+	default=[1, 10, 100],
+	help="How many times the corpus is replicated",
+)
+
+parser.add_argument(
+	"-r",
+	"--repeat",
+	type=int,
+	default=3,
+	help="Number of times each measurement is repeated, the fastest one is reported",
+)
+
+parser.add_argument(
+	"-o",
+	"--output",
+	type=pathlib.Path,
+	default=pathlib.Path("benchmark.json"),
+	help="JSON file the results are saved in",
+)
+
+parser.add_argument(
+	"-c",
+	"--compare",
+	type=pathlib.Path,
+	default=None,
+	help="JSON file with earlier results to compare with",
+)
+
+def bracket_files(folder, suffix=".br"):
+	""" Returns the sorted bracketed files with suffix in folder """
+	if not folder.is_dir():
+		return []
+	return sorted(p for p in folder.iterdir() if p.suffix == suffix and p.is_file())
+
+def stage_inputs(stage, args):
+	""" Returns the input files of a stage, an empty list if there are none """
+	if stage in helpers.SCHEMAS or stage == "+".join(helpers.SCHEMAS):
+		if not args.infolder.is_dir():
+			return []
+		return [str(p) for p in sorted(args.infolder.iterdir()) if p.suffix == args.suffix]
+	if stage == "ipclean":
+		return [str(args.icenlp)] if args.icenlp.is_file() else []
+	if stage == "delete_lines":
+		# Test files are paired with gold files by stem, their suffixes differ
+		gen = args.data / "genbrackets"
+		tests = {p.stem: p for p in gen.iterdir() if p.is_file()} if gen.is_dir() else {}
+		return [
+			(str(p), str(tests[p.stem]))
+			for p in bracket_files(args.data / "goldbrackets")
+			if p.stem in tests
+		]
+	if stage == "combine_reports":
+		return [str(p) for p in bracket_files(args.data / "reports", ".out")]
+	return []
+
+class Stage(abc.ABC):
+	""" Base class for a measured stage. A stage has a list of units, usually one for
+		each file of the replicated corpus. setup(unit) is called before each unit is
+		measured, without being timed, and run(unit) returns the number of trees processed.
+		A stage that runs as a single unit has no latency percentiles, only its total time. """
+
+	per_unit = True	# Whether the units are files, whose latencies are reported
+
+	def __init__(self, inputs, scale, workdir):
+		self.units = []
+
+	@staticmethod
+	def replicate(inputs, scale, folder):
+		""" Copies each input file scale times into folder and returns the copies,
+			scale copies of the first file, then of the next and so on """
+		folder.mkdir()
+		copies = []
+		for pin in inputs:
+			pin = pathlib.Path(pin)
+			for i in range(scale):
+				pout = folder / "{}_{}{}".format(pin.stem, i, pin.suffix)
+				shutil.copyfile(pin, pout)
+				copies.append(pout)
+		return copies
+
+	def setup(self, unit):
+		pass
+
+	@abc.abstractmethod
+	def run(self, unit):
+		""" Processes a unit and returns the number of trees in it """
+
+class ConverterStage(Stage):
+	""" Transforms each Annotald file to one or more schemas, reading it and writing
+		the bracketed files as annotald_to_general_multi does """
+
+	def __init__(self, inputs, scale, workdir, schemas):
+		super().__init__(inputs, scale, workdir)
+		self.schemas = schemas
+		self.outfolder = workdir / "out"
+		self.outfolder.mkdir()
+		numtrees = [len(treefiles.read_annotald(pathlib.Path(pin))) for pin in inputs]
+		copies = self.replicate(inputs, scale, workdir / "in")
+		self.units = [(pin, numtrees[i // scale]) for i, pin in enumerate(copies)]
+
+	def run(self, unit):
+		pin, numtrees = unit
+		pouts = {schema: self.outfolder / "{}.{}".format(pin.stem, schema) for schema in self.schemas}
+		helpers.transform_annotald_file(pin, pouts)
+		return numtrees
+
+class IceParserStage(Stage):
+	""" Reads and transforms the trees of an IceParser file """
+
+	def __init__(self, inputs, scale, workdir):
+		super().__init__(inputs, scale, workdir)
+		self.units = self.replicate(inputs, scale, workdir / "in")
+
+	def run(self, pin):
+		trees = helpers.read_icenlp(pin)
+		helpers.general_ipclean(trees)
+		return len(trees)
+
+class DeleteLinesStage(Stage):
+	""" Writes copies of the gold and test files without their S0-X trees """
+
+	def __init__(self, inputs, scale, workdir):
+		super().__init__(inputs, scale, workdir)
+		self.goldfolder = workdir / "gold"
+		self.testfolder = workdir / "test"
+		golds = self.replicate([gold for gold, test in inputs], scale, workdir / "ingold")
+		tests = self.replicate([test for gold, test in inputs], scale, workdir / "intest")
+		self.units = list(zip(golds, tests))
+
+	def run(self, unit):
+		pgold, ptest = unit
+		with pgold.open() as f:
+			numtrees = sum(1 for line in f)
+		helpers.delete_lines(pgold, ptest, self.goldfolder, self.testfolder)
+		return numtrees
+
+class CombineReportsStage(Stage):
+	""" Combines a folder with scale copies of each evalb report into one report,
+		from the results of the copies, which are saved as get_results saves them.
+		combine_reports takes the whole folder at once, so only its total time is reported. """
+
+	per_unit = False
+
+	def __init__(self, inputs, scale, workdir):
+		super().__init__(inputs, scale, workdir)
+		self.reportfolder = workdir / "reports"
+		self.reportfolder.mkdir()
+		self.numsents = 0
+		params = scorer.Parameters.from_file(helpers.EVALBPARAMS)
+		database = results.ResultsDatabase(self.reportfolder)
+		for pin in inputs:
+			pin = pathlib.Path(pin)
+			self.numsents += scale * report_sentences(pin)
+			for i in range(scale):
+				pout = self.reportfolder / "{}_{}{}".format(pin.stem, i, pin.suffix)
+				shutil.copyfile(pin, pout)
+				database.save(pout, results.read_report(pout.name, pout.read_bytes(), params))
+		database.close()
+		# The whole folder is a single unit
+		self.units = [self.reportfolder]
+
+	def run(self, reportfolder):
+		helpers.combine_reports(reportfolder)
+		return self.numsents
+
+def report_sentences(preport):
+	""" Returns the number of sentences in the summary of an evalb report """
+	with preport.open() as f:
+		for line in f:
+			if line.startswith("Number of sentence "):
+				return int(float(line.split()[-1]))
+	return 0
+
+def make_stage(stage, inputs, scale, workdir):
+	if stage in helpers.SCHEMAS:
+		return ConverterStage(inputs, scale, workdir, (stage,))
+	if stage == "+".join(helpers.SCHEMAS):
+		return ConverterStage(inputs, scale, workdir, helpers.SCHEMAS)
+	if stage == "ipclean":
+		return IceParserStage(inputs, scale, workdir)
+	if stage == "delete_lines":
+		return DeleteLinesStage(inputs, scale, workdir)
+	if stage == "combine_reports":
+		return CombineReportsStage(inputs, scale, workdir)
+	raise ValueError("Unknown stage {}".format(stage))
+
+def peak_rss():
+	""" Returns the peak resident memory of this process in MB """
+	maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Bytes on macOS, kilobytes elsewhere
+	return maxrss / (1 << 20) if sys.platform == "darwin" else maxrss / (1 << 10)
+
+def measure(stage, inputs, scale, repeat):
+	""" Runs a stage on a corpus replicated scale times, repeat times.
+		Meant to run in a fresh process, see run_measurement. Returns a dict of results
+		for the fastest repetition """
+	with tempfile.TemporaryDirectory() as tmp:
+		work = make_stage(stage, inputs, scale, pathlib.Path(tmp))
+		loaded_rss = peak_rss()
+		best = None
+		for x in range(repeat):
+			latencies = []
+			numtrees = 0
+			for unit in work.units:
+				work.setup(unit)
+				start = timer()
+				numtrees += work.run(unit)
+				latencies.append(timer() - start)
+			if best is None or sum(latencies) < sum(best[1]):
+				best = (numtrees, latencies)
+	numtrees, latencies = best
+	duration = sum(latencies)
+	ms = np.array(latencies) * 1000.0
+	return {
+		"stage": stage,
+		"scale": scale,
+		"files": len(latencies),
+		"trees": numtrees,
+		"seconds": duration,
+		"trees_per_sec": numtrees / duration if duration > 0 else 0.0,
+		"latency_ms": {"p{}".format(q): float(v) for q, v in zip(PERCENTILES, np.percentile(ms, PERCENTILES))} if work.per_unit else None,
+		"loaded_rss_mb": loaded_rss,
+		"peak_rss_mb": peak_rss(),
+	}
+
+def run_measurement(stage, inputs, scale, repeat):
+	""" Runs measure in a new process, so that the peak memory belongs to this stage alone """
+	context = multiprocessing.get_context("spawn")
+	with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+		return pool.submit(measure, stage, inputs, scale, repeat).result()
+
+def git_commit():
+	""" Returns the current commit of the repository, or None outside of git """
+	try:
+		out = subprocess.run(
+			["git", "rev-parse", "HEAD"],
+			cwd=pathlib.Path(__file__).absolute().parent,
+			capture_output=True,
+			text=True,
+			check=True,
+		)
+	except (OSError, subprocess.CalledProcessError):
+		return None
+	commit = out.stdout.strip()
+	out = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=pathlib.Path(__file__).absolute().parent, capture_output=True, text=True)
+	if out.stdout.strip():
+		commit += "-dirty"
+	return commit
+
+def print_result(result, earlier=None):
+	latency = result["latency_ms"]
+	if latency is None:
+		# A single unit, its total time instead of the percentiles
+		latencies = "{:>20}{:>10.2f} s ".format("total", result["seconds"])
+	else:
+		latencies = "{:>10.2f}{:>10.2f}{:>10.2f} ms".format(latency["p50"], latency["p90"], latency["p99"])
+	line = "{:20}{:>5}x{:>12.0f} trees/sec{}{:>10.1f} MB".format(
+		result["stage"],
+		result["scale"],
+		result["trees_per_sec"],
+		latencies,
+		result["peak_rss_mb"],
+	)
+	if earlier is not None and earlier["trees_per_sec"] > 0:
+		line += "{:>+9.1f}%".format(100.0 * (result["trees_per_sec"] / earlier["trees_per_sec"] - 1.0))
+	print(line)
+
+def main() -> None:
+	args = parser.parse_args()
+
+	earlier = {}
+	if args.compare is not None:
+		previous = json.loads(args.compare.read_text())
+		print("Comparing with {}, commit {}".format(args.compare, previous.get("commit")))
+		earlier = {(r["stage"], r["scale"]): r for r in previous["results"]}
+
+	print("{:20}{:>6}{:>22}{:>10}{:>10}{:>10}{:>16}".format("Stage", "Scale", "Speed", "p50", "p90", "p99", "Peak RSS"))
+	measured = []
+	for stage in args.stages:
+		inputs = stage_inputs(stage, args)
+		if not inputs:
+			print("{:20}skipped, no input found".format(stage))
+			continue
+		for scale in args.scales:
+			result = run_measurement(stage, inputs, scale, args.repeat)
+			print_result(result, earlier.get((stage, scale)))
+			measured.append(result)
+
+	output = {
+		"commit": git_commit(),
+		"date": datetime.datetime.now().isoformat(timespec="seconds"),
+		"python": platform.python_version(),
+		"cpus": os.cpu_count(),
+		"repeat": args.repeat,
+		"results": measured,
+	}
+	args.output.write_text(json.dumps(output, indent=1))
+	print("\nResults saved in {}".format(args.output))
+
+if __name__ == "__main__":
+	main()
@@ -30,6 +30,7 @@
 import pathlib
 from timeit import default_timer as timer
 import subprocess
+import argparse
 
 from reynir import Settings
 from reynir.simpletree import SimpleTree
@@ -51,18 +52,32 @@ CORPUS = pathlib.Path().absolute() / 'GreynirCorpus' / DATA
 GENPSD = pathlib.Path().absolute() / 'data' / DATA / 'genpsd'
 BRACKETS = pathlib.Path().absolute() / 'data' / DATA / 'brackets'
 
+parser = argparse.ArgumentParser(
+	description=(
+		"This program transforms the handannotated corpus to bracketed form"
+	)
+)
+
+parser.add_argument(
+	"-j",
+	"--jobs",
+	type=int,
+	default=1,
+	help="Number of processes used to transform files, 0 uses all cores",
+)
 
 class Maker():
 
-	def start(self, overwrite=False):
+	def start(self, overwrite=False, jobs=1):
 		print("Transforming handannotated parse trees to general bracketed form")
 		# TODO tékka hér á argparse hvort devset eða testset
-		helpers.annotald_to_general(CORPUS, BRACKETS, '.gld', '.dbr', True, True)
+		helpers.annotald_to_general(CORPUS, BRACKETS, '.gld', '.dbr', True, True, jobs)
 		# helpers.annotald_to_general(CORPUS, BRACKETS, '.pgld', '.pbr', True, True)
 
 
 if __name__ == "__main__":
 
+	args = parser.parse_args()
 	#ans = input("Do you want to overwrite existing files? (y/n)\n")	# tODO breyta í argparse
 	#if ans == "y":
 	#	ans = True
@@ -71,7 +86,7 @@ if __name__ == "__main__":
 	ans = True	
 	start = timer()
 	maker = Maker()
-	maker.start(ans)
+	maker.start(ans, args.jobs)
 	end = timer()
 	duration = end - start
 	print("")
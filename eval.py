@@ -48,9 +48,47 @@
 	To parse 10 files in the development corpus:
 	$ python eval.py -n 10
 
+	To transform each file just before it is evaluated, so that
+	only the files needed are touched:
+	$ python eval.py -l -n 10
+
 	To skip results for each category and only give overall results:
 	$ python eval.py -m -c
 
+	The hand-annotated files are transformed to the general schema.
+	To also make the split and function-tag bracketings in the same pass:
+	$ python eval.py --schemas general split func
+
+	The parse trees in data/devset/genpsd are used as they are. To parse
+	the texts of the corpus with Greynir first, writing them there:
+	$ python eval.py --parse
+
+	To parse them with Annotald's annoparse command instead, whose
+	output the in-process parser should match:
+	$ python eval.py --parse --annoparse
+
+	To transform and compare the files using 8 processes:
+	$ python eval.py -j 8
+
+	To score the files without evalb, with the built-in scorer
+	that reads the same settings from stillingar.prm:
+	$ python eval.py -b
+
+	To run evalb once on all the files, which gives the same reports
+	as running it once for each file:
+	$ python eval.py -e
+
+	The combined results give 95% bootstrap confidence intervals for the
+	recall, precision and F-measure, from 10,000 resamples of the sentences.
+	To compare the F-measure to that of an earlier run, kept in a copy of
+	its reports folder, with paired significance tests:
+	$ python eval.py --baseline ../before/data/devset/reports
+
+	To score the output of several parsers against the same gold files
+	in one run, with a table of their results side by side in
+	data/devset/comparison.out:
+	$ python eval.py --compare data/devset/genbrackets ../before/data/devset/genbrackets
+
 """
 
 import pathlib
@@ -101,7 +139,7 @@ parser.add_argument(
 	"-ow",
 	"--overwrite",
 	action="store_true",
-	help="Overwrite existing files",
+	help="Overwrite existing files, even if they are up to date",
 )
 
 parser.add_argument(
@@ -117,6 +155,63 @@ parser.add_argument(
     ),
 )
 
+parser.add_argument(
+	"-n",
+	"--numfiles",
+	type=int,
+	default=None,
+	help="Only evaluate the first n files",
+)
+
+parser.add_argument(
+	"-l",
+	"--lazy",
+	action="store_true",
+	help="Transform each file just before it is evaluated instead of all files up front",
+)
+
+parser.add_argument(
+	"-b",
+	"--builtin",
+	action="store_true",
+	help="Score with the built-in evalb-compatible scorer instead of EVALB/evalb",
+)
+
+parser.add_argument(
+	"-e",
+	"--batch",
+	action="store_true",
+	help="Run evalb once on all the files instead of once for each file",
+)
+
+parser.add_argument(
+	"--schemas",
+	nargs="+",
+	choices=helpers.SCHEMAS,
+	default=["general"],
+	help="Schemas the hand-annotated files are transformed to, in one pass: general (goldbrackets), split (splitgoldbrackets) and func (funcgoldbrackets)",
+)
+
+parser.add_argument(
+	"--parse",
+	action="store_true",
+	help="Parse the text files of the corpus with Greynir into genpsd before they are evaluated",
+)
+
+parser.add_argument(
+	"--annoparse",
+	action="store_true",
+	help="With --parse, parse with the annoparse command instead of in-process",
+)
+
+parser.add_argument(
+	"-j",
+	"--jobs",
+	type=int,
+	default=1,
+	help="Number of processes used to transform and compare files, 0 uses all cores",
+)
+
 parser.add_argument(
 	"-r",
 	"--roles",
@@ -125,6 +220,52 @@ parser.add_argument(
 	help="Run measurements for roles in IceParser instead of phrase structure"
 )
 
+parser.add_argument(
+	"-s",
+	"--resamples",
+	type=int,
+	default=10000,
+	help="Number of bootstrap resamples for the confidence intervals of the combined results, 0 to skip them",
+)
+
+parser.add_argument(
+	"-t",
+	"--timeout",
+	type=float,
+	default=helpers.SENTENCE_TIMEOUT,
+	help="Seconds Greynir may spend on a sentence before it is written as S0-X and logged, 0 for no limit",
+)
+
+parser.add_argument(
+	"--baseline",
+	type=pathlib.Path,
+	default=None,
+	help="Folder with reports of the same files from another run, which the F-measure is compared to",
+)
+
+parser.add_argument(
+	"--compare",
+	nargs="+",
+	metavar="FOLDER[:SUFFIX]",
+	default=None,
+	help="Compare the bracketed files of several parsers, in these folders, against the same gold files; .br files unless a suffix is given",
+)
+
+def compareprocess():
+	# Several parsers against the deep gold files, loaded once
+	goldoutputs = {"general": (DEEPGOLDBRACKETS, '.br')}
+	files = helpers.annotald_files(DEEPGOLD, '.gld')[:NUMFILES]
+
+	print("Transforming handannotated parse trees to general bracketed form")
+	helpers.annotald_to_general_multi(DEEPGOLD, goldoutputs, '.gld', OVERWRITE, EXCLUDE, JOBS, files)
+
+	print("Comparing parsers")
+	systems = []
+	for system in COMPARE:
+		folder, _, suffix = system.partition(":")
+		systems.append((system, pathlib.Path(folder).absolute(), suffix or ".br"))
+	helpers.compare_systems(DEEPGOLDBRACKETS, '.br', systems, DEEPREPORTS.parent / 'comparison.out')
+
 def icepahcprocess():
 	print("Retrieving automatic parse trees")
 	# helpers.get_ipparse(TEXTS, DEEPGEN, '.txt', '.ippsd', OVERWRITE)
@@ -133,7 +274,7 @@ def icepahcprocess():
 	# helpers.annotald_to_general(DEEPGEN, DEEPGENBRACKETS, ".ippsd", ".ipdbr", True, OVERWRITE, EXCLUDE) # FOR ICEPAHC, should work
 
 	print("Transforming handannotated parse trees to general bracketed form")
-	#helpers.annotald_to_general(DEEPGOLD, DEEPBRACKETS, '.gld', '.ipdbr', OVERWRITE, True)
+	#helpers.annotald_to_general(DEEPGOLD, DEEPGOLDBRACKETS, '.gld', '.ipdbr', OVERWRITE, True)
 
 	print("Retrieving results from evalb")
 	# (testfile suffix, goldfile suffix, output file suffix)
@@ -142,68 +283,109 @@ def icepahcprocess():
 		#(".ipdbr", ".ipdbr", ".ipdout"), 
 		(".grdbr", ".dbr", ".grdout")
 	]
-	helpers.get_results(DEEPBRACKETS, DEEPGENBRACKETS, DEEPREPORTS, tests, EXCLUDE)
+	helpers.get_results(DEEPGOLDBRACKETS, DEEPGENBRACKETS, DEEPREPORTS, tests, EXCLUDE, builtin=BUILTIN, batch=BATCH, jobs=JOBS)
 
 
 	print("Combining reports by genre")
 	suffixes = [".grdout",]  # ".grpout", ".inpout", ".ipdout"  # TODO this should be ".ipdout"
 	genres = ["greynir_corpus" ] #  TODO taka þetta út?
 
-	helpers.combine_reports(DEEPREPORTS, suffixes, genres, NOCAT)
+	helpers.combine_reports(DEEPREPORTS, suffixes, genres, NOCAT, RESAMPLES, BASELINE)
 
 def shallowprocess():
 	
 	print("Transforming automatic parse trees to general bracketed form")
-	helpers.icenlp_to_general(SHALLOWGEN, SHALLOWGENBRACKETS, ".psd", ".br", OVERWRITE, EXCLUDE, ROLES)
+	helpers.icenlp_to_general(SHALLOWGEN, SHALLOWGENBRACKETS, ".psd", ".br", OVERWRITE, EXCLUDE, ROLES, JOBS)
 
 	print("Transforming handannotated parse trees to general bracketed form")
-	helpers.icenlp_to_general(SHALLOWGOLD, SHALLOWGOLDBRACKETS, '.gld', '.br', OVERWRITE, EXCLUDE, ROLES)
+	helpers.icenlp_to_general(SHALLOWGOLD, SHALLOWGOLDBRACKETS, '.gld', '.br', OVERWRITE, EXCLUDE, ROLES, JOBS)
 
 	print("Retrieving results from evalb")
 	# (testfile suffix, goldfile suffix, output file suffix)
 	tests = [(".br", ".br", ".out")]
-	helpers.get_results(SHALLOWGOLDBRACKETS, SHALLOWGENBRACKETS, SHALLOWREPORTS, tests, EXCLUDE)
+	helpers.get_results(SHALLOWGOLDBRACKETS, SHALLOWGENBRACKETS, SHALLOWREPORTS, tests, EXCLUDE, builtin=BUILTIN, batch=BATCH, jobs=JOBS)
 
-def deepprocess():
+	print("Combining reports")
+	helpers.combine_reports(SHALLOWREPORTS, [".out"], None, NOCAT, RESAMPLES, BASELINE)
 
-	print("Retrieving automatic parse trees")
-	#helpers.get_annoparse(TEXTS, DEEPGEN, ".txt", ".psd", OVERWRITE)
+def deepprocess():
 
-	print("Transforming automatic parse trees to general bracketed form")
-	#helpers.annotald_to_general(DEEPGEN, DEEPGENBRACKETS, '.psd', '.br',OVERWRITE, EXCLUDE)
-	#helpers.annotald_to_general_split(DEEPGEN, DEEPGENBRACKETS, '.psd', '.br',OVERWRITE, EXCLUDE)
-	#helpers.annotald_to_general_func(DEEPGEN, DEEPGENBRACKETS, '.psd', '.fbr',OVERWRITE, EXCLUDE)
+	if PARSE:
+		print("Retrieving automatic parse trees")
+		DEEPGEN.mkdir(parents=True, exist_ok=True)
+		helpers.get_annoparse(TEXTS, DEEPGEN, ".txt", ".psd", OVERWRITE, JOBS, timeout=TIMEOUT, annoparse=ANNOPARSE)
+
+	# One pass over the gold files for the schemas chosen with --schemas
+	goldoutputs = {
+		"general": (DEEPGOLDBRACKETS, '.br'),
+		"split": (SPLIT, '.br'),
+		"func": (FUNC, '.fbr'),
+	}
+	goldoutputs = {schema: goldoutputs[schema] for schema in SCHEMAS}
+	# The split gold files are compared to the general bracketing of the parser
+	genoutputs = {"general": (DEEPGENBRACKETS, '.br')}
+	if "func" in SCHEMAS:
+		genoutputs["func"] = (DEEPGENBRACKETS, '.fbr')
+	files = helpers.annotald_files(DEEPGOLD, '.gld')[:NUMFILES]
+	# Parsed files, if there are any, otherwise the bracketed files in genbrackets are used as they are
+	genfiles = [stem for stem in files if (DEEPGEN / (stem + '.psd')).exists()] if DEEPGEN.is_dir() else []
 
-	print("Transforming handannotated parse trees to general bracketed form")
-	helpers.annotald_to_general(DEEPGOLD, DEEPGOLDBRACKETS, '.gld', '.br', OVERWRITE, EXCLUDE)
-	#helpers.annotald_to_general_split(DEEPGOLD, SPLIT, '.gld', '.br', OVERWRITE, EXCLUDE)
-	#helpers.annotald_to_general_func(DEEPGOLD, FUNC, '.gld', '.fbr', OVERWRITE, EXCLUDE)
-
-	print("Retrieving results from evalb")
 	# (testfile suffix, goldfile suffix, output file suffix)
 	tests = [(".br", ".br", ".out")]
 	#tests = [(".fbr", ".fbr", ".out")]
-	#helpers.get_results(DEEPGOLDBRACKETS, DEEPGENBRACKETS, DEEPREPORTS, tests, EXCLUDE)
-	#helpers.get_results(SPLIT, DEEPGENBRACKETS, DEEPREPORTS, tests, EXCLUDE)
-	#helpers.get_results(FUNC, DEEPGENBRACKETS, DEEPREPORTS, tests, EXCLUDE)
 
-	print("Combining reports")
+	# The same steps either way, lazily each file is transformed just before it is compared
+	if LAZY:
+		print("Transforming parse trees and retrieving results from evalb, file by file")
+		converters = [helpers.LazyConversion(DEEPGOLD, goldoutputs, '.gld', OVERWRITE, EXCLUDE)]
+		if genfiles:
+			converters.append(helpers.LazyConversion(DEEPGEN, genoutputs, '.psd', OVERWRITE, EXCLUDE))
+		try:
+			helpers.get_results(DEEPGOLDBRACKETS, DEEPGENBRACKETS, DEEPREPORTS, tests, EXCLUDE, files, converters, BUILTIN, BATCH, JOBS)
+		finally:
+			for converter in converters:
+				converter.close()
+	else:
+		if genfiles:
+			print("Transforming automatic parse trees to general bracketed form")
+			helpers.annotald_to_general_multi(DEEPGEN, genoutputs, '.psd', OVERWRITE, EXCLUDE, JOBS, genfiles)
 
-	#helpers.combine_reports(DEEPREPORTS)
+		print("Transforming handannotated parse trees to general bracketed form")
+		helpers.annotald_to_general_multi(DEEPGOLD, goldoutputs, '.gld', OVERWRITE, EXCLUDE, JOBS, files)
+
+		print("Retrieving results from evalb")
+		helpers.get_results(DEEPGOLDBRACKETS, DEEPGENBRACKETS, DEEPREPORTS, tests, EXCLUDE, files, builtin=BUILTIN, batch=BATCH, jobs=JOBS)
+		#helpers.get_results(SPLIT, DEEPGENBRACKETS, DEEPREPORTS, tests, EXCLUDE, files, builtin=BUILTIN, batch=BATCH, jobs=JOBS)
+		#helpers.get_results(FUNC, DEEPGENBRACKETS, DEEPREPORTS, tests, EXCLUDE, files, builtin=BUILTIN, batch=BATCH, jobs=JOBS)
+
+	print("Combining reports")
+	helpers.combine_reports(DEEPREPORTS, [".out"], None, NOCAT, RESAMPLES, BASELINE)
 
 def main() -> None:
 	args = parser.parse_args() 
 
-	global EXCLUDE, NOCAT, OVERWRITE
+	global EXCLUDE, NOCAT, OVERWRITE, JOBS, NUMFILES, LAZY, BUILTIN, BATCH, RESAMPLES, BASELINE, COMPARE, TIMEOUT, SCHEMAS, PARSE, ANNOPARSE
 
 	EXCLUDE = args.exclude
 	NOCAT = args.nocat
 	OVERWRITE = args.overwrite
+	JOBS = args.jobs
+	NUMFILES = args.numfiles
+	LAZY = args.lazy
+	BUILTIN = args.builtin
+	BATCH = args.batch
+	RESAMPLES = args.resamples
+	BASELINE = args.baseline
+	COMPARE = args.compare
+	TIMEOUT = args.timeout or None
+	SCHEMAS = args.schemas
+	PARSE = args.parse
+	ANNOPARSE = args.annoparse
 
 	start = timer()
 
-	if args.parser == 0:
-		# GreynirPackage, GreynirCorpus
+	if args.parser in (0, 2):
+		# GreynirPackage and IcePaHC, GreynirCorpus
 		global DATA
 		if args.measure:
 			DATA = 'testset'
@@ -219,7 +401,13 @@ def main() -> None:
 		DEEPREPORTS = pathlib.Path().absolute() / 'data' / DATA / 'reports'
 		SPLIT = pathlib.Path().absolute() / 'data' /DATA / 'splitgoldbrackets'
 		FUNC = pathlib.Path().absolute() / 'data' /DATA / 'funcgoldbrackets'
-		deepprocess()
+		if args.parser == 2:
+			# Berkeley parser, IcePaHC
+			icepahcprocess()
+		elif COMPARE:
+			compareprocess()
+		else:
+			deepprocess()
 
 	elif args.parser == 1:
 		# IceParser, icenlp
@@ -234,9 +422,6 @@ def main() -> None:
 		ROLES = args.roles
 		shallowprocess()
 
-	elif args.parser == 2:
-		# Berkeley parser, IcePaHC
-		icepahcprocess()
 	else:
 		pass
 
@@ -1,21 +1,59 @@
 #!/usr/bin/env python
 
 import os
+import re
+import sys
 import pathlib
 import subprocess
-from collections import defaultdict
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import json
+import tempfile
+import bisect
+import threading
+import queue
+import multiprocessing
+import timeit
 import itertools
-
+import math
+import collections
+import shutil
+
+import numpy as np
+import reynir
+import tokenizer
+from reynir import Greynir
 from reynir.simpletree import SimpleTree
-import annotald.util as util
-
-EVALBCOMMAND = ' -p ./stillingar.prm' # handpsd is first argument, then genpsd
+from tokenizer import TOK
+
+import treebank
+import treefiles
+import matching
+import scorer
+import results
+import significance
+import parsecache
+
+EVALBPARAMS = pathlib.Path('stillingar.prm') # Settings for evalb and the built-in scorer
+NOT_BRACKETS = bytes(c for c in range(256) if c not in b"()\n") # Deleted to check the brackets of each line
+WELL_FORMED = re.compile(rb"(?:\([^\s()]*\s+[^\s()]*\)|\([^\s()]*|\)|\s+)*") # Lines without words outside brackets
 ICENLP = pathlib.Path().absolute() / 'icenlp' / 'IceNLPCore' / 'bat'
 
 IPFOLDER = ICENLP / 'iceparser'
 ICEPARSER = './iceparser.sh'
 TAGFOLDER = ICENLP / 'icetagger'
 TAGGER = './icetagger.sh'  # TODO change to another tagger, IceStagger or ABLtagger
+ICENLP_MARK = "ICENLPSKIL"	# Line between documents streamed through IceNLP, see IceNLPProcess
+ICENLP_TAGGED_MARK = ICENLP_MARK + " x"	# The same line tagged, as an unanalysed word, for IceParser
+ICENLP_TIMEOUT = 60	# Seconds an IceNLP process is given to finish when it's closed
+ICENLP_QUEUE = 256	# Tagged sentences waiting for IceParser, see get_icenlpparse
+SENTENCE_TIMEOUT = 30	# Seconds Greynir may spend on a sentence before it's written as S0-X, see TimedParser
+TIMEOUT_LOG = "timeouts.tsv"	# Sentences that timed out, next to the parsed files: file, number, tokens, characters, text
+CRASH_LOG = "crashes.tsv"	# Sentences that Greynir crashed on, next to the parsed files: file, number, exit code, text
+ANNOPARSE = "annoparse"	# Annotald's command for parsing a text file with Greynir, see get_annoparse
+PARSE_MESSAGE = "Parsing file: {}"	# Reported by run_jobs for each file parsed
 
 
 SKIP_LINES = set(["(META", "(ID-CORPUS", "(ID-LOCAL", "(URL", "(COMMENT"])
@@ -235,384 +273,917 @@ GENERALIZE = {
 
 PUNCT = "?!:.,;/+*-\"\'$%&()"
 
-# Get parsed files for each parser
-def get_annoparse(infolder, outfolder, insuffix=".txt", outsuffix=".psd", overwrite=False):
-	""" Takes text files in a specified folder as input and returns files in another specified folder
-		containing parse trees following the Greynir schema """
-	i = 0
-	for p in infolder.iterdir():
-		ptext = p.stem + insuffix
-		ptext = infolder / ptext	# Input file
-		pout = p.stem + outsuffix
-		pout = outfolder / pout		# Output file
-		if pout.exists() and not overwrite:
-			continue
+# Bracketing schemas produced from Annotald trees, see SchemaState
+SCHEMAS = ("general", "split", "func")
 
-		command = "annoparse -i {} -o {} -s".format(ptext, pout)
-		skil = subprocess.Popen([command], shell=True, stdout=subprocess.PIPE).communicate()[0]
-		print(skil)
-		if i % 10 == 0:
-			print("\t{} files done!".format(i))
-		i += 1
+# Increase when a change to general_clean_multi changes its output,
+# so that bracketed files made by an older version are regenerated
+CONVERTER_VERSION = 1
 
-def get_icenlpparse(infolder, outfolder, insuffix=".txt", outsuffix=".psd", overwrite=False):
-	""" Takes text files in a specified folder as input and returns files in another specified folder
-		containing parse trees following the IceParser schema """
-	
-	origpath = pathlib.Path().absolute()
+# Name of the file in each output folder recording what its files were made from
+MANIFEST = ".manifest.json"
 
-	# Necessary for IceParser to work correctly
-	os.chdir(TAGFOLDER)
-	tagsuffix = '.tagged'
-	tagfolder = origpath / 'gentag'
+# Subfolder of the bracketed files with copies whose S0-X lines are deleted, see delete_lines
+EXCLUDED = "excluded"
 
-	for p in infolder.iterdir():
-		ptext = p.stem + insuffix
-		ptext = infolder / ptext
-		ptag = p.stem + tagsuffix
-		ptag = tagfolder / ptag
+# Write buffer size for bracketed output files
+OUTPUT_BUFFER = 1 << 16
 
-		if ptag.exists() and not overwrite:
-			continue
+# Annotald tokens that need more than being collected as a word:
+# brackets, escaped brackets and URLs. See annotald_token
+SPECIAL_TOKEN = re.compile(r"[()]|^\\|^http")
 
-		command = "{} -i {} -o {} -lf 2 -of 2".format(TAGGER, ptext, ptag)
-		skil = subprocess.Popen([command], shell=True, stdout=subprocess.PIPE).communicate()[0]
-		print(skil)
-
-
-	# Necessary for IceParser to work correctly
-	os.chdir(IPFOLDER)
-
-	for p in infolder.iterdir():
-		ptext = p.stem + tagsuffix
-		ptext = tagfolder / ptext
-		pout = p.stem + outsuffix
-		pout = outfolder / pout
+# Kinds of Annotald tokens
+WORD, OPEN, CLOSE, SKIPLINE = range(4)
 
+# Get parsed files for each parser
+def get_annoparse(infolder, outfolder, insuffix=".txt", outsuffix=".psd", overwrite=False, jobs=1, cache=parsecache.DATABASE, timeout=SENTENCE_TIMEOUT, annoparse=False):
+	""" Takes text files in a specified folder as input and returns files in another specified folder
+		containing parse trees following the Greynir schema.
+		The files are parsed in-process, as annoparse would parse them, by up to jobs worker
+		processes, 0 meaning one for each core. Each worker loads Greynir once and keeps it.
+		The trees of each line are looked up in the parse cache at the path cache first, and
+		only the lines that aren't there are parsed; None turns the cache off. The new trees
+		are stored when all the files are parsed, so that the database isn't open while the
+		workers and TimedParser fork.
+		A sentence that Greynir doesn't parse in timeout seconds is written as S0-X and logged
+		in TIMEOUT_LOG in outfolder, see TimedParser; None parses without a limit. A sentence
+		that Greynir crashes on is also written as S0-X, and logged in CRASH_LOG.
+		With annoparse, the ANNOPARSE command is run on each file instead and its output is
+		kept as it is, without the parse cache or a time limit. """
+	work = []
+	for p in sorted(infolder.iterdir()):
+		if p.suffix != insuffix:
+			continue
+		pout = outfolder / (p.stem + outsuffix)	# Output file
 		if pout.exists() and not overwrite:
 			continue
+		work.append((p, pout))
+	if not work:
+		print("All files up to date")
+		return []
+	if annoparse:
+		return run_jobs(annoparse_file, work, jobs=jobs, message=PARSE_MESSAGE)
+	(outfolder / TIMEOUT_LOG).unlink(missing_ok=True)
+	(outfolder / CRASH_LOG).unlink(missing_ok=True)
+	if cache is None:
+		failed = run_jobs(parse_text_file, [(ptext, pout, None) for ptext, pout in work], timeout, jobs=jobs, initializer=load_greynir, message=PARSE_MESSAGE)
+		close_timed_parser()
+		return failed
+
+	toparse = []
+	sentences = {}	# Lines of each text parsed
+	with parsecache.ParseCache(cache, greynir_id()) as parses:
+		for ptext, pout in work:
+			lines = text_sentences(ptext)
+			bodies = parses.lookup(lines)
+			if None in bodies:
+				toparse.append((ptext, pout, bodies))
+				sentences[ptext] = lines
+			else:
+				write_annotald(pout, bodies)
+				print("Found in parse cache: {}".format(ptext.name))
+	parsed = []
+
+	def store(ptext, pout, bodies, trees):
+		parsed.extend((sentences[ptext][i], body) for i, body in trees.items())
+
+	failed = run_jobs(parse_text_file, toparse, timeout, jobs=jobs, initializer=load_greynir, message=PARSE_MESSAGE, done=store) if toparse else []
+	close_timed_parser()
+	with parsecache.ParseCache(cache, greynir_id()) as newparses:
+		for line, body in parsed:
+			newparses.put(line, body)
+		newparses.evict()
+	print(parses.summary())
+	return failed
+
+def annoparse_file(ptext, pout):
+	""" Parses a text file with one sentence on each line with the ANNOPARSE command,
+		which writes the trees to pout """
+	result = subprocess.run([ANNOPARSE, "-i", str(ptext), "-o", str(pout), "-s"], capture_output=True, text=True)
+	if result.returncode != 0:
+		pout.unlink(missing_ok=True)
+		raise RuntimeError("{} failed: {}".format(ANNOPARSE, result.stderr.strip()))
+
+# Greynir instance of the process, see load_greynir
+GREYNIR = None
+
+# Bump when annotald_body changes, so that trees in the parse cache are parsed again
+ANNOTALD_VERSION = 1
+
+def load_greynir():
+	""" Makes the Greynir instance of the process, with one sentence on each line of
+		a text, and parses a sentence so that the grammar and BÍN are loaded before
+		the first file """
+	global GREYNIR
+	if GREYNIR is None:
+		GREYNIR = Greynir(one_sent_per_line=True)
+		GREYNIR.parse_single("Hún fór heim.")
+	return GREYNIR
+
+def greynir_id():
+	""" Greynir and its version, as its parses are stored in the parse cache """
+	return "Greynir {}, tokenizer {}, Annotald {}".format(reynir.__version__, tokenizer.__version__, ANNOTALD_VERSION)
+
+def text_sentences(ptext):
+	""" Returns the lines of a text file with one sentence on each line, without empty lines """
+	return [line for line in text_lines(ptext) if line.strip()]
+
+def parse_text_file(ptext, pout, bodies=None, timeout=None):
+	""" Parses a text file with one sentence on each line and writes the trees to pout in
+		Annotald format. bodies has the trees of each line that are already known, from the
+		parse cache, and None for the lines to parse; all lines are parsed without it.
+		Sentences that can't be parsed are written as S0-X with a leaf for each token.
+		Greynir may split a line into more than one sentence, so the trees of each line are
+		kept together. Returns a dict of the trees of each line parsed, by its index, for
+		the parse cache, without the lines that timed out or crashed, see TimedParser. """
+	lines = text_sentences(ptext)
+	bodies = [None] * len(lines) if bodies is None else list(bodies)
+	missing = [i for i, trees in enumerate(bodies) if trees is None]
+	parsed = parse_lines([lines[i] for i in missing]) if timeout is None else timed_parser(timeout).parse_lines([lines[i] for i in missing])
+	new = {}
+	for i, trees in zip(missing, parsed):
+		if isinstance(trees, Crash):
+			log_crash(pout, i + 1, lines[i], trees.exitcode)
+			trees = failed_bodies(lines[i])
+		elif trees is None:
+			log_timeout(pout, i + 1, lines[i], timeout)
+			trees = failed_bodies(lines[i])
+		else:
+			new[i] = trees
+		bodies[i] = trees
+	write_annotald(pout, bodies)
+	return new
+
+def parse_lines(lines):
+	""" Yields a list of the Annotald trees, without their META line, of each of lines """
+	greynir = load_greynir()
+	for line in lines:
+		yield [annotald_body(sent) for sent in greynir.submit(line, parse=True)]
+
+# TimedParser of the process, see timed_parser
+TIMED_PARSER = None
+
+def timed_parser(timeout):
+	""" Returns the TimedParser of the process, with a time limit of timeout seconds """
+	global TIMED_PARSER
+	if TIMED_PARSER is None:
+		TIMED_PARSER = TimedParser()
+	TIMED_PARSER.timeout = timeout
+	return TIMED_PARSER
+
+def close_timed_parser():
+	""" Stops the TimedParser of the process, if it has one """
+	global TIMED_PARSER
+	if TIMED_PARSER is not None:
+		TIMED_PARSER.close()
+		TIMED_PARSER = None
+
+class Crash:
+	""" What TimedParser yields for a line that its child process stopped on, with the
+		exit code of the child, negative for the signal that stopped it """
+
+	def __init__(self, exitcode):
+		self.exitcode = exitcode
+
+class TimedParser:
+	""" Parses lines with Greynir in a child process, so that a line which takes longer
+		than timeout seconds can be stopped: the child is killed and the line is given
+		up. If the child stops by itself, Greynir crashed on the line, which is given up
+		as well. Either way a new child is started for the next line. The child is forked
+		from this process after it has loaded Greynir, so a new one is ready at once.
+		Greynir parses in C++, which can't be interrupted from within the process. """
+
+	def __init__(self, timeout=SENTENCE_TIMEOUT):
+		self.timeout = timeout
+		self.process = None
+		self.connection = None
+
+	def start(self):
+		load_greynir()
+		context = multiprocessing.get_context("fork")
+		self.connection, child = context.Pipe()
+		self.process = context.Process(target=serve_lines, args=(child,), daemon=True)
+		self.process.start()
+		child.close()
+
+	def parse_lines(self, lines):
+		""" Yields a list of the Annotald trees of each of lines, as parse_lines does,
+			None if it wasn't parsed in time or a Crash if the child stopped on it """
+		for line in lines:
+			if self.process is None:
+				self.start()
+			try:
+				self.connection.send(line)
+				if self.connection.poll(self.timeout):
+					yield self.connection.recv()
+					continue
+			except (EOFError, BrokenPipeError, ConnectionResetError):
+				# The child stopped, it is replaced at the next line
+				self.process.join()
+				exitcode = self.process.exitcode
+				self.close()
+				yield Crash(exitcode)
+				continue
+			self.close()
+			yield None
+
+	def close(self):
+		""" Stops the child process """
+		if self.process is None:
+			return
+		self.process.kill()
+		self.process.join()
+		self.connection.close()
+		self.process = None
+		self.connection = None
+
+def serve_lines(connection):
+	""" Parses the lines received on connection, sending back their Annotald trees, until
+		the connection is closed """
+	while True:
+		try:
+			line = connection.recv()
+		except EOFError:
+			return
+		connection.send(next(parse_lines([line])))
+
+def failed_bodies(line):
+	""" The trees of a line that wasn't parsed, an S0-X tree for each of its sentences
+		as the tokenizer splits them """
+	sentences = [[]]
+	for token in tokenizer.tokenize(line):
+		if token.kind == TOK.S_END:
+			sentences.append([])
+		elif token.txt:
+			sentences[-1].append(token)
+	return [failed_body(tokens) for tokens in sentences if tokens]
+
+def log_timeout(pout, number, line, timeout):
+	""" Reports a sentence, the number-th line of the text of pout, that wasn't parsed in
+		timeout seconds, and adds it to TIMEOUT_LOG next to pout with its length in tokens
+		and characters """
+	tokens = sum(1 for token in tokenizer.tokenize(line) if token.txt)
+	print("\tTimed out after {:g} s: sentence {} of {}, {} tokens, {} characters".format(timeout, number, pout.name, tokens, len(line)))
+	with (pout.parent / TIMEOUT_LOG).open("a", encoding="utf-8") as log:
+		log.write("{}\t{}\t{}\t{}\t{}\n".format(pout.name, number, tokens, len(line), line))
+
+def log_crash(pout, number, line, exitcode):
+	""" Reports a sentence, the number-th line of the text of pout, that Greynir crashed on,
+		and adds it to CRASH_LOG next to pout with the exit code of the process """
+	print("\tGreynir crashed with exit code {}: sentence {} of {}".format(exitcode, number, pout.name))
+	with (pout.parent / CRASH_LOG).open("a", encoding="utf-8") as log:
+		log.write("{}\t{}\t{}\t{}\n".format(pout.name, number, exitcode, line))
+
+def write_annotald(pout, bodies):
+	""" Writes the Annotald trees of each line in bodies to pout, numbered from 1.
+		The ID-LOCAL of each tree, "file,.number", and the x and grm leaves of S0-X trees
+		haven't been checked against the output of annoparse, see tests/test_parse.py """
+	with atomic_output(pout) as outfile:
+		trees = itertools.chain.from_iterable(bodies)
+		for i, body in enumerate(trees, start=1):
+			outfile.write(annotald_tree(body, "{},.{}".format(pout.name, i)) + "\n\n")
+
+def annotald_tree(body, idlocal):
+	""" Returns the tree of annotald_body with a META line, as annoparse writes it """
+	return "( (META (ID-LOCAL {}))\n{})".format(idlocal, body)
+
+def annotald_body(sent):
+	""" Returns a parsed Greynir sentence as the lines of an Annotald tree, without the
+		META line and the bracket around the tree """
+	if sent.tree is None:
+		return failed_body(sent.tokens)
+	lines = []
+	annotald_lines(sent.tree, 1, lines)
+	return "\n".join(lines)
+
+def failed_body(tokens):
+	""" Returns the Annotald tree of a sentence that wasn't parsed, as annotald_body does,
+		with a leaf for each token under S0-X """
+	lines = ["  (S0-X"]
+	for token in tokens:
+		category = "grm" if token.kind == TOK.PUNCTUATION else "x"
+		lines.append("    ({} {})".format(category, annotald_word(token.txt)))
+	lines[-1] += ")"
+	return "\n".join(lines)
+
+def annotald_lines(node, depth, lines):
+	""" Adds the lines of a SimpleTree node and its children to lines, a node on each line """
+	indent = "  " * depth
+	if node.is_terminal:
+		word = annotald_word(node.text)
+		if node.kind == "PUNCTUATION":
+			lines.append("{}(grm {})".format(indent, word))
+		else:
+			terminal = node.terminal_with_all_variants or "x"
+			lines.append("{}({} {} (lemma {}))".format(indent, terminal, word, annotald_word(node.lemma)))
+		return
+	lines.append("{}({}".format(indent, node.tag))
+	for child in node.children:
+		annotald_lines(child, depth + 1, lines)
+	lines[-1] += ")"
 
-		command = "{} -i {} -o {} -f -m".format(ICEPARSER, ptext, pout)
-		skil = subprocess.Popen([command], shell=True, stdout=subprocess.PIPE).communicate()[0]
-		print(skil)
+def annotald_word(text):
+	""" Escapes the brackets of a word, as Annotald does """
+	return text.replace("(", "\\(").replace(")", "\\)")
 
-	# Back to original
-	os.chdir(origpath)
+def get_icenlpparse(infolder, outfolder, insuffix=".txt", outsuffix=".psd", overwrite=False, keeptags=False, cache=parsecache.DATABASE):
+	""" Takes text files in a specified folder as input and returns files in another specified folder
+		containing parse trees following the IceParser schema.
+		One IceTagger process and one IceParser process, see IceNLPProcess, run side by side:
+		tagged sentences are handed from a tagging thread to the parser through a queue of at
+		most ICENLP_QUEUE sentences, so a file is parsed while the next ones are tagged. The
+		tagged files are also written to gentag if keeptags is set.
+		Each line of the files is a sentence, empty lines are left out as in get_annoparse.
+		Each sentence is looked up in the parse cache at the path cache first, and only
+		tagged and parsed if it isn't there; None turns the cache off. """
+	tagsuffix = '.tagged'
+	tagfolder = pathlib.Path().absolute() / 'gentag'
+	if keeptags:
+		tagfolder.mkdir(exist_ok=True)
+	texts = sorted(p for p in infolder.iterdir() if p.suffix == insuffix)
+	work = [(ptext, outfolder / (ptext.stem + outsuffix)) for ptext in texts]
+	work = [(ptext, pout) for ptext, pout in work if overwrite or not pout.exists()]
+
+	with contextlib.ExitStack() as stack:
+		parses = None if cache is None else stack.enter_context(parsecache.ParseCache(cache, icenlp_id()))
+		# The text, output, lines and [tagged lines, parsed lines] of each line of each file
+		files = []
+		for ptext, pout in work:
+			lines = text_sentences(ptext)
+			outputs = [None] * len(lines) if parses is None else parses.lookup(lines)
+			files.append((ptext, pout, lines, outputs))
+		# Each sentence that isn't cached is a document of the tagger
+		documents = [((f, i), [lines[i]]) for f, (_, _, lines, outputs) in enumerate(files) for i, output in enumerate(outputs) if output is None]
+		remaining = collections.Counter(f for (f, i), _ in documents)
+		lasttagged = {f: i for (f, i), _ in documents}
+
+		def finish(f):
+			ptext, pout, lines, outputs = files[f]
+			if keeptags:
+				write_lines(tagfolder / (ptext.stem + tagsuffix), itertools.chain.from_iterable(tagged for tagged, parsed in outputs))
+			write_lines(pout, itertools.chain.from_iterable(parsed for tagged, parsed in outputs))
+			print("Parsed {}".format(pout.name))
+
+		for f in range(len(files)):
+			if not remaining[f]:
+				finish(f)
+		if documents:
+			iceparse(documents, files, remaining, lasttagged, parses, finish)
+		if parses is not None:
+			parses.evict()
+			print(parses.summary())
+
+def iceparse(documents, files, remaining, lasttagged, parses, finish):
+	""" Tags and parses the sentences of documents, see get_icenlpparse, and calls finish(f)
+		for each file f when all of its sentences are parsed """
+	tagged = queue.Queue(maxsize=ICENLP_QUEUE)
+	stop = threading.Event()
+	errors = []
+
+	def tag():
+		try:
+			with IceNLPProcess(TAGFOLDER, TAGGER, ["-lf", "2", "-of", "2"]) as tagger:
+				for (f, i), lines in tagger.stream(documents):
+					if lasttagged[f] == i:
+						print("Tagged {}".format(files[f][0].name))
+					tagged.put(((f, i, lines), lines))
+					if stop.is_set():
+						break
+		except Exception as e:
+			errors.append(e)
+		finally:
+			tagged.put(None)
+
+	def handed_over():
+		for item in iter(tagged.get, None):
+			yield item
+
+	tagging = threading.Thread(target=tag, daemon=True)
+	tagging.start()
+	try:
+		with IceNLPProcess(IPFOLDER, ICEPARSER, ["-f", "-m"], ICENLP_TAGGED_MARK) as iceparser:
+			for (f, i, taglines), lines in iceparser.stream(handed_over()):
+				sentences, outputs = files[f][2:]
+				outputs[i] = [taglines, lines]
+				if parses is not None:
+					parses.put(sentences[i], outputs[i])
+				remaining[f] -= 1
+				if not remaining[f]:
+					finish(f)
+	finally:
+		# Unblock the tagging thread if parsing stopped early
+		stop.set()
+		while tagging.is_alive():
+			try:
+				tagged.get(timeout=0.1)
+			except queue.Empty:
+				pass
+		tagging.join()
+	if errors:
+		raise errors[0]
+
+def icenlp_id():
+	""" IceNLP, identified by a hash of its jar files and the commands of its tools, as its
+		parses are stored in the parse cache """
+	digest = hashlib.sha1()
+	for jar in sorted(ICENLP.parent.rglob("*.jar")):
+		digest.update(jar.read_bytes())
+	for folder, script in ((TAGFOLDER, TAGGER), (IPFOLDER, ICEPARSER)):
+		pscript = folder / script
+		if pscript.is_file():
+			digest.update(pscript.read_bytes())
+	return "IceNLP {}".format(digest.hexdigest())
+
+def text_lines(ptext):
+	""" Returns the lines of a text file """
+	return ptext.read_text(encoding="utf-8").splitlines()
+
+def write_lines(pout, lines):
+	""" Writes lines to pout, each ending in a newline """
+	with atomic_output(pout) as outfile:
+		outfile.writelines(line + "\n" for line in lines)
+
+class IceNLPProcess:
+	""" One IceNLP tool, IceTagger or IceParser, running as a single process which
+		documents are streamed through, instead of a JVM for each file.
+		The tool is started in its folder, which it needs as its working directory,
+		without changing the working directory of the pipeline. Documents are written
+		to its standard input with the line mark after each one, which passes through
+		the tool, tagged or bracketed, and marks where its output for the document ends:
+		ICENLP_MARK for IceTagger, and ICENLP_TAGGED_MARK for IceParser, which reads
+		tagged text. A line of output ends a document if ICENLP_MARK is one of its tokens;
+		ICENLP_MARK is lowercased wherever it is found in the documents, so that their own
+		text can't end them. The tools may hold back their output until the end of their input, so
+		all documents of a run go through in one call of stream(). The process is
+		stopped when the IceNLPProcess is closed, at the latest at the end of a with block. """
+
+	def __init__(self, folder, script, args, mark=ICENLP_MARK):
+		self.command = [script] + list(args)
+		self.folder = folder
+		self.mark = mark
+		self.process = None
+		self.finished = False	# Whether the output of the process has been read to the end
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def stream(self, documents):
+		""" Takes an iterable of (key, lines) and yields (key, output lines) for each
+			document, as the output of the tool comes in """
+		self.finished = False
+		self.process = subprocess.Popen(
+			self.command, cwd=self.folder, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+			encoding="utf-8", bufsize=1,
+		)
+		keys = queue.SimpleQueue()
+		writer = threading.Thread(target=self.write, args=(documents, keys), daemon=True)
+		writer.start()
+		lines = []
+		for line in self.process.stdout:
+			if ICENLP_MARK not in line.split():
+				lines.append(line.rstrip("\n"))
+				continue
+			yield keys.get(), lines
+			lines = []
+		self.finished = True
+		writer.join()
+		if self.process.wait() != 0:
+			raise RuntimeError("{} stopped with exit code {}".format(" ".join(self.command), self.process.returncode))
+		if lines and any(lines):
+			raise RuntimeError("{} wrote output after the last document".format(" ".join(self.command)))
+
+	def write(self, documents, keys):
+		""" Writes the documents to the standard input of the tool, and their keys
+			to keys in the same order """
+		try:
+			for key, lines in documents:
+				keys.put(key)
+				for line in lines:
+					# Only the mark line may hold the mark, see stream()
+					self.process.stdin.write(line.replace(ICENLP_MARK, ICENLP_MARK.lower()) + "\n")
+				self.process.stdin.write(self.mark + "\n")
+		except (BrokenPipeError, ValueError):
+			# The tool stopped or was stopped, which stream() or close() reports
+			pass
+		finally:
+			try:
+				self.process.stdin.close()
+			except (BrokenPipeError, ValueError):
+				pass
+
+	def close(self):
+		""" Stops the process. If its output hasn't been read to the end, because of an
+			error, it is killed; otherwise it is given ICENLP_TIMEOUT seconds to exit. """
+		if self.process is None:
+			return
+		try:
+			if self.process.poll() is None and not self.finished:
+				self.process.kill()
+			self.process.wait(timeout=ICENLP_TIMEOUT)
+		except subprocess.TimeoutExpired:
+			self.process.kill()
+			self.process.wait()
+		finally:
+			self.process.stdout.close()
+			self.process = None
 
 def get_ipparse(infolder, outfolder, insuffix=".txt", outsuffix=".psd", overwrite=False):
 	""" Fill this out """
 	pass
 
 # Get general parse trees for each parsing schema
-def annotald_to_general(infolder, outfolder, insuffix, outsuffix, overwrite=False, exclude=False):
-	
-	for p in infolder.iterdir():
-		if p.suffix != insuffix:
-			# File has other suffix
-			continue
-
-		pin = p.stem + insuffix
+def annotald_to_general(infolder, outfolder, insuffix, outsuffix, overwrite=False, exclude=False, jobs=1):
+	return annotald_to_general_multi(infolder, {"general": (outfolder, outsuffix)}, insuffix, overwrite, exclude, jobs)
+
+def annotald_to_general_split(infolder, outfolder, insuffix, outsuffix, overwrite=False, exclude=False, jobs=1):
+	return annotald_to_general_multi(infolder, {"split": (outfolder, outsuffix)}, insuffix, overwrite, exclude, jobs)
+
+def annotald_to_general_func(infolder, outfolder, insuffix, outsuffix, overwrite=False, exclude=False, jobs=1):
+	return annotald_to_general_multi(infolder, {"func": (outfolder, outsuffix)}, insuffix, overwrite, exclude, jobs)
+
+def annotald_to_general_multi(infolder, outputs, insuffix, overwrite=False, exclude=False, jobs=1, files=None):
+	""" Transforms Annotald files to bracketed form in one or more schemas.
+		outputs maps each schema in SCHEMAS to an (outfolder, outsuffix) pair.
+		Each input file is read and tokenized only once for all schemas.
+		Only output files whose input file or configuration has changed since they were
+		made are regenerated, see Manifest. overwrite regenerates all of them.
+		With jobs > 1 the files are divided between that many processes, jobs=0 uses all cores.
+		files is an optional list of file stems to transform instead of all files in infolder.
+		Returns a list of (filename, error) for files that could not be transformed. """
+
+	manifests = output_manifests(outputs)
+	configs = {schema: config_fingerprint(schema, exclude) for schema in outputs}
+
+	if files is None:
+		files = annotald_files(infolder, insuffix)
+
+	work = []
+	records = []
+	for stem in files:
+		pin = stem + insuffix
 		pin = infolder / pin
-		pout = p.stem + outsuffix
+		pouts, precords = outdated_outputs(pin, outputs, manifests, configs, overwrite)
+		records.extend(precords)
+		if pouts:
+			work.append((pin, pouts))
+
+	if not work:
+		print("All files up to date")
+	failed = run_jobs(transform_annotald_file, work, exclude, jobs=jobs)
+
+	failednames = set(name for name, e in failed)
+	for pin, outfolder, pout, entry in records:
+		if pin.name not in failednames:
+			manifests[outfolder].record(pout, entry)
+	for manifest in manifests.values():
+		manifest.save()
+	return failed
+
+def annotald_files(infolder, insuffix):
+	""" Returns the sorted stems of the files with insuffix in infolder """
+	return sorted(p.stem for p in infolder.iterdir() if p.suffix == insuffix)
+
+def output_manifests(outputs):
+	""" Returns a Manifest for each output folder in outputs """
+	manifests = {}
+	for outfolder, outsuffix in outputs.values():
+		if outfolder not in manifests:
+			manifests[outfolder] = Manifest(outfolder)
+	return manifests
+
+def outdated_outputs(pin, outputs, manifests, configs, overwrite=False):
+	""" Finds which outputs of the Annotald file pin need to be regenerated.
+		Returns a dict mapping schema to output file, and a list of
+		(pin, outfolder, pout, entry) to record in the manifests once they are. """
+	pouts = {}
+	records = []
+	for schema, (outfolder, outsuffix) in outputs.items():
+		pout = pin.stem + outsuffix
 		pout = outfolder / pout
-		
-
-		if pout.exists() and not overwrite:
+		entry = manifests[outfolder].check(pout, pin, configs[schema], overwrite)
+		if entry is None:
+			# Up to date
 			continue
-
-		print("Transforming file: {}".format(p.stem+p.suffix))
-
-		# Að mestu eins og readTrees() í annotald.treedrawing
-		treetext = pin.read_text()
-		treetext = util.scrubText(treetext)
-		trees = treetext.strip().split("\n\n")
-
-		outtrees = general_clean(trees, exclude)
-		pout.write_text(outtrees)
-
-def annotald_to_general_split(infolder, outfolder, insuffix, outsuffix, overwrite=False, exclude=False):
-	
-	for p in infolder.iterdir():
-		if p.suffix != insuffix:
-			# File has other suffix
-			continue
-
-		pin = p.stem + insuffix
-		pin = infolder / pin
-		pout = p.stem + outsuffix
-		pout = outfolder / pout
-		
-
-		if pout.exists() and not overwrite:
-			continue
-
-		print("Transforming file: {}".format(p.stem+p.suffix))
-
-		# Að mestu eins og readTrees() í annotald.treedrawing
-		treetext = pin.read_text()
-		treetext = util.scrubText(treetext)
-		trees = treetext.strip().split("\n\n")
-
-		outtrees = general_clean_split(trees, exclude)
-		pout.write_text(outtrees)
-
-def annotald_to_general_func(infolder, outfolder, insuffix, outsuffix, overwrite=False, exclude=False):
-	
-	for p in infolder.iterdir():
-		if p.suffix != insuffix:
-			# File has other suffix
-			continue
-
-		pin = p.stem + insuffix
-		pin = infolder / pin
-		pout = p.stem + outsuffix
-		pout = outfolder / pout
-		
-
-		if pout.exists() and not overwrite:
-			continue
-
-		print("Transforming file: {}".format(p.stem+p.suffix))
-
-		# Að mestu eins og readTrees() í annotald.treedrawing
-		treetext = pin.read_text()
-		treetext = util.scrubText(treetext)
-		trees = treetext.strip().split("\n\n")
-
-		outtrees = general_clean_func(trees, exclude)
-		pout.write_text(outtrees)
-
-def icenlp_to_general(pin, outfolder, insuffix=".psd", outsuffix=".br", overwrite=False, exclude=False, roles=False):
+		pouts[schema] = pout
+		records.append((pin, outfolder, pout, entry))
+	return pouts, records
+
+class LazyConversion:
+	""" Transforms Annotald files to bracketed form on demand, one file at a time,
+		for evaluating only some files or starting evaluation before all files are ready.
+		get(stem) returns the output files of stem, transforming it first if it is out of date.
+		request(stem) starts that in a background thread, so the next file can be
+		transformed while the current one is being scored. Takes the same arguments
+		as annotald_to_general_multi. Call close() when done, to save the manifests. """
+
+	def __init__(self, infolder, outputs, insuffix, overwrite=False, exclude=False):
+		self.infolder = infolder
+		self.outputs = outputs
+		self.insuffix = insuffix
+		self.overwrite = overwrite
+		self.exclude = exclude
+		self.manifests = output_manifests(outputs)
+		self.configs = {schema: config_fingerprint(schema, exclude) for schema in outputs}
+		self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+		self.futures = {}
+
+	def files(self):
+		""" Returns the sorted stems of all input files """
+		return annotald_files(self.infolder, self.insuffix)
+
+	def request(self, stem):
+		""" Starts bringing the output files of stem up to date, if not already started """
+		if stem not in self.futures:
+			self.futures[stem] = self.pool.submit(self.transform, stem)
+		return self.futures[stem]
+
+	def get(self, stem):
+		""" Returns a dict mapping schema to the up to date output file of stem """
+		return self.request(stem).result()
+
+	def transform(self, stem):
+		pin = stem + self.insuffix
+		pin = self.infolder / pin
+		pouts, records = outdated_outputs(pin, self.outputs, self.manifests, self.configs, self.overwrite)
+		if pouts:
+			print("Transforming file: {}".format(pin.name))
+			transform_annotald_file(pin, pouts, self.exclude)
+			for pin, outfolder, pout, entry in records:
+				self.manifests[outfolder].record(pout, entry)
+		return {
+			schema: outfolder / (stem + outsuffix)
+			for schema, (outfolder, outsuffix) in self.outputs.items()
+		}
+
+	def close(self):
+		self.pool.shutdown()
+		for manifest in self.manifests.values():
+			manifest.save()
+
+def transform_annotald_file(pin, pouts, exclude=False):
+	""" Transforms a single Annotald file, writing one output file per schema in pouts.
+		Trees are read, transformed and written one at a time, the file is never held in memory. """
+	trees = treefiles.iter_annotald(pin)
+	schemas = tuple(pouts)
+	with contextlib.ExitStack() as stack:
+		outfiles = [stack.enter_context(atomic_output(pouts[schema])) for schema in schemas]
+		for cleantrees in iter_general_clean_multi(trees, schemas, exclude):
+			for outfile, cleantree in zip(outfiles, cleantrees):
+				outfile.write(cleantree + "\n")
+
+def num_jobs(jobs):
+	""" Returns the number of processes to use, 0 meaning one for each core """
+	if jobs == 0:
+		return os.cpu_count() or 1
+	return jobs
+
+@contextlib.contextmanager
+def atomic_output(pout):
+	""" Opens pout for buffered writing through a temporary file,
+		which replaces pout only if everything was written without errors """
+	tmp = pout.with_name(pout.name + ".tmp")
+	try:
+		with tmp.open("w", buffering=OUTPUT_BUFFER) as outfile:
+			yield outfile
+		os.replace(tmp, pout)
+	finally:
+		if tmp.exists():
+			tmp.unlink()
+
+def run_jobs(func, work, *args, jobs=1, initializer=None, message="Transforming file: {}", done=None):
+	""" Calls func(*item, *args) for each item in work, a tuple (pin, pout) or (pin, pout, ...)
+		with more arguments for that file, in a process pool if jobs != 1.
+		Files are reported with message, formatted with the name of pin, in the order of work
+		regardless of which process finishes first.
+		An error in one file is reported and doesn't stop the others.
+		initializer is called once in each process before its first file, and
+		done(*item, result) in this process with what func returned for each file that didn't fail.
+		Returns a list of (filename, error) for failed files. """
+	jobs = num_jobs(jobs)
+	failed = []
+
+	def report(item, call):
+		pin = item[0]
+		print(message.format(pin.name))
+		try:
+			result = call()
+		except Exception as e:
+			print("\tError in {}: {!r}".format(pin.name, e))
+			failed.append((pin.name, e))
+			return
+		if done is not None:
+			done(*item, result)
+
+	if jobs == 1 or len(work) < 2:
+		if initializer is not None:
+			initializer()
+		for item in work:
+			report(item, lambda: func(*item, *args))
+	else:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=initializer) as pool:
+			futures = [pool.submit(func, *item, *args) for item in work]
+			for item, future in zip(work, futures):
+				report(item, future.result)
+	if failed:
+		print("{} of {} files failed".format(len(failed), len(work)))
+	return failed
+
+def config_fingerprint(schema, exclude=False):
+	""" Returns a fingerprint of everything besides the input file that the output of
+		general_clean_multi depends on: the mapping tables, the schema and the converter version """
+	config = [
+		CONVERTER_VERSION,
+		schema,
+		exclude,
+		sorted(GENERALIZE.items()),
+		sorted(NOT_INCLUDED),
+		sorted(SKIP_SEGS),
+		sorted(SKIP_LINES),
+	]
+	return hashlib.sha1(json.dumps(config, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def file_hash(p):
+	""" Returns a hash of the contents of a file """
+	h = hashlib.sha1()
+	with p.open("rb") as f:
+		for block in iter(lambda: f.read(1 << 20), b""):
+			h.update(block)
+	return h.hexdigest()
+
+class Manifest:
+	""" Keeps track of which input file contents and configuration each output
+		file in a folder was made from, stored in the file MANIFEST in the folder.
+		Each entry holds a hash of the input file, its size and modification time
+		and the config_fingerprint used. The input file is only hashed again
+		if its size or modification time has changed. """
+
+	def __init__(self, folder):
+		self.path = folder / MANIFEST
+		self.entries = {}
+		if self.path.exists():
+			try:
+				self.entries = json.loads(self.path.read_text())
+			except ValueError:
+				print("Ignoring corrupt manifest {}".format(self.path))
+		self.changed = False
+
+	def check(self, pout, pin, config, overwrite=False):
+		""" Returns None if pout is up to date with pin and config,
+			otherwise the entry to record once pout has been regenerated """
+		st = pin.stat()
+		stat = [st.st_size, st.st_mtime_ns]
+		old = self.entries.get(pout.name)
+		if overwrite or not old or old["config"] != config or not pout.exists():
+			return {"source": file_hash(pin), "stat": stat, "config": config}
+		if old["stat"] == stat:
+			return None
+		source = file_hash(pin)
+		if old["source"] == source:
+			# Touched but not changed
+			self.record(pout, dict(old, stat=stat))
+			return None
+		return {"source": source, "stat": stat, "config": config}
+
+	def record(self, pout, entry):
+		self.entries[pout.name] = entry
+		self.changed = True
+
+	def save(self):
+		if not self.changed:
+			return
+		with atomic_output(self.path) as outfile:
+			json.dump(self.entries, outfile, indent=1, sort_keys=True)
+		self.changed = False
+
+def icenlp_to_general(pin, outfolder, insuffix=".psd", outsuffix=".br", overwrite=False, exclude=False, roles=False, jobs=1):
+	""" Transforms a file of IceParser trees, one per line, to general bracketed form.
+		With jobs > 1 the file is split into chunks of whole lines, which are transformed
+		in that many processes and written in order; jobs=0 uses all cores. """
 
 	pout = pin.stem + outsuffix
 	pout = outfolder / pout
 
 	print("Transforming IceParser: {}".format(pin.stem))
-	treetext = pin.read_text()
-	treetext = treetext.replace("\n \n", "\n") # Remove (almost) empty lines
-	trees = treetext.strip().split("\n") # One tree per line
 	if roles:
-		outtrees = general_ipcleanroles(trees)
+		trees = read_icenlp(pin)
+		pout.write_text(general_ipcleanroles(trees))
+		return
+	jobs = num_jobs(jobs)
+	chunks = icenlp_chunks(pin, jobs * 4) if jobs > 1 else [(0, None, True, True)]
+	with atomic_output(pout) as outfile:
+		if len(chunks) == 1:
+			for cleantree in iter_general_ipclean(read_icenlp(pin)):
+				outfile.write(cleantree + "\n")
+		else:
+			with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+				futures = [pool.submit(general_ipclean_chunk, pin, *chunk) for chunk in chunks]
+				for future in futures:
+					outfile.write(future.result())
+
+def read_icenlp(pin, start=0, end=None, first=True, last=True):
+	""" Returns the trees, one per line, in the bytes from start to end of an IceParser file.
+		Chunks other than the first one must start right after a line with content, see
+		icenlp_chunks, so that reading all chunks gives the same trees as the whole file. """
+	with pin.open("rb") as f:
+		f.seek(start)
+		data = f.read() if end is None else f.read(end - start)
+	treetext = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+	if not first:
+		# The newline ending the previous chunk, for the replacement below
+		treetext = "\n" + treetext
+	treetext = treetext.replace("\n \n", "\n") # Remove (almost) empty lines
+	if not first:
+		treetext = treetext[1:]
+	if first and last:
+		return treetext.strip().split("\n") # One tree per line
+	if first:
+		treetext = treetext.lstrip()
+	if last:
+		treetext = treetext.rstrip()
+		if not treetext:
+			return []
 	else:
-		outtrees = general_ipclean(trees)
-	pout.write_text(outtrees)
+		# Chunk ends with a newline
+		treetext = treetext[:-1]
+	return treetext.split("\n")
+
+def icenlp_chunks(pin, numchunks):
+	""" Divides an IceParser file into about numchunks chunks of whole lines.
+		Returns a list of (start, end, first, last) byte ranges.
+		Every chunk but the last ends right after a line with content. """
+	size = pin.stat().st_size
+	bounds = [0]
+	with pin.open("rb") as f:
+		for i in range(1, numchunks):
+			target = max(size * i // numchunks, bounds[-1])
+			f.seek(target)
+			if target > 0:
+				f.readline() # Rest of the line the target is in
+			while True:
+				line = f.readline()
+				if not line or line.strip():
+					break
+			if not line or not line.endswith(b"\n"):
+				# No more complete lines with content
+				break
+			if f.tell() > bounds[-1]:
+				bounds.append(f.tell())
+		if len(bounds) > 1:
+			f.seek(bounds[-1])
+			if not f.read().strip():
+				# Only whitespace after the last bound, which is stripped with the last tree
+				bounds.pop()
+	bounds.append(size)
+	return [
+		(start, end, start == 0, end == size)
+		for start, end in zip(bounds, bounds[1:])
+		if end > start or size == 0
+	]
+
+def general_ipclean_chunk(pin, start, end, first, last):
+	""" Transforms a chunk of an IceParser file, see icenlp_chunks """
+	return general_ipclean(read_icenlp(pin, start, end, first, last))
 
 def general_clean(trees, exclude=False):
-	# Forvinnsla 
-	outtrees = "" # All partial trees for file
-	text = []
-	phrases = Stack()
-	numwrongs = 0
-	for tree in trees:
-		skips = 0
-		cleantree = ""
-		text = []
-		for line in tree.split("\n"):
-			if not line:
-				continue
-			segs = False # Segs found, should skip content of brackets
-			# 1. (META, (COMMENT, ... in SKIP_LINES -- skip line altogether
-			# 2. Single ( -- extra bracket around tree, won't collect
-			# 3. (PP -- collect "(PP" and push one; except if not included
-			# 4. (no_kvk_nf_et -- collect "(no_kvk_nf_et" and push one
-			# 5. (lemma, (exp_seg, (exp_abbrev -- in SKIP_SEGS, increase numofskipsegs by one. 
-			#    Ignore rest of sentence except for )) or more.
-			# 6. ) or )))))) -- look at numofskipsegs, otherwise just add
-			# 7. word -- single word. Collect in text, until find (lemma
-			# 7B. word))) --- If numofskipphrases, check that.
-			# 8. (grm -- no lemma here, can mess things up.
-			# 9. \) -- escaped parentheses. Opening parentheses, \(, are not a problem. Is the word.
-			for item in line.lstrip().split():
-				if item.startswith("\\)"):
-					item = item.replace("\\)", "&#41;")
-				elif item.startswith("\\()") or item.startswith("\\("): 
-					# Latter case for unknown tokens
-					item = item.replace("\\(", "&#40;")
-				if not item:
-					continue
-				elif item in SKIP_LINES: # Case 1
-					break	# Don't collect anything in line
-				elif item.startswith("http"): # Case 1
-					break # Don't collect anything in line
-				elif "(" in item:  # Start new phrase
-					if text: # Write before do anything else
-						cleantree = cleantree + "_".join(text)
-						text = []
-					phrase = item.replace("(", "").split("_")[0]  
-					if not phrase: # Single (, don't want in cleantree
-						skips +=1
-						phrases.push("")
-						continue					
-					if phrase in SKIP_SEGS:
-						skips +=1
-						segs = True
-						phrases.push(phrase)
-						continue
-					if exclude and phrase == "S0-X":
-						pass
-					else:
-						phrase = GENERALIZE[phrase]
-					if not phrase or phrase in NOT_INCLUDED:
-						skips +=1
-						phrases.push(phrase)
-						continue
-					#if not deep and phrase in NOT_PARTIAL:
-					#	skips +=1
-					#	phrases.push(phrase)
-					#	continue
-					phrases.push(phrase)
-					cleantree = cleantree + "(" + phrase + " "
-				elif ")" in item:
-					if segs:
-						segs = False
-						text = []
-					else:
-						wordinleaf = item.replace(")", "")
-						text.append(wordinleaf)
-					brackets = item.count(")")
-					bwrite = ""
-					for x in range(brackets):
-						phrase = phrases.pop()
-						if not phrase or phrase in NOT_INCLUDED or phrase in SKIP_SEGS: 
-							# Skip corresponding )
-							skips -=1
-						#elif not deep and phrase in NOT_PARTIAL:
-						#	skips -=1
-						else:
-							bwrite = bwrite + ")"
-					cleantree = cleantree + "_".join(text) + bwrite + " "
-					text = []
-				else:
-					text.append(item)
-
-		cleantree = cleantree.rstrip().replace(" )", ")")
-
-		if cleantree.count("(")  != cleantree.count(")"):
-			numwrongs +=1
-		outtrees = outtrees + cleantree + "\n" 
-	return outtrees
+	return general_clean_multi(trees, ("general",), exclude)["general"]
 
 def general_clean_split(trees, exclude=False):
-	# Forvinnsla 
-	outtrees = "" # All partial trees for file
-	text = []
-	phrases = Stack()
-	numwrongs = 0
-	for tree in trees:
-		skips = 0
-		cleantree = ""
-		text = []
-		for line in tree.split("\n"):
-			if not line:
-				continue
-			segs = False # Segs found, should skip content of brackets
-			# 1. (META, (COMMENT, ... in SKIP_LINES -- skip line altogether
-			# 2. Single ( -- extra bracket around tree, won't collect
-			# 3. (PP -- collect "(PP" and push one; except if not included
-			# 4. (no_kvk_nf_et -- collect "(no_kvk_nf_et" and push one
-			# 5. (lemma, (exp_seg, (exp_abbrev -- in SKIP_SEGS, increase numofskipsegs by one. 
-			#    Ignore rest of sentence except for )) or more.
-			# 6. ) or )))))) -- look at numofskipsegs, otherwise just add
-			# 7. word -- single word. Collect in text, until find (lemma
-			# 7B. word))) --- If numofskipphrases, check that.
-			# 8. (grm -- no lemma here, can mess things up.
-			# 9. \) -- escaped parentheses. Opening parentheses, \(, are not a problem. Is the word.
-			phrase = ""
-			for item in line.lstrip().split():
-				if item.startswith("\\)"):
-					item = item.replace("\\)", "&#41;")
-				elif item.startswith("\\()") or item.startswith("\\("): 
-					# Latter case for unknown tokens
-					item = item.replace("\\(", "&#40;")
-				if not item:
-					continue
-				elif item in SKIP_LINES: # Case 1
-					break	# Don't collect anything in line
-				elif item.startswith("http"): # Case 1
-					break # Don't collect anything in line
-				elif "(" in item:  # Start new phrase
-					if text: # Write before do anything else
-						# (a hér_að_neðan) → (a hér) (a að) (a neðan)
-						                    #xxx                    x
-						if len(text) > 1:
-							sum = ""
-							last = text[-1]
-							nextall = text[:-1]
-							for stuff in nextall:
-								sum = sum + stuff + ") (" + phrase + " "
-							sum = sum + last
-							cleantree = cleantree + sum
-						else:
-							cleantree = cleantree + " ".join(text)
-						text = []
-					phrase = item.replace("(", "").split("_")[0]  
-					if not phrase: # Single (, don't want in cleantree
-						skips +=1
-						phrases.push("")
-						continue					
-					if phrase in SKIP_SEGS:
-						skips +=1
-						segs = True
-						phrases.push(phrase)
-						continue
-					if exclude and phrase == "S0-X":
-						pass
-					else:
-						phrase = GENERALIZE[phrase]
-					if not phrase or phrase in NOT_INCLUDED:
-						skips +=1
-						phrases.push(phrase)
-						continue
-					#if not deep and phrase in NOT_PARTIAL:
-					#	skips +=1
-					#	phrases.push(phrase)
-					#	continue
-					phrases.push(phrase)
-					cleantree = cleantree + "(" + phrase + " "
-				elif ")" in item:
-					if segs:
-						segs = False
-						text = []
-					else:
-						wordinleaf = item.replace(")", "")
-						text.append(wordinleaf)
-					brackets = item.count(")")
-					bwrite = ""
-					for x in range(brackets):
-						phrase = phrases.pop()
-						if not phrase or phrase in NOT_INCLUDED or phrase in SKIP_SEGS: 
-							# Skip corresponding )
-							skips -=1
-						#elif not deep and phrase in NOT_PARTIAL:
-						#	skips -=1
-						else:
-							bwrite = bwrite + ")"
-					cleantree = cleantree + "_".join(text) + bwrite + " "
-					text = []
-				else:
-					text.append(item)
-
-		cleantree = cleantree.rstrip().replace(" )", ")")
-
-		if cleantree.count("(")  != cleantree.count(")"):
-			numwrongs +=1
-		outtrees = outtrees + cleantree + "\n" 
-	return outtrees
+	return general_clean_multi(trees, ("split",), exclude)["split"]
 
 def general_clean_func(trees, exclude=False):
-	# Forvinnsla 
-	outtrees = "" # All partial trees for file
-	text = []
-	phrases = Stack()
-	numwrongs = 0
+	return general_clean_multi(trees, ("func",), exclude)["func"]
+
+def general_clean_multi(trees, schemas=SCHEMAS, exclude=False):
+	""" Maps Annotald trees to bracketed trees in each of the given schemas.
+		Returns a dict mapping schema to the bracketed text, one tree per line. """
+	schemas = tuple(schemas)
+	outtrees = [[] for schema in schemas]
+	for cleantrees in iter_general_clean_multi(trees, schemas, exclude):
+		for out, cleantree in zip(outtrees, cleantrees):
+			out.append(cleantree + "\n")
+	return {schema: "".join(out) for schema, out in zip(schemas, outtrees)}
+
+def iter_general_clean_multi(trees, schemas=SCHEMAS, exclude=False):
+	""" Maps Annotald trees to bracketed trees in each of the given schemas.
+		Every token is classified once and then fed to the state machine
+		of each schema. Yields a tuple with one bracketed line per schema for each tree. """
+	states = [SchemaState(schema, exclude) for schema in schemas]
+	# Bound methods, to keep attribute lookups out of the token loop
+	special = SPECIAL_TOKEN.search
+	opens = [state.open_phrase for state in states]
+	closes = [state.close_phrases for state in states]
 	for tree in trees:
-		skips = 0
-		cleantree = ""
-		text = []
+		for state in states:
+			state.start_tree()
 		for line in tree.split("\n"):
 			if not line:
 				continue
-			segs = False # Segs found, should skip content of brackets
+			for state in states:
+				state.start_line()
 			# 1. (META, (COMMENT, ... in SKIP_LINES -- skip line altogether
 			# 2. Single ( -- extra bracket around tree, won't collect
 			# 3. (PP -- collect "(PP" and push one; except if not included
@@ -624,84 +1195,147 @@ def general_clean_func(trees, exclude=False):
 			# 7B. word))) --- If numofskipphrases, check that.
 			# 8. (grm -- no lemma here, can mess things up.
 			# 9. \) -- escaped parentheses. Opening parentheses, \(, are not a problem. Is the word.
-			for item in line.lstrip().split():
-				if item.startswith("\\)"):
-					item = item.replace("\\)", "&#41;")
-				elif item.startswith("\\()") or item.startswith("\\("): 
-					# Latter case for unknown tokens
-					item = item.replace("\\(", "&#40;")
-				if not item:
+			for item in line.split():
+				if special(item) is None:
+					# Plain word
+					for state in states:
+						state.text.append(item)
 					continue
-				elif item in SKIP_LINES: # Case 1
+				kind, item, brackets = annotald_token(item)
+				if kind == OPEN:  # Start new phrase
+					for open_phrase in opens:
+						open_phrase(item)
+				elif kind == CLOSE:
+					for close_phrases in closes:
+						close_phrases(item, brackets)
+				elif kind == SKIPLINE: # Case 1
 					break	# Don't collect anything in line
-				elif item.startswith("http"): # Case 1
-					break # Don't collect anything in line
-				elif "(" in item:  # Start new phrase
-					if text: # Write before do anything else
-						cleantree = cleantree + "_".join(text)
-						text = []
-					phrase = item.replace("(", "").split("_")[0].split("-")[-1]  
-					if not phrase: # Single (, don't want in cleantree
-						skips +=1
-						phrases.push("")
-						continue					
-					if phrase in SKIP_SEGS:
-						skips +=1
-						segs = True
-						phrases.push(phrase)
-						continue
-					if exclude and "S0-X" in item:
-						pass
-					if not phrase or phrase in NOT_INCLUDED:
-						skips +=1
-						phrases.push(phrase)
-						continue
-					#if not deep and phrase in NOT_PARTIAL:
-					#	skips +=1
-					#	phrases.push(phrase)
-					#	continue
-					phrases.push(phrase)
-					cleantree = cleantree + "(" + phrase + " "
-				elif ")" in item:
-					if segs:
-						segs = False
-						text = []
-					else:
-						wordinleaf = item.replace(")", "")
-						text.append(wordinleaf)
-					brackets = item.count(")")
-					bwrite = ""
-					for x in range(brackets):
-						phrase = phrases.pop()
-						if not phrase or phrase in NOT_INCLUDED or phrase in SKIP_SEGS: 
-							# Skip corresponding )
-							skips -=1
-						#elif not deep and phrase in NOT_PARTIAL:
-						#	skips -=1
-						else:
-							bwrite = bwrite + ")"
-					cleantree = cleantree + "_".join(text) + bwrite + " "
-					text = []
 				else:
-					text.append(item)
-
-		cleantree = cleantree.rstrip().replace(" )", ")")
-
+					for state in states:
+						state.text.append(item)
+		yield tuple(state.end_tree() for state in states)
+
+@functools.lru_cache(maxsize=1 << 16)
+def annotald_token(item):
+	""" Classifies an Annotald token matched by SPECIAL_TOKEN, memoized as the same
+		phrase labels and closing tokens occur over and over again.
+		Returns (kind, item, brackets), where kind is one of WORD, OPEN, CLOSE and SKIPLINE,
+		item has escaped parentheses replaced and closing brackets removed,
+		and brackets is the number of closing brackets. """
+	if item.startswith("\\)"):
+		item = item.replace("\\)", "&#41;")
+	elif item.startswith("\\()") or item.startswith("\\("): 
+		# Latter case for unknown tokens
+		item = item.replace("\\(", "&#40;")
+	if item in SKIP_LINES or item.startswith("http"):
+		return SKIPLINE, item, 0
+	elif "(" in item:
+		return OPEN, sys.intern(item), 0
+	elif ")" in item:
+		return CLOSE, item.replace(")", ""), item.count(")")
+	return WORD, item, 0
+
+class SchemaState:
+	""" Bracketing state for one schema in general_clean_multi.
+		general: phrases and terminals mapped through GENERALIZE
+		split: as general, but multiword leaves are split into one leaf per word
+		func: the function tag (last part) of each Greynir phrase, e.g. SUBJ for NP-SUBJ """
+
+	def __init__(self, schema, exclude=False):
+		if schema not in SCHEMAS:
+			raise ValueError("Unknown schema: {}".format(schema))
+		self.schema = schema
+		self.exclude = exclude
+		self.phrases = []	# Stack of open phrases, shared between trees as before
+		self.labels = {}	# Opening token → (phrase, segs, opening bracket)
+		self.unwritten = set([""]) | NOT_INCLUDED | SKIP_SEGS	# Phrases without brackets
+		self.numwrongs = 0
+		self.start_tree()
+		self.start_line()
+
+	def start_tree(self):
+		self.cleantree = [] # Parts of the bracketed tree
+		self.text = []	# Words in current leaf
+
+	def start_line(self):
+		self.segs = False # Segs found, should skip content of brackets
+		self.phrase = ""  # Latest phrase, used as the label of split leaves
+
+	def label(self, item):
+		""" Maps an opening token, e.g. (no_kvk_nf_et, to (phrase, segs, opening bracket),
+			where opening bracket is None for phrases left out of the bracketed tree """
+		phrase = item.replace("(", "").split("_")[0]
+		if self.schema == "func":
+			phrase = phrase.split("-")[-1]
+		if not phrase: # Single (, don't want in cleantree
+			return "", False, None
+		if phrase in SKIP_SEGS:
+			return phrase, True, None
+		if self.schema == "func" or (self.exclude and phrase == "S0-X"):
+			pass
+		else:
+			phrase = GENERALIZE[phrase]
+		phrase = sys.intern(phrase)
+		if not phrase or phrase in NOT_INCLUDED:
+			return phrase, False, None
+		return phrase, False, "(" + phrase + " "
+
+	def write_text(self):
+		""" Writes collected words of a leaf before a new phrase starts """
+		if self.schema == "split" and len(self.text) > 1:
+			# (a hér_að_neðan) → (a hér) (a að) (a neðan)
+			sep = ") ({} ".format(self.phrase)
+			self.cleantree.append(sep.join(self.text))
+		else:
+			self.cleantree.append("_".join(self.text))
+		self.text = []
+
+	def open_phrase(self, item):
+		if self.text: # Write before do anything else
+			self.write_text()
+		label = self.labels.get(item)
+		if label is None:
+			label = self.labels[item] = self.label(item)
+		phrase, segs, opening = label
+		self.phrase = phrase
+		self.phrases.append(phrase)
+		if segs:
+			self.segs = True
+		elif opening:
+			self.cleantree.append(opening)
+
+	def close_phrases(self, wordinleaf, brackets):
+		if self.segs:
+			self.segs = False
+			self.text = []
+		else:
+			self.text.append(wordinleaf)
+		bwrite = 0
+		for x in range(brackets):
+			phrase = self.phrases.pop()
+			if phrase not in self.unwritten:
+				bwrite += 1
+		self.phrase = phrase
+		self.cleantree.append("_".join(self.text) + ")" * bwrite + " ")
+		self.text = []
+
+	def end_tree(self):
+		""" Returns the bracketed tree as a single line """
+		cleantree = "".join(self.cleantree).rstrip().replace(" )", ")")
 		if cleantree.count("(")  != cleantree.count(")"):
-			numwrongs +=1
-		outtrees = outtrees + cleantree + "\n" 
-	return outtrees
+			self.numwrongs +=1
+		return cleantree
 
 def general_ipclean(trees):
-	# IceNLP bracketing mapped to general schema bracketing 
+	return "".join(cleantree + "\n" for cleantree in iter_general_ipclean(trees))
+
+def iter_general_ipclean(trees):
+	""" Maps IceNLP bracketing to general schema bracketing, yielding one line per tree """
 
-	outtrees = "" # All partial trees for file
-	text = []
-	phrases = Stack()
 	numwrongs = 0
 	for tree in trees:
 		skips = 0
-		cleantree = ""
+		cleantree = [] # Parts of the bracketed tree
 		text = [] # Text in each leaf
 		next_is_tag = False
 		for item in tree.lstrip().split():
@@ -716,250 +1350,495 @@ def general_ipclean(trees):
 				item = item.replace("\(", "&#40;")
 			elif "[" in item:  # Byrja nýjan lið
 				if text: # Write before do anything else
-					cleantree = cleantree + "_".join(text)
+					cleantree.append("_".join(text))
 					text = []
 				phrase = item.replace("[", "").replace("<", "").replace(">", "") 
 				if not phrase:  # Empty "[ "! Should be escaped in parsing/tagging
 					skips+=1
 					continue
 				phrase = GENERALIZE[phrase]
-				cleantree = cleantree + "(" + phrase + " "
+				cleantree.append("(" + phrase + " ")
 			elif "]" in item:
 				wordinleaf = item.replace("]", "")
 				if text:
 					text.append(wordinleaf)
 				if skips < 0:
 					skips-=1
-					cleantree = cleantree + "_".join(text)
+					cleantree.append("_".join(text))
 				else:
-					cleantree = cleantree + "_".join(text) + ") "
+					cleantree.append("_".join(text) + ") ")
 				text = []
 			elif next_is_tag:  # Mark fyrir fyrra orð fundið
 				if item in PUNCT:
 					item = "p"
-				cleantree = cleantree + "(" + item[0] + " " + "_".join(text) + ") "
+				cleantree.append("(" + item[0] + " " + "_".join(text) + ") ")
 				next_is_tag = False
 				text = []
 			else:  # Stakt orð fundið
 				text.append(item)
 				next_is_tag = True
 
-		cleantree = cleantree.rstrip().replace(") )", "))")
+		cleantree = "".join(cleantree).rstrip().replace(") )", "))")
 
 		if cleantree.count("(")  != cleantree.count(")"):
 			numwrongs +=1
-		outtrees = outtrees + cleantree + "\n" 
-	return outtrees
+		yield cleantree
 
 def general_ipcleanroles(trees):
 	return ""
 
-def get_results(goldfolder, testfolder, reportfolder, tests, exclude=False):
+def get_results(goldfolder, testfolder, reportfolder, tests, exclude=False, files=None, converters=(), builtin=False, batch=False, jobs=1):
+	""" Runs evalb on each gold file in goldfolder and its test file in testfolder.
+		tests is a list of (testsuffix, goldsuffix, outsuffix).
+		files is an optional list of file stems to compare instead of all files in goldfolder.
+		converters are LazyConversion objects making the files on demand; the next
+		file is transformed in the background while the current one is compared.
+		With builtin, or if evalb isn't found, the files are compared in-process
+		by the evalb-compatible scorer in scorer.py, which writes the same reports.
+		The results of each report are also saved as arrays in the database of
+		reportfolder, see results.py.
+		With batch, evalb is run once on all the files, see evalb_batch.
+		Up to jobs files are compared at the same time, 0 meaning one for each core. """
 	evalbpath = pathlib.Path().absolute() / 'EVALB' / 'evalb'
-	if not evalbpath.exists:
-		print("Evalb cannot be found. Exiting.")
-		return
-
-	for pgold in goldfolder.iterdir():
-		# (testsuffix, goldsuffix, outsuffix)
-		for tri in tests:	
-			if pgold.suffix == tri[1]:
-				ptest = pgold.stem + tri[0]
-				ptest = testfolder / ptest
-				pout = pgold.stem + tri[2]
-				pout = reportfolder / pout
-
-				if exclude:
-					delete_lines(pgold, ptest, goldfolder, testfolder)
-
-
-				evalbcmd = str(evalbpath) + EVALBCOMMAND + " {} {} > {}".format(pgold, ptest, pout)
-				print("Comparing {}\n\t and {}".format(pgold, ptest))
-				skil = subprocess.Popen([evalbcmd], shell=True, stdout=subprocess.PIPE).communicate()[0]
-				print(skil)
-
-def combine_reports(reportfolder):
+	if not builtin and not evalbpath.exists():
+		print("Evalb cannot be found, using the built-in scorer")
+		builtin = True
+	jobs = num_jobs(jobs)
+	params = scorer.Parameters.from_file(EVALBPARAMS)
+	if builtin:
+		compare = functools.partial(score_file, params=params)
+		# The scorer needs a core of its own, evalb only a thread waiting for it
+		executor = concurrent.futures.ProcessPoolExecutor if jobs > 1 else None
+	else:
+		compare = functools.partial(run_evalb, evalbpath, params=params)
+		executor = concurrent.futures.ThreadPoolExecutor if jobs > 1 else None
+
+	if files is None:
+		goldsuffixes = set(tri[1] for tri in tests)
+		files = sorted(set(p.stem for p in goldfolder.iterdir() if p.suffix in goldsuffixes))
+
+	# Gold files made by the converters may not exist yet, so this is an estimate
+	progress = Progress(len(files) * len(tests))
+	database = results.ResultsDatabase(reportfolder)
+
+	def compare_now(pgold, ptest, pout):
+		future = concurrent.futures.Future()
+		try:
+			future.set_result(compare(pgold, ptest, pout))
+		except Exception as e:
+			future.set_exception(e)
+		compared(pgold, ptest, pout, progress, database, future)
+
+	pool = executor(max_workers=jobs) if executor else None
+	pairs = []	# (pgold, ptest, pout) left for evalb_batch
+	try:
+		for i, stem in enumerate(files):
+			try:
+				for converter in converters:
+					converter.request(stem)
+					if i + 1 < len(files):
+						converter.request(files[i + 1])
+				for converter in converters:
+					converter.get(stem)
+			except Exception as e:
+				print("\tError in {}: {!r}".format(stem, e))
+				continue
+			# (testsuffix, goldsuffix, outsuffix)
+			for tri in tests:	
+				pgold = goldfolder / (stem + tri[1])
+				if pgold.exists():
+					ptest = pgold.stem + tri[0]
+					ptest = testfolder / ptest
+					pout = pgold.stem + tri[2]
+					pout = reportfolder / pout
+
+					if exclude:
+						pgold, ptest = delete_lines(pgold, ptest, goldfolder / EXCLUDED, testfolder / EXCLUDED)
+
+					if batch and not builtin:
+						pairs.append((pgold, ptest, pout))
+					elif pool:
+						future = pool.submit(compare, pgold, ptest, pout)
+						future.add_done_callback(functools.partial(compared, pgold, ptest, pout, progress, database))
+					else:
+						compare_now(pgold, ptest, pout)
+
+		for pgold, ptest, pout in evalb_batch(evalbpath, pairs, progress, database, jobs):
+			# Compared one by one, as the batch can't give the same report
+			compare_now(pgold, ptest, pout)
+	finally:
+		if pool:
+			pool.shutdown()
+		database.close()
+	progress.finish()
+
+def run_evalb(evalbpath, pgold, ptest, pout, params):
+	""" Runs evalb on pgold and ptest, writing the report to pout. Returns the error
+		messages evalb wrote, one per line, and the Results read from the report
+		with params, the settings evalb was run with. """
+	result = subprocess.run([str(evalbpath), "-p", str(EVALBPARAMS), str(pgold), str(ptest)], capture_output=True)
+	pout.write_bytes(result.stdout)
+	errors = result.stderr.decode("utf-8", "replace").splitlines()
+	return errors, results.read_report(pout.name, result.stdout, params)
+
+def score_file(pgold, ptest, pout, params):
+	""" Scores pgold and ptest with the built-in scorer, like run_evalb """
+	report = scorer.score_files(pgold, ptest, params)
+	pout.write_bytes(report.output)
+	errors = ["{} : {}".format(line, message) for line, message in report.errors]
+	return errors, results.report_results(pout.name, report)
+
+def compared(pgold, ptest, pout, progress, database, future):
+	""" Saves the results of a comparison that is done, given as a future of run_evalb,
+		to database and reports its errors """
+	try:
+		errors, result = future.result()
+		database.save(pout, result)
+	except Exception as e:
+		errors = ["Error: {!r}".format(e)]
+	if errors:
+		progress.print("Comparing {}\n\t and {}\n{}".format(pgold, ptest, "\n".join(errors)))
+	progress.update()
+
+class Progress:
+	""" Prints how many of total items are done, with the throughput and the time left,
+		at most once every interval seconds. Can be updated from several threads. """
+
+	def __init__(self, total, what="files", interval=1.0):
+		self.total = total
+		self.what = what
+		self.interval = interval
+		self.done = 0
+		self.start = self.last = timeit.default_timer()
+		self.lock = threading.Lock()
+
+	def print(self, text):
+		with self.lock:
+			print(text)
+
+	def update(self, n=1):
+		with self.lock:
+			self.done += n
+			now = timeit.default_timer()
+			if now - self.last >= self.interval:
+				self.last = now
+				print(self.status(now))
+
+	def finish(self):
+		with self.lock:
+			print(self.status(timeit.default_timer(), True))
+
+	def status(self, now, finished=False):
+		elapsed = max(now - self.start, 1e-9)
+		rate = self.done / elapsed
+		text = "Compared {} of {} {}, {:.1f} {}/s".format(self.done, self.total, self.what, rate, self.what)
+		if finished:
+			return text + ", {:.1f} s in all".format(elapsed)
+		left = (self.total - self.done) / rate if rate > 0 else float("inf")
+		return text + ", about {:.0f} s left".format(left)
+
+def evalb_batch(evalbpath, pairs, progress, database, jobs=1):
+	""" Compares the (pgold, ptest, pout) pairs with a single run of evalb on all the
+		gold files put one after another and all the test files likewise, or one run
+		for each of jobs parts of the files, run at the same time. An index of the
+		first line of each file is used to split the output into a report for each
+		pout and to number the errors by file, the same as running evalb on each pair.
+		Returns the pairs that must be compared one by one instead, see batch_lines. """
+	if not pairs:
+		return []
+	params = scorer.Parameters.from_file(EVALBPARAMS)
+	single = []
+	batched = []	# (pgold, ptest, pout, gold lines, test lines)
+	for pgold, ptest, pout in pairs:
+		gold = batch_lines(pgold)
+		test = batch_lines(ptest) if ptest.exists() else None
+		if gold is None or test is None or len(gold) != len(test):
+			single.append((pgold, ptest, pout))
+		else:
+			batched.append((pgold, ptest, pout, gold, test))
+	if not batched:
+		return single
+
+	parts = min(jobs, len(batched))
+	parts = [batched[len(batched) * i // parts:len(batched) * (i + 1) // parts] for i in range(parts)]
+	with concurrent.futures.ThreadPoolExecutor(max_workers=len(parts)) as pool:
+		for part in pool.map(functools.partial(evalb_batch_part, evalbpath, params, progress, database), parts):
+			single.extend(part)
+	return single
+
+def evalb_batch_part(evalbpath, params, progress, database, batched):
+	""" Runs evalb on the files of batched, (pgold, ptest, pout, gold lines, test lines),
+		for evalb_batch, until evalb has compared all of them or they are left for
+		comparing one by one. Returns the latter. """
+	single = []
+	while batched:
+		progress.print("Comparing {} files in one run of evalb".format(len(batched)))
+		starts = list(itertools.accumulate((len(b[3]) for b in batched[:-1]), initial=0))
+		with tempfile.TemporaryDirectory() as tmp:
+			pgold, ptest, pprm = (pathlib.Path(tmp) / name for name in ("gold", "test", "prm"))
+			pgold.write_bytes(b"".join(line for b in batched for line in b[3]))
+			ptest.write_bytes(b"".join(line for b in batched for line in b[4]))
+			# Errors are counted over all the files, so evalb stops only when one of the
+			# files has more than MAX_ERROR errors; the last setting is the one used
+			maxerror = len(batched) * (params.max_error + 1)
+			pprm.write_bytes(EVALBPARAMS.read_bytes() + "\nMAX_ERROR {}\n".format(maxerror).encode())
+			result = subprocess.run([str(evalbpath), "-p", str(pprm), str(pgold), str(ptest)], capture_output=True)
+
+		# Errors are written as "line : message"
+		errors = [[] for b in batched]
+		for line in result.stderr.decode("utf-8", "replace").splitlines():
+			number, _, message = line.partition(" : ")
+			if number.strip().isdigit():
+				i = bisect.bisect_right(starts, int(number) - 1) - 1
+				errors[i].append("{} : {}".format(int(number) - starts[i], message))
+
+		reports = scorer.split_output(result.stdout, [len(b[3]) for b in batched], params)
+		again = []
+		for b, report, fileerrors in zip(batched, reports, errors):
+			pgold, ptest, pout = b[:3]
+			if len(fileerrors) > params.max_error + 1:
+				# evalb would have stopped in this file
+				single.append((pgold, ptest, pout))
+			elif report is None:
+				# After the file evalb stopped in, compared in the next run
+				again.append(b)
+			else:
+				if fileerrors:
+					progress.print("Comparing {}\n\t and {}\n{}".format(pgold, ptest, "\n".join(fileerrors)))
+				pout.write_bytes(report.output)
+				database.save(pout, results.read_report(pout.name, report.output, params))
+				progress.update()
+		batched = again
+	return single
+
+def batch_lines(p):
+	""" Returns the lines of a bracketed file as evalb reads them, ending with a newline
+		so that files can be put one after another, or None if evalb might read the file
+		differently on its own. evalb reads a line with unbalanced brackets with leftovers
+		of the line before, and brackets closed below the top level are remembered from
+		one line to the next. A line of LINE_LEN bytes at the end of a file would get
+		the newline on its own line. Files with words outside brackets are left out
+		too, as evalb stops at them after MAX_ERROR errors, which ends the batch. """
+	data = p.read_bytes()
+	brackets = data.translate(None, NOT_BRACKETS)
+	while b"()" in brackets:
+		brackets = brackets.replace(b"()", b"")
+	if brackets.strip(b"\n") or not WELL_FORMED.fullmatch(data):
+		return None
+	lines = list(scorer.read_lines(data))
+	if any(not line.endswith(b"\n") for line in lines[:-1]):
+		# Lines longer than LINE_LEN, read in parts
+		return None
+	if lines and not lines[-1].endswith(b"\n"):
+		if len(lines[-1]) == scorer.LINE_LEN:
+			return None
+		lines[-1] += b"\n"
+	return lines
+
+def combine_reports(reportfolder, suffixes=None, genres=None, nocat=False, resamples=0, baseline=None):
+	""" Combines the reports in reportfolder into allresults.out, with the results over
+		all files, for each genre unless nocat, for each sentence with the phrases found
+		only in the gold or test tree, and the confusion sets of the tags and phrase
+		labels with the precision, recall and F-measure of each label. The results are
+		read from the arrays saved with the reports (results.py), or from a report
+		itself if they haven't been saved since it was written.
+		suffixes are the suffixes of the reports to combine, all by default.
+		genres are the beginnings of the file names of each genre, by default
+		the file names without their number.
+		With resamples, the recall, precision and F-measure are given with bootstrap
+		confidence intervals (significance.py). baseline is a folder with reports of
+		the same files from another run, which the F-measure is compared to with
+		paired significance tests. """
 	# Bæta við skoðun á setningarhlutverki -- NP-OBJ, ... En þarf sérniðurstöður fyrir það, sérútgáfu af to_brackets...
-	numsents = []
-	numerrorsents = []
-	br = []  # Bracketing recall
-	bp = []  # Bracketing precision
-	bf = []  # Bracketing F-measure
-	cm = []  # Complete match
-	ta = []  # Tagging accuracy
-	ac = []  # Average crossing
-	filenames = []
 	filepath = pathlib.Path().absolute() / reportfolder / 'allresults.out'
-	singleblob = []
-	CM = defaultdict(int)
-	CMsingle = defaultdict(int)
-	onlygold = list()
-	onlyauto = list()
-	singleblob.append("Results for each sentence\n")
-	# Sækja nauðsynlegar grunnupplýsingar
-	for preport in reportfolder.iterdir():
-		if preport.stem.startswith("allresults"):
-			continue
-		with preport.open(mode='r') as pin:
-			#print(preport)
-			filenames.append(preport)
-			single = False
-			sentid = ""
-			singleblob.append("{}\n".format(preport))
-			singleblob.append("\tid\tRecall\tPrec.\tTag Acc.  Length\tF1\n")
-
-			while True:
-				line = pin.readline()
-				if line.startswith("  Sent."):
-					x = pin.readline()
-					single = True
-					continue
-				elif line.startswith("-<1>---"):
-					# Starting confusion matrix results
-					while True:
-						terminalline = pin.readline()
-						if not " " in terminalline:
-							# Getting to phrases
-							break
-
-						parts = terminalline.split()
-						pos1 = parts[4]
-						if len(parts) > 6:
-							pos2 = parts[10]
-						if terminalline.count(" : ") == 2:
-							# only one entry, must find out which
-							if line.startswith("       "):
-								poscm = "_\t{}".format(pos1)
-								CM[poscm]+=1
-								CMsingle[poscm]+=1
-							else:
-								poscm = "{}\t_".format(pos1)
-								CM[poscm]+=1
-								CMsingle[poscm]+=1
-						else:
-							poscm = "{}\t{}".format(pos1, pos2)
-							CM[poscm]+=1
-							CMsingle[poscm]+=1
-						continue
-					goldphrases = []
-					autophrases = []
-					while True:
-						phraseline = pin.readline()
-						if not " " in phraseline:	
-							#diffs = set(goldphrases) ^ set(autophrases)
-							onlygold = list([g for g in goldphrases+autophrases if g not in autophrases])
-							onlyauto = list([a for a in goldphrases+autophrases if a not in goldphrases])
-							break
-						parts = phraseline.split()
-						phrase1 = parts[6]+"\t"+parts[4]+"-"+parts[5]
-						#parts[4:7]
-						if len(parts) > 9:
-							phrase2 = parts[13]+"\t"+parts[11]+"-"+parts[12]
-						if phraseline.count(" : ") == 2:
-							# Only one entry, must find out which
-							if line.startswith("       "):
-								autophrases.append(phrase1)
-							else:
-								goldphrases.append(phrase1)
-						else:
-							goldphrases.append(phrase1)
-							autophrases.append(phrase2)
-						continue
-				if line.count("=") == 8 or single:
-					# Results for next sentence coming
-					sentsultsline = pin.readline()
-					single = False
-					if  "========" in sentsultsline:
-						# Starting summary
-						while True:
-							summline = pin.readline()
-							if summline.startswith("Number of sentence "):
-								numsents.append(float(summline.split(" ")[-1]))
-							elif summline.startswith("Number of Error sentence "):
-								numerrorsents.append(float(summline.split(" ")[-1]))
-							elif summline.startswith("Bracketing Recall "):
-								br.append(float(summline.split(" ")[-1]))
-							elif summline.startswith("Bracketing Precision "):
-								bp.append(float(summline.split(" ")[-1]))
-							elif summline.startswith("Bracketing FMeasure "):
-								if "nan" in summline.split(" ")[-1]:
-									bf.append(0.0)
-								else:	
-									bf.append(float(summline.split(" ")[-1]))
-							elif summline.startswith("Complete match "):
-								cm.append(float(summline.split(" ")[-1]))
-							elif summline.startswith("Average crossing "):
-								ac.append(float(summline.split(" ")[-1]))
-							elif summline.startswith("Tagging accuracy "):
-								ta.append(float(summline.split(" ")[-1]))
-								break # No information needed after this
-							continue
-					else:
-						sults = sentsultsline.split()
-						sentid = sults[0]
-						sentlength = float(sults[1])
-						sentrecall = float(sults[3])
-						sentprec = float(sults[4])
-						senttags = float(sults[10])
-						warning = ""
-						f1 = 0.0
-						if sentprec + sentrecall > 0.0:
-							f1 = 2 * sentprec * sentrecall / (sentprec + sentrecall)
-						if f1 < 80.0:
-							warning = "WARNING"
-
-						singleblob.append(f"\t{sentid}\t{sentrecall:1.2f}\t{sentprec:1.2f}\t{senttags:1.2f}\t  {sentlength:.2f}\t\t{f1:1.2f}\t{warning}\n")
-						for og, oa in list(itertools.zip_longest(onlygold, onlyauto, fillvalue="    ")):
-							singleblob.append(f"\t\t{og:15}{oa:15}\n")
-						onlygold, onlyauto = list(), list()
-						#cmblob = list( ["\t\t{}\t{}\n".format(key, CMsingle[key]) for key in CMsingle ] )
-						#CMsingle = defaultdict(int)
-						#singleblob = singleblob + cmblob
-						#for key in CMsingle:
-						#	singleblob.append("{}\t{}\n".format(key, CMsingle[key]))
-						#break
-				elif line == "":
-					# end of file
-					break
-				continue
-
-	# Birta réttar upplýsingar
-	# Geri ráð fyrir að það séu 10 setningar í hverju skjali
-	# til að forðast of lágar tölur sem hverfa
-	textblob = []
-	numfiles = 0
-	numsentsall, numerrorsentsall = 0.0, 0.0
-	brall, bpall, bfall, cmall, acall, taall = 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
-	allnums = zip(filenames, numsents, numerrorsents, br, bp, bf, cm, ac, ta)
-	for filenow, numsentsnow, numerrorsentsnow, brnow, bpnow, bfnow, cmnow, acnow, tanow in allnums:
-		numfiles+=1
-		numsentsall+=numsentsnow
-		numerrorsentsall+=numerrorsentsnow
-		brall+=brnow
-		bpall+=bpnow
-		bfall+=bfnow
-		cmall+=cmnow
-		acall+=acnow
-		taall+=tanow
-
-	textblob.append("Fjöldi setninga: {}\n".format(numsentsall))
-	textblob.append("Fjöldi villusetninga: {}\n".format(numerrorsentsall))
-	textblob.append("Recall: {:.2f}\n".format(brall/numfiles))
-	textblob.append("Precision: {:.2f}\n".format(bpall/numfiles))
-	textblob.append("Fskor: {:.2f}\n".format(bfall/numfiles))
-	textblob.append("Alveg eins: {:.2f}\n".format(cmall/numfiles))
-	textblob.append("Average crossing: {:.2f}\n".format(acall/numfiles))
-	textblob.append("Tagging accuracy: {:.2f}\n\n\t".format(taall/numfiles))
-	textblob.append("\n\n")
-
-
-
-	print("Writing overall report")
-	textblob = textblob + ["\n\n"] + singleblob
-	textblob.append("\nTagging confusion set\n")
-	for key in CM:
-		textblob.append("\t{}\t{}\n".format(key, CM[key]))
-	filepath.write_text("".join(textblob))
+	reports = sorted(
+		p for p in reportfolder.iterdir()
+		if p.is_file() and not p.stem.startswith("allresults") and not p.name.startswith(results.DATABASE)
+		and (suffixes is None or p.suffix in suffixes)
+	)
+	if not reports:
+		print("No reports in {}".format(reportfolder))
+		return
+	params = scorer.Parameters.from_file(EVALBPARAMS)
+
+	# One report at a time: the sentence lines go to a temporary file as they are
+	# made, and only the totals over all files and over each genre are kept, with
+	# the confusion matrices
+	totals = collections.defaultdict(scorer.Totals)	# genre, or None for all files -> Totals
+	counts = collections.defaultdict(list)	# genre -> bracket counts of the sentences of each file
+	paired = collections.defaultdict(list)	# genre -> (counts, baseline counts) of each file in both runs
+	tags, phrases = results.ConfusionMatrix(), results.ConfusionMatrix()
+	if baseline is None:
+		baselines = itertools.repeat(None)
+	else:
+		baselines = results.iter_reports([baseline / p.name for p in reports], params, missing=True)
+	with tempfile.TemporaryFile("w+", encoding="utf-8", dir=filepath.parent) as sentences:
+		sentences.write("Results for each sentence\n")
+		for preport, part, basepart in zip(reports, results.iter_reports(reports, params), baselines):
+			total = part.totals()
+			genre = None if nocat else report_genre(preport.stem, genres)
+			sentencecounts = part.bracket_counts() if resamples or baseline is not None else None
+			pair = None
+			if basepart is not None and np.array_equal(part["id"], basepart["id"]):
+				pair = (sentencecounts, basepart.bracket_counts())
+			elif baseline is not None:
+				print("\tThe sentences of {} aren't the same in {}".format(preport.name, baseline))
+			for group in {None, genre}:
+				totals[group] = totals[group].merge(total)
+				if resamples:
+					counts[group].append(sentencecounts)
+				if pair is not None:
+					paired[group].append(pair)
+			tags = tags.merge(part.tag_confusion())
+			phrases = phrases.merge(part.phrase_confusion())
+			sentences.write("{}\n".format(preport))
+			sentences.write("".join(sentence_results(part)))
+
+		print("Writing overall report")
+		with filepath.open("w", encoding="utf-8") as out:
+			for genre in [None] + sorted(group for group in totals if group is not None):
+				if genre is not None:
+					out.write("{}\n".format(genre))
+				out.writelines(report_summary(totals[genre], counts[genre], paired[genre], resamples))
+			out.write("\n\n")
+			sentences.seek(0)
+			shutil.copyfileobj(sentences, out)
+			out.write("\nTagging confusion set\n")
+			out.writelines(confusion_lines(tags))
+			out.write("\nPhrase label confusion set\n")
+			out.writelines(confusion_lines(phrases))
+
+def confusion_lines(confusion):
+	""" Returns the lines of the pairs of gold and test labels of a results.ConfusionMatrix
+		with their counts, followed by the precision, recall and F-measure of each label """
+	lines = ["\t{}\t{}\t{}\n".format(gold or "_", test or "_", count) for gold, test, count in confusion.pairs()]
+	lines.append("\n\tLabel\tGold\tTest\tPrec.\tRecall\tF1\n")
+	for label, gold, test, precision, recall, fmeasure in confusion.label_scores():
+		lines.append("\t{}\t{}\t{}\t{:.2f}\t{:.2f}\t{:.2f}\n".format(label, gold, test, precision, recall, fmeasure))
+	return lines
+
+def report_genre(stem, genres=None):
+	""" Returns the genre of a file, the first of genres its name begins with,
+		or by default its name without the number at the end """
+	if genres is None:
+		return re.sub(r"_?\d+$", "", stem)
+	return next((genre for genre in genres if stem.startswith(genre)), None)
+
+def report_summary(totals, counts=(), paired=(), resamples=0):
+	""" Returns the lines of the results of scorer.Totals, over all their sentences.
+		With resamples, the recall, precision and F-measure are followed by their
+		bootstrap confidence intervals, from the bracket counts of the sentences of each
+		file in counts. paired has the counts of files in this run and a baseline,
+		which the F-measure is compared to. """
+	s = totals.summary()
+	fmeasure = 0.0 if math.isnan(s["fmeasure"]) else s["fmeasure"]
+	intervals = {}
+	if resamples and counts:
+		ci = significance.bootstrap_intervals(np.concatenate(counts), resamples)
+		percent = round(100 * significance.CONFIDENCE)
+		intervals = {name: " ({}% CI {:.2f}-{:.2f})".format(percent, *ci[name]) for name in ci}
+	lines = [
+		"Fjöldi setninga: {}\n".format(s["sentences"]),
+		"Fjöldi villusetninga: {}\n".format(s["errors"]),
+		"Recall: {:.2f}{}\n".format(s["recall"], intervals.get("recall", "")),
+		"Precision: {:.2f}{}\n".format(s["precision"], intervals.get("precision", "")),
+		"Fskor: {:.2f}{}\n".format(fmeasure, intervals.get("fmeasure", "")),
+	]
+	if paired:
+		a = np.concatenate([pair[0] for pair in paired])
+		b = np.concatenate([pair[1] for pair in paired])
+		tests = resamples or significance.RESAMPLES
+		lines.append("Fskor - baseline: {:+.2f} over {} sentences, p = {:.4f} (paired bootstrap), p = {:.4f} (approximate randomization)\n".format(
+			float(significance.fmeasure_difference(a.sum(axis=0), b.sum(axis=0))), len(a),
+			significance.paired_bootstrap(a, b, tests), significance.approximate_randomization(a, b, tests),
+		))
+	return lines + [
+		"Alveg eins: {:.2f}\n".format(s["complete"]),
+		"Average crossing: {:.2f}\n".format(s["crossing"]),
+		"Tagging accuracy: {:.2f}\n\n\t".format(s["tagging"]),
+		"\n\n",
+	]
+
+def sentence_results(part):
+	""" Yields the lines of the results for each sentence of part, the Results of one
+		report, each followed by the phrases of the sentence found only in the gold
+		or only in the test tree """
+	recall, precision, fmeasure, tagging = (a.tolist() for a in part.sentence_percentages())
+	ids, lengths = part["id"].tolist(), part["length"].tolist()
+	phrases = {}
+	for side in ("gold", "test"):
+		labels = [part.labels[label] for label in part[side + "_label"].tolist()]
+		starts, ends = part[side + "_start"].tolist(), part[side + "_end"].tolist()
+		phrases[side] = ["{}\t{}-{}".format(*phrase) for phrase in zip(labels, starts, ends)]
+	goldoffsets, testoffsets = part["gold_offsets"].tolist(), part["test_offsets"].tolist()
+
+	yield "\tid\tRecall\tPrec.\tTag Acc.  Length\tF1\n"
+	for s in range(len(part)):
+		warning = "WARNING" if fmeasure[s] < 80.0 else ""
+		yield f"\t{ids[s]}\t{recall[s]:1.2f}\t{precision[s]:1.2f}\t{tagging[s]:1.2f}\t  {lengths[s]:.2f}\t\t{fmeasure[s]:1.2f}\t{warning}\n"
+		# Multiset differences, so a phrase twice in one tree and once in the other is
+		# listed once: each gold phrase uses up one of the same in the test tree
+		onlyauto = collections.Counter(phrases["test"][testoffsets[s]:testoffsets[s + 1]])
+		onlygold = []
+		for phrase in phrases["gold"][goldoffsets[s]:goldoffsets[s + 1]]:
+			if onlyauto[phrase] > 0:
+				onlyauto[phrase] -= 1
+			else:
+				onlygold.append(phrase)
+		onlyauto = onlyauto.elements()
+		for og, oa in itertools.zip_longest(onlygold, onlyauto, fillvalue="    "):
+			yield f"\t\t{og:15}{oa:15}\n"
+
+
+def compare_systems(goldfolder, goldsuffix, systems, outpath):
+	""" Scores the output of several parsers against the same gold trees in one pass
+		and writes a table of their results side by side to outpath, followed by the
+		sentences each parser does better and worse on than the first one.
+		systems is a list of (name, folder, suffix) of the bracketed files of each
+		parser. The gold treebank (treebank.py) is loaded once and scored against
+		all of them by matching.Matcher, so another parser adds little to a run. """
+	params = scorer.Parameters.from_file(EVALBPARAMS)
+	gold = treebank.load_treebank(goldfolder, goldsuffix)
+	names = [name for name, folder, suffix in systems]
+	matcher = matching.Matcher(gold, *(treebank.load_treebank(folder, suffix) for name, folder, suffix in systems))
+	scores = matcher.score_all(params)
+	summaries = [s.totals().summary() for s in scores]
+	counts = [np.stack([s.matched, s.goldbrackets, s.testbrackets], axis=1) for s in scores]
+	valid = np.logical_and.reduce([s.status == scorer.OK for s in scores])
+	fmeasures = [s.fmeasure for s in scores]
+	wins = [valid & (f > fmeasures[0]) for f in fmeasures]
+	losses = [valid & (f < fmeasures[0]) for f in fmeasures]
+
+	rows = [
+		("Fjöldi setninga", [str(s["sentences"]) for s in summaries]),
+		("Fjöldi villusetninga", [str(s["errors"]) for s in summaries]),
+	]
+	for title, key in (("Recall", "recall"), ("Precision", "precision"), ("Fskor", "fmeasure"),
+			("Alveg eins", "complete"), ("Average crossing", "crossing"), ("Tagging accuracy", "tagging")):
+		rows.append((title, ["{:.2f}".format(0.0 if math.isnan(s[key]) else s[key]) for s in summaries]))
+	rows.append(("Better than first", ["-"] + [str(int(w.sum())) for w in wins[1:]]))
+	rows.append(("Worse than first", ["-"] + [str(int(l.sum())) for l in losses[1:]]))
+	rows.append(("p, Fskor vs first", ["-"] + [
+		"{:.4f}".format(significance.approximate_randomization(c, counts[0])) for c in counts[1:]
+	]))
+
+	width = max(len(title) for title, values in rows) + 2
+	columns = [max(10, len(name) + 2) for name in names]
+	lines = ["{:{}}".format("", width) + "".join("{:>{}}".format(name, w) for name, w in zip(names, columns)) + "\n"]
+	for title, values in rows:
+		lines.append("{:{}}".format(title, width) + "".join("{:>{}}".format(v, w) for v, w in zip(values, columns)) + "\n")
+
+	# Sentences are numbered from 1 in each file, as in the reports
+	file_index = np.repeat(np.arange(len(matcher.files)), np.diff(matcher.file_offsets))
+	ids = np.arange(matcher.numsentences) - matcher.file_offsets[file_index] + 1
+	for i in range(1, len(scores)):
+		for title, sentences in (("better", wins[i]), ("worse", losses[i])):
+			lines.append("\nSentences where {} is {} than {}\n".format(names[i], title, names[0]))
+			lines.append("\tfile\tid\t{}\t{}\n".format(names[0], names[i]))
+			for s in np.flatnonzero(sentences).tolist():
+				lines.append("\t{}\t{}\t{:.2f}\t{:.2f}\n".format(matcher.files[file_index[s]], ids[s], fmeasures[0][s], fmeasures[i][s]))
+	outpath.write_text("".join(lines), encoding="utf-8")
+	print("Compared {} parsers on {} sentences of {} files, written to {}".format(len(systems), matcher.numsentences, len(matcher.files), outpath))
 
 
 # Not needed in ParsingTestPipe, only if text files are needed from bracketed files.
@@ -997,36 +1876,31 @@ def br_to_txt(infolder, outfolder, insuffix=".dbr", outsuffix=".txt", overwrite=
 		pout.write_text("\n".join(txt))
 
 def delete_lines(pgold, ptest, goldfolder, testfolder):
-	""" Deletes lines containing S0-X in brackets so they are excluded from evaluation """
-	skipped = []
-	i = 0
-	fakegold = pgold.stem + '.bak'
-	fakegold = goldfolder / fakegold
-	faketest = ptest.stem + '.bak'
-	faketest = testfolder / faketest
-	with open(pgold, 'r') as orgfile, open(fakegold, 'w') as fakefile:
-		for line in orgfile:
+	""" Writes copies of pgold and ptest to goldfolder and testfolder without the lines
+		whose gold tree contains S0-X, so they are excluded from evaluation. Returns the
+		files to compare, the copies, or pgold and ptest if no line was deleted.
+		pgold and ptest are left as they are, as the Manifest of their folder records them. """
+	skipped = set()
+	goldfolder.mkdir(parents=True, exist_ok=True)
+	testfolder.mkdir(parents=True, exist_ok=True)
+	fakegold = goldfolder / pgold.name
+	faketest = testfolder / ptest.name
+	with open(pgold, 'r') as orgfile, atomic_output(fakegold) as fakefile:
+		for i, line in enumerate(orgfile):
 			if "S0-X" in line:
-				skipped.append(i)
+				skipped.add(i)
 			else:
 				fakefile.write(line)
-			i +=1
-
-		if skipped:
-			with open(ptest, 'r') as orgfile, open(faketest, 'w') as fakefile:
-				j = 0
-				for line in orgfile:
-					if j not in skipped:
-						fakefile.write(line)
-					j +=1
-
-			os.remove(pgold)
-			os.rename(fakegold, pgold)
-			os.remove(ptest)
-			os.rename(faketest, ptest)
-		else:
-			os.remove(fakegold)
-
+	if not skipped:
+		fakegold.unlink()
+		if faketest.exists():
+			faketest.unlink()
+		return pgold, ptest
+	with open(ptest, 'r') as orgfile, atomic_output(faketest) as fakefile:
+		for j, line in enumerate(orgfile):
+			if j not in skipped:
+				fakefile.write(line)
+	return fakegold, faketest
 
 
 class Stack:
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+"""
+	Scoring of a whole corpus at once with NumPy.
+
+	scorer.py compares trees one sentence at a time, as evalb does. For
+	scoring the same gold and test trees many times over, with different
+	settings, this module works on the arrays of two treebanks (treebank.py)
+	instead. Every bracket of every sentence is packed into one int64,
+
+		sentence << 40 | start << 27 | end << 14 | label
+
+	and the brackets of the corpus are matched all at once, by sorting the
+	packed brackets of the gold and test trees and intersecting them as
+	multisets. What depends only on the trees is computed once by Matcher,
+	what depends on the settings (a scorer.Parameters) in each call of
+	Matcher.score, which takes a fraction of a second for the development set.
+	A Matcher can also pair the gold trees with the trees of several parsers,
+	which Matcher.score_all scores together, with the gold side done once.
+
+	The numbers are those of evalb and scorer.py for each sentence: spans
+	count only terminals that aren't deleted, phrase labels are cut at
+	"-" or "=", empty and deleted phrases aren't counted, crossing brackets
+	and tagging accuracy are computed the same way. The differences:
+
+	+ EQ_LABEL pairs of phrase labels are chained into classes, so that
+	  A = B and B = C make A = C, which evalb doesn't do. stillingar.prm
+	  only has pairs of preterminal labels, which are compared as in evalb.
+	+ The trees are read by treebank.py, which mends unbalanced brackets.
+	  Trees that evalb can't read, with words outside preterminals, are
+	  error sentences. "(X )" is an empty phrase, as "(X)" is, while evalb
+	  reads it as a terminal without a word.
+	+ Nothing stops after MAX_ERROR errors.
+
+	To score a folder of test trees with two settings:
+
+	gold = treebank.load_treebank(goldfolder, ".br")
+	test = treebank.load_treebank(testfolder, ".grdbr")
+	matcher = matching.Matcher(gold, test)
+	params = scorer.Parameters.from_file(pathlib.Path("stillingar.prm"))
+	for scores in matching.sweep(matcher, params, [[], [("DELETE_LABEL", b"ADVP")]]):
+		print(scores.summary()["fmeasure"])
+
+"""
+
+import copy
+
+import numpy as np
+
+import scorer
+
+# Bits of each part of a packed bracket
+LABEL_BITS = 14
+POS_BITS = 13
+SENTENCE_BITS = 63 - LABEL_BITS - 2 * POS_BITS
+
+OK, ERROR, SKIP = scorer.OK, scorer.ERROR, scorer.SKIP
+
+
+def ranges(offsets, items):
+	""" Returns the concatenated ranges offsets[i]:offsets[i + 1] for i in items,
+		and the position in items of each element """
+	items = np.asarray(items, dtype=np.int64)
+	starts = np.asarray(offsets[items], dtype=np.int64)
+	lengths = np.asarray(offsets[items + 1], dtype=np.int64) - starts
+	owner = np.repeat(np.arange(len(items)), lengths)
+	firsts = np.cumsum(lengths) - lengths
+	return np.repeat(starts - firsts, lengths) + np.arange(int(lengths.sum()), dtype=np.int64), owner
+
+
+def classes(names, pairs):
+	""" Returns a class id for each of names, equal for names joined by the pairs """
+	index = {name: i for i, name in enumerate(names)}
+	parent = list(range(len(names)))
+
+	def find(i):
+		while parent[i] != i:
+			parent[i] = parent[parent[i]]
+			i = parent[i]
+		return i
+
+	for a, b in pairs:
+		if a in index and b in index:
+			parent[find(index[a])] = find(index[b])
+	return np.array([find(i) for i in range(len(names))], dtype=np.int64)
+
+
+class Side:
+	""" The nodes and words of the gold or test trees of a Matcher, in sentence order """
+
+	def __init__(self, tb, trees, words):
+		self.tb = tb
+		# Nodes of the trees, with the sentence of each
+		self.nodes, self.node_sentence = ranges(tb.tree_offsets, trees)
+		# A node is a preterminal if no node has it as parent
+		parent = np.asarray(tb.parent[self.nodes], dtype=np.int64)
+		haschild = np.zeros(len(self.nodes), dtype=bool)
+		firstnode = np.cumsum(np.bincount(self.node_sentence, minlength=len(trees)))
+		firstnode = np.concatenate(([0], firstnode[:-1]))
+		haschild[(firstnode[self.node_sentence] + parent)[parent >= 0]] = True
+		self.label = np.asarray(tb.label[self.nodes], dtype=np.int64)
+		start = np.asarray(tb.start[self.nodes], dtype=np.int64)
+		end = np.asarray(tb.end[self.nodes], dtype=np.int64)
+		# Words of the trees, indexed from firstword of the sentence
+		tokens, token_sentence = ranges(tb.token_offsets, trees)
+		self.numwords = len(tokens)
+		self.firstword = np.concatenate(([0], np.cumsum(np.bincount(token_sentence, minlength=len(trees)))))
+		self.words = words[np.asarray(tb.tokens[tokens], dtype=np.int64)]
+
+		leaf = ~haschild
+		self.leaves = np.flatnonzero(leaf)
+		self.phrases = np.flatnonzero(haschild)
+		self.leaf_word = self.firstword[self.node_sentence[self.leaves]] + start[self.leaves]
+		# Terminals are preterminals over a single word
+		self.terminal = (end - start)[self.leaves] == 1
+		self.phrase_start = self.firstword[self.node_sentence[self.phrases]] + start[self.phrases]
+		self.phrase_end = self.firstword[self.node_sentence[self.phrases]] + end[self.phrases]
+		# evalb can only read trees where every word is in a preterminal of its own.
+		# Nodes without words, such as (S), are empty phrases to evalb, which aren't counted.
+		leafsentence = self.node_sentence[self.leaves]
+		self.irregular = np.bincount(leafsentence, weights=(end - start)[self.leaves] > 1, minlength=len(trees)) > 0
+		self.irregular |= np.bincount(leafsentence, weights=self.terminal, minlength=len(trees)) != np.diff(self.firstword)
+		self.labels = [label.encode("utf-8") for label in tb.labels]
+
+
+class Scores:
+	""" Per-sentence scores of a corpus, the numbers of the per-sentence lines of evalb,
+		as arrays with one element for each sentence. files and file_offsets tell which
+		sentences belong to each file, as in treebank.Treebank. """
+
+	def __init__(self, params, files, file_offsets, status, length, matched, goldbrackets, testbrackets, crossing, words, correcttags):
+		self.params = params
+		self.files = files
+		self.file_offsets = file_offsets
+		self.status = status
+		self.length = length
+		self.matched = matched
+		self.goldbrackets = goldbrackets
+		self.testbrackets = testbrackets
+		self.crossing = crossing
+		self.words = words
+		self.correcttags = correcttags
+
+	def __len__(self):
+		return len(self.status)
+
+	@staticmethod
+	def percent(numerator, denominator):
+		return np.divide(100.0 * numerator, denominator, out=np.zeros(len(numerator)), where=denominator > 0)
+
+	@property
+	def recall(self):
+		return self.percent(self.matched, self.goldbrackets)
+
+	@property
+	def precision(self):
+		return self.percent(self.matched, self.testbrackets)
+
+	@property
+	def fmeasure(self):
+		recall, precision = self.recall, self.precision
+		total = recall + precision
+		return np.divide(2 * recall * precision, total, out=np.zeros(len(total)), where=total > 0)
+
+	@property
+	def tagaccuracy(self):
+		return self.percent(self.correcttags, self.words)
+
+	def file_sentences(self, name):
+		""" Returns the slice of the sentences of the file with the given stem """
+		f = self.files.index(name)
+		return slice(int(self.file_offsets[f]), int(self.file_offsets[f + 1]))
+
+	def results(self, sentences=slice(None)):
+		""" Returns the given sentences as scorer.SentenceResult, numbered from 1 """
+		rows = zip(
+			self.length[sentences], self.status[sentences], self.matched[sentences],
+			self.goldbrackets[sentences], self.testbrackets[sentences], self.crossing[sentences],
+			self.words[sentences], self.correcttags[sentences],
+		)
+		return [
+			scorer.SentenceResult(i, int(length), int(status), int(matched), int(gold), int(test), int(crossing), int(words), int(correct), None, None)
+			for i, (length, status, matched, gold, test, crossing, words, correct) in enumerate(rows, start=1)
+		]
+
+	def totals(self, sentences=None):
+		""" Returns a scorer.Totals of the sentences selected by a boolean array, all by default """
+		totals = scorer.Totals()
+		select = np.ones(len(self), dtype=bool) if sentences is None else sentences
+		valid = select & (self.status == OK)
+		totals.sentences = int(select.sum())
+		totals.errors = int((select & (self.status == ERROR)).sum())
+		totals.skipped = int((select & (self.status == SKIP)).sum())
+		totals.goldbrackets = int(self.goldbrackets[valid].sum())
+		totals.testbrackets = int(self.testbrackets[valid].sum())
+		totals.matched = int(self.matched[valid].sum())
+		totals.complete = int((valid & (self.goldbrackets == self.matched) & (self.testbrackets == self.matched)).sum())
+		totals.words = int(self.words[valid].sum())
+		totals.correcttags = int(self.correcttags[valid].sum())
+		totals.crossing = int(self.crossing[valid].sum())
+		totals.nocrossing = int((valid & (self.crossing == 0)).sum())
+		totals.twocrossing = int((valid & (self.crossing <= 2)).sum())
+		return totals
+
+	def summary(self):
+		""" Returns the summary numbers for all sentences, as scorer.Totals.summary """
+		return self.totals().summary()
+
+	def cutoff_summary(self):
+		""" Returns the summary numbers for sentences up to CUTOFF_LEN words """
+		return self.totals(self.length <= self.params.cutoff_len).summary()
+
+
+class Matcher:
+	""" Gold trees paired with the trees of one or more test treebanks for scoring.
+		The trees of files with the same name are paired in order; where one file
+		has more trees than another, the rest are left out, as evalb stops there.
+		Only files found in every treebank are scored, so the Scores of all the
+		test treebanks have the same sentences. """
+
+	def __init__(self, gold, *tests):
+		if not tests:
+			raise ValueError("No test treebank to score")
+		trees = [[] for _ in range(len(tests) + 1)]
+		self.files = []
+		file_offsets = [0]
+		for name in gold.files:
+			if any(name not in test.file_ids for test in tests):
+				continue
+			filetrees = [tb.file_trees(name) for tb in (gold,) + tests]
+			n = min(len(t) for t in filetrees)
+			for side, t in zip(trees, filetrees):
+				side.extend(t[:n])
+			self.files.append(name)
+			file_offsets.append(file_offsets[-1] + n)
+		self.file_offsets = np.array(file_offsets, dtype=np.int64)
+		self.numsentences = len(trees[0])
+		if self.numsentences >= 1 << SENTENCE_BITS:
+			raise ValueError("Too many sentences to score at once: {}".format(self.numsentences))
+
+		# Words of all treebanks in one vocabulary
+		self.vocabulary = list(gold.words)
+		ids = {word: i for i, word in enumerate(self.vocabulary)}
+		self.gold = Side(gold, trees[0], np.arange(len(gold.words), dtype=np.int64))
+		self.tests = []
+		for test, testtrees in zip(tests, trees[1:]):
+			testwords = []
+			for word in test.words:
+				if word not in ids:
+					ids[word] = len(self.vocabulary)
+					self.vocabulary.append(word)
+				testwords.append(ids[word])
+			self.tests.append(Side(test, testtrees, np.array(testwords, dtype=np.int64)))
+
+	def score(self, params):
+		""" Scores the trees of the first test treebank against the gold trees with the
+			settings of params, a scorer.Parameters, and returns Scores """
+		return self.score_all(params)[0]
+
+	def score_all(self, params):
+		""" Scores the trees of each test treebank against the gold trees with the
+			settings of params, and returns a list of Scores. What depends only on
+			the gold trees is done once for all of them. """
+		n = self.numsentences
+		gold = self.gold
+
+		# Labels of all sides in one list, with a table of which are equal by EQ_LABEL
+		labels = list(dict.fromkeys(gold.labels + [label for test in self.tests for label in test.labels]))
+		labelid = {label: i for i, label in enumerate(labels)}
+		equal = np.eye(len(labels), dtype=bool)
+		for a, b in params.eq_labels:
+			if a in labelid and b in labelid:
+				equal[labelid[a], labelid[b]] = True
+		modified = {label: scorer.modify_label(label) for label in labels}
+		phraselabels = list(dict.fromkeys(modified.values()))
+		phraseclass = dict(zip(phraselabels, classes(phraselabels, params.eq_labels).tolist()))
+		deleted = set(params.delete_labels)
+
+		def isdeleted(label):
+			""" Whether a cut phrase label is equal to a DELETE_LABEL """
+			return label in deleted or any((label, d) in params.eq_labels for d in deleted)
+
+		def side(s):
+			""" Terminals and brackets of one side under params """
+			tag = np.array([labelid[label] for label in s.labels] + [-1], dtype=np.int64)
+			tagdeleted = np.array([label in deleted for label in s.labels] + [False])
+			counted = np.array([label not in params.delete_labels_for_length for label in s.labels] + [True])
+			phrase = np.array([
+				-1 if isdeleted(modified[label]) else phraseclass[modified[label]]
+				for label in s.labels
+			] + [-1], dtype=np.int64)
+
+			leaflabel = s.label[s.leaves]
+			leafsentence = s.node_sentence[s.leaves]
+			kept = s.terminal & ~tagdeleted[leaflabel]
+			length = np.bincount(leafsentence, weights=s.terminal & counted[leaflabel], minlength=n).astype(np.int64)
+			# Positions of the words that are left, counted from the start of the sentence
+			keptword = np.zeros(s.numwords + 1, dtype=np.int64)
+			keptword[s.leaf_word[kept]] = 1
+			before = np.concatenate(([0], np.cumsum(keptword)))
+			sentence = s.node_sentence[s.phrases]
+			first = before[s.firstword[sentence]]
+			start = before[s.phrase_start] - first
+			end = before[s.phrase_end] - first
+			label = phrase[s.label[s.phrases]]
+			use = (label >= 0) & (start < end)
+			if not params.labeled:
+				label = np.zeros_like(label)
+			result = {
+				"length": length,
+				"numwords": np.bincount(leafsentence[kept], minlength=n),
+				"words": s.words[s.leaf_word[kept]],
+				"tags": tag[leaflabel[kept]],
+				"wordsentence": leafsentence[kept],
+				"sentence": sentence[use],
+				"start": start[use],
+				"end": end[use],
+				"label": label[use],
+			}
+			if len(result["label"]) and (result["label"].max() >= 1 << LABEL_BITS or result["end"].max() >= 1 << POS_BITS):
+				raise ValueError("Too many labels or words in a sentence to score at once")
+			return result
+
+		g = side(gold)
+		goldunique, goldcounts = np.unique(pack(g), return_counts=True)
+		goldbrackets = np.bincount(g["sentence"], minlength=n)
+		return [
+			self.score_test(params, g, goldunique, goldcounts, goldbrackets, test, side(test), equal)
+			for test in self.tests
+		]
+
+	def score_test(self, params, g, goldunique, goldcounts, goldbrackets, test, t, equal):
+		""" Returns the Scores of one test side, given the terminals and brackets g of
+			the gold side and t of the test side, as made by score_all """
+		n = self.numsentences
+		# Status of each sentence, as in calc_result of evalb
+		status = np.full(n, OK, dtype=np.int64)
+		status[self.gold.irregular | test.irregular] = ERROR
+		status[g["numwords"] != t["numwords"]] = ERROR
+		samelength = g["numwords"] == t["numwords"]
+		wordsok = samelength[g["wordsentence"]]
+		# Sentences of the same length have their words in the same places
+		goldwords, testwords = g["words"][wordsok], t["words"][samelength[t["wordsentence"]]]
+		different = np.flatnonzero(goldwords != testwords)
+		if params.eq_words:
+			vocabulary = self.vocabulary
+			different = different[[
+				(vocabulary[goldwords[i]].encode("utf-8"), vocabulary[testwords[i]].encode("utf-8")) not in params.eq_words
+				for i in different
+			]]
+		status[g["wordsentence"][wordsok][different]] = ERROR
+		status[t["numwords"] == 0] = SKIP
+		valid = status == OK
+
+		testunique, testcounts = np.unique(pack(t), return_counts=True)
+		common, gi, ti = np.intersect1d(goldunique, testunique, assume_unique=True, return_indices=True)
+		matched = np.bincount(common >> (LABEL_BITS + 2 * POS_BITS), weights=np.minimum(goldcounts[gi], testcounts[ti]), minlength=n)
+
+		testbrackets = np.bincount(t["sentence"], minlength=n)
+		crossing = crossings(g, t, valid)
+		tagsok = samelength[g["wordsentence"]]
+		correct = np.bincount(
+			g["wordsentence"][tagsok], weights=equal[g["tags"][tagsok], t["tags"][samelength[t["wordsentence"]]]], minlength=n
+		)
+
+		zero = np.zeros(n, dtype=np.int64)
+		return Scores(
+			params, self.files, self.file_offsets, status, g["length"],
+			np.where(valid, matched.astype(np.int64), zero),
+			np.where(valid, goldbrackets, zero),
+			np.where(valid, testbrackets, zero),
+			np.where(valid, crossing, zero),
+			np.where(valid, g["numwords"], zero),
+			np.where(valid, correct.astype(np.int64), zero),
+		)
+
+
+def pack(s):
+	""" Returns the brackets of one side packed into int64 """
+	return (
+		(s["sentence"].astype(np.int64) << (LABEL_BITS + 2 * POS_BITS))
+		| (s["start"] << (LABEL_BITS + POS_BITS))
+		| (s["end"] << LABEL_BITS)
+		| s["label"]
+	)
+
+
+def crossings(g, t, valid):
+	""" Returns the number of test brackets crossing a gold bracket in each valid sentence.
+		Brackets over a single word never cross. """
+	n = len(valid)
+	gwide = (g["end"] - g["start"] > 1) & valid[g["sentence"]]
+	twide = (t["end"] - t["start"] > 1) & valid[t["sentence"]]
+	# Crossing depends only on the span, and unary chains repeat spans
+	gsentence, gstart, gend, _ = spans(g, gwide)
+	tsentence, tstart, tend, tcount = spans(t, twide)
+	# Every test span against every gold span of its sentence
+	goldcount = np.bincount(gsentence, minlength=n)
+	goldfirst = np.concatenate(([0], np.cumsum(goldcount)))
+	pairs = goldcount[tsentence]
+	ti = np.repeat(np.arange(len(tsentence)), pairs)
+	gi = np.repeat(goldfirst[tsentence] - (np.cumsum(pairs) - pairs), pairs) + np.arange(int(pairs.sum()))
+	s1, e1, s2, e2 = gstart[gi], gend[gi], tstart[ti], tend[ti]
+	cross = ((s1 < s2) & (s2 < e1) & (e1 < e2)) | ((s2 < s1) & (s1 < e2) & (e2 < e1))
+	crossed = np.bincount(ti, weights=cross, minlength=len(tsentence)) > 0
+	return np.bincount(tsentence, weights=crossed * tcount, minlength=n).astype(np.int64)
+
+
+def spans(s, which):
+	""" Returns the sentence, start and end of the distinct spans of the chosen
+		brackets, ordered by sentence, and how often each span occurs """
+	packed, count = np.unique(pack(s)[which] >> LABEL_BITS, return_counts=True)
+	mask = (1 << POS_BITS) - 1
+	return packed >> 2 * POS_BITS, packed >> POS_BITS & mask, packed & mask, count
+
+
+def sweep(matcher, params, variants):
+	""" Scores matcher with each variant of params, a list of (parameter, value)
+		settings as in a parameter file, such as ("DELETE_LABEL", b"NP"),
+		added to a copy of params. Returns a list of Scores. """
+	results = []
+	for settings in variants:
+		variant = copy.deepcopy(params)
+		for param, value in settings:
+			variant.set(param, value)
+		results.append(matcher.score(variant))
+	return results
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+	A cache of the parses of single sentences, kept between runs in an SQLite
+	database, so that sentences shared by the devset, the testset and other
+	corpora, or parsed in an earlier run, aren't parsed again.
+
+	A parse is stored under a hash of the normalized text of its sentence and
+	the identity of the parser, which includes its version, so that a new
+	version of a parser doesn't use the parses of an old one. The parse can be
+	anything json can store, e.g. the lines of an Annotald tree.
+
+	When the database grows over its size limit the parses used least recently
+	are evicted. The database can be shared by several processes.
+
+	cache = parsecache.ParseCache(parsecache.DATABASE, "Greynir 3.9.0")
+	parses = cache.lookup(sentences)	# None for each sentence not found
+	cache.put(sentence, parse)
+	cache.evict()
+	print(cache.summary())
+	cache.close()
+
+"""
+
+import hashlib
+import json
+import pathlib
+import re
+import sqlite3
+import time
+import unicodedata
+
+DATABASE = pathlib.Path().absolute() / "parsecache.sqlite"
+MAX_BYTES = 1 << 30	# Size of the parses kept when the cache is evicted
+TIMEOUT = 60	# Seconds to wait for another process writing to the database
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(sentence):
+	""" The text of a sentence as it is looked up, in NFC with whitespace collapsed """
+	return WHITESPACE.sub(" ", unicodedata.normalize("NFC", sentence)).strip()
+
+
+class ParseCache:
+	""" The parses of a parser in the database at path. Counts the sentences looked up
+		and found, see summary. Changes are committed when a lookup is done and when
+		the cache is closed, at the latest at the end of a with block. """
+
+	def __init__(self, path, parser, maxbytes=MAX_BYTES):
+		self.parser = parser
+		self.maxbytes = maxbytes
+		self.hits = 0
+		self.lookups = 0
+		self.connection = sqlite3.connect(str(path), timeout=TIMEOUT)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute(
+			"CREATE TABLE IF NOT EXISTS parses (key TEXT PRIMARY KEY, parser TEXT, "
+			"parse TEXT, size INTEGER, used INTEGER)"
+		)
+		self.connection.execute("CREATE INDEX IF NOT EXISTS parses_used ON parses (used)")
+		self.connection.commit()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def key(self, sentence):
+		return hashlib.sha1("{}\n{}".format(self.parser, normalize(sentence)).encode("utf-8")).hexdigest()
+
+	def lookup(self, sentences):
+		""" Returns a list of the parse of each of sentences, None where it isn't cached,
+			and marks the parses found as used """
+		keys = [self.key(sentence) for sentence in sentences]
+		found = {}
+		for start in range(0, len(keys), 500):
+			batch = keys[start:start + 500]
+			found.update(self.connection.execute(
+				"SELECT key, parse FROM parses WHERE key IN ({})".format(", ".join("?" * len(batch))), batch
+			))
+		if found:
+			now = time.time_ns()
+			self.connection.executemany("UPDATE parses SET used = ? WHERE key = ?", ((now, key) for key in found))
+		self.connection.commit()
+		self.lookups += len(keys)
+		self.hits += sum(key in found for key in keys)
+		return [json.loads(found[key]) if key in found else None for key in keys]
+
+	def put(self, sentence, parse):
+		""" Stores the parse of a sentence """
+		parse = json.dumps(parse, ensure_ascii=False)
+		self.connection.execute(
+			"INSERT OR REPLACE INTO parses VALUES (?, ?, ?, ?, ?)",
+			(self.key(sentence), self.parser, parse, len(parse.encode("utf-8")), time.time_ns()),
+		)
+
+	def evict(self):
+		""" Deletes the parses used least recently, of all parsers, until the rest fit in maxbytes.
+			Returns the number of parses deleted. """
+		kept = 0
+		evicted = []
+		for key, size in self.connection.execute("SELECT key, size FROM parses ORDER BY used DESC"):
+			kept += size
+			if kept > self.maxbytes:
+				evicted.append((key,))
+		self.connection.executemany("DELETE FROM parses WHERE key = ?", evicted)
+		self.connection.commit()
+		return len(evicted)
+
+	def summary(self):
+		""" The hit ratio of the lookups """
+		ratio = 100.0 * self.hits / self.lookups if self.lookups else 0.0
+		return "Parse cache: {} of {} sentences found ({:.2f}%)".format(self.hits, self.lookups, ratio)
+
+	def close(self):
+		self.connection.commit()
+		self.connection.close()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+"""
+	Results of the scoring stage as columns of NumPy arrays.
+
+	get_results in helpers.py writes a report for each pair of files, as
+	evalb does, and the same results as arrays to results.sqlite in the
+	folder of the reports, a row for each report. combine_reports reads
+	these arrays instead of the text of the reports, and merges the
+	scorer.Totals of each report by genre.
+
+	Arrays (ragged arrays are stored flat with offsets, as in treebank.py):
+		file_offsets	sentences of file f are file_offsets[f]:file_offsets[f+1]
+		id, length, status, matched, goldbrackets, testbrackets, crossing,
+		words, correcttags	numbers of each sentence, as in its line of the report
+		terminal_offsets	terminals of sentence s are terminal_offsets[s]:terminal_offsets[s+1]
+		gold_tag, test_tag	label of each terminal in the gold and test trees,
+			-1 where a tree has no word
+		gold_offsets	gold brackets of sentence s are gold_offsets[s]:gold_offsets[s+1]
+		gold_start, gold_end, gold_label	span and label of each gold bracket
+		test_offsets, test_start, test_end, test_label	the same for the test brackets
+	Labels are indices into the labels vocabulary. The terminals and brackets
+	are those shown with DEBUG 1, with phrase labels cut as they are scored,
+	and are empty without it. Arrays of the same length are saved together,
+	as the rows of one array, in a column of the database.
+
+"""
+
+import json
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+import scorer
+
+# In the folder of the reports
+DATABASE = "results.sqlite"
+
+SENTENCE_ARRAYS = ("id", "length", "status", "matched", "goldbrackets", "testbrackets", "crossing", "words", "correcttags")
+TERMINAL_ARRAYS = ("gold_tag", "test_tag")
+BRACKET_ARRAYS = ("start", "end", "label")
+OFFSET_ARRAYS = ("file_offsets", "terminal_offsets", "gold_offsets", "test_offsets")
+# Arrays of the same length are saved as the rows of one array, the offsets of
+# each sentence all but file_offsets, which only the results of several reports need
+SAVED_ROWS = {
+	"sentences": SENTENCE_ARRAYS,
+	"terminals": TERMINAL_ARRAYS,
+	"gold": tuple("gold_" + name for name in BRACKET_ARRAYS),
+	"test": tuple("test_" + name for name in BRACKET_ARRAYS),
+	"offsets": OFFSET_ARRAYS[1:],
+}
+ARRAYS = (OFFSET_ARRAYS[0],) + tuple(name for names in SAVED_ROWS.values() for name in names)
+BRACKET_COLUMNS = SAVED_ROWS["gold"] + SAVED_ROWS["test"]
+
+# The first line of a block of terminals and brackets shown with DEBUG, and a terminal
+# or a bracket in its lines, which have a column for the gold tree and one for the
+# test tree. The newline before an entry at the beginning of a line is matched with
+# its indentation, which tells the columns apart.
+DSP_HEAD = re.compile(rb"-<1>---\(wn1=\s*(\d+), bn1=\s*(\d+)\)-\s*-<2>---\(wn2=\s*(\d+), bn2=\s*(\d+)\)-")
+# Only the indentation, position and label of a terminal and the indentation, span
+# and label of a bracket are kept.
+DSP_TERMINAL = re.compile(rb"(\n *)?(\d+) : -?\d+ : (\S*) +\S+ *")
+DSP_BRACKET = re.compile(rb"(\n *)?\d+ : -?\d+ : +(-?\d+) +(-?\d+)  (\S*) *")
+
+
+def report_results(name, report):
+	""" Returns the Results of a scorer.Report of the built-in scorer as a file called
+		name, with the terminals and brackets of its gold and test trees """
+	labels = {}	# Label as bytes -> index
+
+	def label_id(label):
+		i = labels.get(label)
+		if i is None:
+			i = labels[label] = len(labels)
+		return i
+
+	columns = {name: [] for name in TERMINAL_ARRAYS + BRACKET_COLUMNS}
+	counts = {"terminal": [], "gold": [], "test": []}
+	# As they are shown in the report, with DEBUG 1 or more
+	shown = report.params.debug >= 1
+	for result in report.sentences:
+		gold, test = (result.gold, result.test) if shown else (scorer.Parse(), scorer.Parse())
+		n = max(len(gold.terminals), len(test.terminals))
+		counts["terminal"].append(n)
+		for side, parse in (("gold", gold), ("test", test)):
+			# Terminals without a word aren't shown
+			tags = [label_id(t[1]) if t[0] else -1 for t in parse.terminals]
+			columns[side + "_tag"].extend(tags)
+			columns[side + "_tag"].extend([-1] * (n - len(tags)))
+			brackets = parse.brackets
+			columns[side + "_start"].extend([b[0] for b in brackets])
+			columns[side + "_end"].extend([b[1] for b in brackets])
+			columns[side + "_label"].extend([label_id(b[2]) for b in brackets])
+			counts[side].append(len(brackets))
+	arrays = sentence_arrays(report.sentences, counts)
+	arrays.update((name, np.array(values, dtype=np.int32)) for name, values in columns.items())
+	return Results(arrays, [label.decode("utf-8", "replace") for label in labels], [name])
+
+
+def read_report(name, output, params):
+	""" Returns the Results of a report written by evalb for one file as a file called
+		name, with the terminals and brackets shown with DEBUG 1 or more, which are
+		read for all the sentences at once """
+	lines = scorer.output_lines(output)
+	sentences = []
+	counts = {"terminal": [], "gold": [], "test": []}
+	terminals, brackets = [], []	# Entries matched in the columns of each sentence
+	pos = 0
+	while True:
+		read = scorer.read_result(lines, pos, len(sentences) + 1, params)
+		if read is None:
+			break
+		result, end = read
+		sentences.append(result)
+		if end > pos + 1:
+			# The terminals, then a blank line, the brackets, another blank line and "="
+			head = DSP_HEAD.match(lines[pos + 1])
+			counts["terminal"].append(max(int(head.group(1)), int(head.group(3))))
+			blank = lines.index(b"\n", pos + 2)
+			terminals.append(DSP_TERMINAL.findall(b"".join([b"\n"] + lines[pos + 2:blank])))
+			brackets.append(DSP_BRACKET.findall(b"".join([b"\n"] + lines[blank + 1:end - 2])))
+		else:
+			counts["terminal"].append(0)
+			terminals.append([])
+			brackets.append([])
+		pos = end
+
+	# The entries of all sentences as columns of bytes
+	terminalcount = [len(entries) for entries in terminals]
+	bracketcount = [len(entries) for entries in brackets]
+	terminals = np.array([entry for entries in terminals for entry in entries] or np.zeros((0, 3)), dtype=bytes)
+	brackets = np.array([entry for entries in brackets for entry in entries] or np.zeros((0, 4)), dtype=bytes)
+	vocabulary, ids = np.unique(np.concatenate((terminals[:, 2], brackets[:, 3])), return_inverse=True)
+	ids = ids.reshape(-1).astype(np.int32)
+	tagids, bracketids = ids[:len(terminals)], ids[len(terminals):]
+
+	# The first entry of a line is in the gold column unless it is indented past it
+	indent = np.char.str_len(terminals[:, 0])
+	goldterminal = (indent > 0) & (indent <= 40)
+	terminal_offsets = offsets(counts["terminal"])
+	position = terminals[:, 1].astype(np.int64) + np.repeat(terminal_offsets[:-1], terminalcount)
+	arrays = {}
+	for side, mask in (("gold", goldterminal), ("test", ~goldterminal)):
+		tags = np.full(terminal_offsets[-1], -1, dtype=np.int32)
+		tags[position[mask]] = tagids[mask]
+		arrays[side + "_tag"] = tags
+
+	indent = np.char.str_len(brackets[:, 0])
+	goldbracket = (indent > 0) & (indent <= 32)
+	sentence = np.repeat(np.arange(len(sentences)), bracketcount)
+	for side, mask in (("gold", goldbracket), ("test", ~goldbracket)):
+		arrays[side + "_start"] = brackets[mask, 1].astype(np.int32)
+		arrays[side + "_end"] = brackets[mask, 2].astype(np.int32)
+		arrays[side + "_label"] = bracketids[mask]
+		counts[side] = np.bincount(sentence[mask], minlength=len(sentences))
+	arrays.update(sentence_arrays(sentences, counts))
+	return Results(arrays, [label.decode("utf-8", "replace") for label in vocabulary.tolist()], [name])
+
+
+def sentence_arrays(sentences, counts):
+	""" Returns the arrays of the numbers of SentenceResult objects and the offsets of
+		their terminals and brackets, given the number of each in counts """
+	arrays = {name: np.array([getattr(result, name) for result in sentences], dtype=np.int32) for name in SENTENCE_ARRAYS}
+	arrays["file_offsets"] = np.array([0, len(sentences)], dtype=np.int64)
+	for side, count in counts.items():
+		arrays[side + "_offsets"] = offsets(count)
+	return arrays
+
+
+def offsets(counts):
+	""" Returns the offsets of consecutive ranges of the given lengths """
+	return np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+
+
+def iter_reports(reports, params, missing=False):
+	""" Yields the Results of each report file in reports, read from the database in
+		its folder, or from the text of the report if it isn't there.
+		With missing, None is yielded for reports that don't exist. """
+	databases = {}
+	try:
+		for pout in reports:
+			if missing and not pout.exists():
+				yield None
+				continue
+			if pout.parent not in databases:
+				databases[pout.parent] = ResultsDatabase(pout.parent)
+			part = databases[pout.parent].load(pout)
+			if part is None:
+				part = read_report(pout.name, pout.read_bytes(), params)
+			yield part
+	finally:
+		for database in databases.values():
+			database.close()
+
+
+def load_reports(reports, params):
+	""" Returns the Results of the report files in reports, one after another """
+	return Results.concatenate(list(iter_reports(reports, params)))
+
+
+class Results:
+	""" Results of the sentences of one or more files, see the module docstring """
+
+	def __init__(self, arrays, labels, files):
+		self.arrays = arrays
+		self.labels = labels
+		self.files = files
+
+	def __getitem__(self, name):
+		return self.arrays[name]
+
+	def __len__(self):
+		return len(self.arrays["id"])
+
+	@classmethod
+	def concatenate(cls, parts):
+		""" Returns the results of all the files of parts, a list of Results, one after
+			another, with their labels in one vocabulary """
+		labels = {}
+		arrays = {name: [] for name in ARRAYS}
+		for name in OFFSET_ARRAYS:
+			arrays[name].append(np.zeros(1, dtype=np.int64))
+		for part in parts:
+			# Labels of part -> labels of the whole, and -1 stays -1
+			remap = np.array([labels.setdefault(label, len(labels)) for label in part.labels] + [-1], dtype=np.int32)
+			for name in ARRAYS:
+				array = part[name]
+				if name in OFFSET_ARRAYS:
+					# Shifted past the last offset so far
+					array = array[1:] + arrays[name][-1][-1]
+				elif name.endswith(("_tag", "_label")):
+					array = remap[array]
+				arrays[name].append(array)
+		arrays = {name: np.concatenate(values) if values else np.zeros(0, dtype=np.int32) for name, values in arrays.items()}
+		return cls(arrays, list(labels), [name for part in parts for name in part.files])
+
+	@property
+	def file_index(self):
+		""" The index of the file of each sentence """
+		return np.repeat(np.arange(len(self.files)), np.diff(self["file_offsets"]))
+
+	def sentence_percentages(self):
+		""" Returns the recall, precision, F-measure and tagging accuracy of
+			each sentence as in the lines of the report """
+		matched = self["matched"].astype(np.float64)
+		recall = percent(matched, self["goldbrackets"])
+		precision = percent(matched, self["testbrackets"])
+		total = recall + precision
+		fmeasure = np.divide(2 * recall * precision, total, out=np.zeros_like(total), where=total > 0)
+		return recall, precision, fmeasure, percent(self["correcttags"], self["words"])
+
+	def totals(self, sentences=None):
+		""" Returns a scorer.Totals of the sentences selected by a boolean array, all by default """
+		totals = scorer.Totals()
+		status = self["status"]
+		select = np.ones(len(self), dtype=bool) if sentences is None else sentences
+		valid = select & (status == scorer.OK)
+		matched, goldbrackets, testbrackets, crossing = self["matched"], self["goldbrackets"], self["testbrackets"], self["crossing"]
+		totals.sentences = int(select.sum())
+		totals.errors = int((select & (status == scorer.ERROR)).sum())
+		totals.skipped = int((select & (status == scorer.SKIP)).sum())
+		totals.goldbrackets = int(goldbrackets[valid].sum())
+		totals.testbrackets = int(testbrackets[valid].sum())
+		totals.matched = int(matched[valid].sum())
+		totals.complete = int((valid & (goldbrackets == matched) & (testbrackets == matched)).sum())
+		totals.words = int(self["words"][valid].sum())
+		totals.correcttags = int(self["correcttags"][valid].sum())
+		totals.crossing = int(crossing[valid].sum())
+		totals.nocrossing = int((valid & (crossing == 0)).sum())
+		totals.twocrossing = int((valid & (crossing <= 2)).sum())
+		return totals
+
+	def bracket_counts(self):
+		""" Returns the matched, gold and test brackets of each sentence, 0 for those
+			that aren't valid, as an array of shape (sentences, 3) for significance.py """
+		valid = self["status"] == scorer.OK
+		counts = np.stack([self["matched"], self["goldbrackets"], self["testbrackets"]], axis=1).astype(np.int64)
+		counts[~valid] = 0
+		return counts
+
+	def tag_confusion(self):
+		""" Returns a ConfusionMatrix of the gold and test labels of the terminals of
+			the valid sentences """
+		offsets = self["terminal_offsets"]
+		kept = np.repeat(self["status"] == scorer.OK, np.diff(offsets))
+		return ConfusionMatrix.from_pairs(self["gold_tag"][kept], self["test_tag"][kept], self.labels)
+
+	def phrase_confusion(self):
+		""" Returns a ConfusionMatrix of the labels of the gold and test brackets of
+			the valid sentences. A bracket with the same span and label in both
+			trees is paired with its match; the others of a span in one tree are
+			paired in order with those left in the other, and those left over
+			with a missing label. """
+		valid = self["status"] == scorer.OK
+		sides = {}
+		for side in ("gold", "test"):
+			offsets = self[side + "_offsets"]
+			sentence = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+			kept = valid[sentence]
+			start, end = self[side + "_start"][kept].astype(np.int64), self[side + "_end"][kept].astype(np.int64)
+			span = (sentence[kept] << 40) | ((start & 0xFFFFF) << 20) | (end & 0xFFFFF)
+			sides[side] = (span, self[side + "_label"][kept].astype(np.int64))
+		(goldspans, goldlabels), (testspans, testlabels) = sides["gold"], sides["test"]
+		# Spans of both trees as ids
+		_, spans = np.unique(np.concatenate([goldspans, testspans]), return_inverse=True)
+		spans = spans.reshape(-1).astype(np.int64)
+		goldspan, testspan = spans[:len(goldlabels)], spans[len(goldlabels):]
+
+		# The same span and label: the k-th of them in one tree matches the k-th in the other
+		n = len(self.labels) + 1
+		goldkeys = (goldspan * n + goldlabels) << 32
+		testkeys = (testspan * n + testlabels) << 32
+		goldkeys |= occurrences(goldkeys)
+		testkeys |= occurrences(testkeys)
+		goldmatched = np.isin(goldkeys, testkeys, assume_unique=True)
+		testmatched = np.isin(testkeys, goldkeys, assume_unique=True)
+
+		# The rest of a span, in order
+		goldrest, testrest = np.flatnonzero(~goldmatched), np.flatnonzero(~testmatched)
+		goldkeys = (goldspan[goldrest] << 32) | occurrences(goldspan[goldrest])
+		testkeys = (testspan[testrest] << 32) | occurrences(testspan[testrest])
+		common, gi, ti = np.intersect1d(goldkeys, testkeys, assume_unique=True, return_indices=True)
+		goldonly = np.setdiff1d(np.arange(len(goldrest)), gi, assume_unique=True)
+		testonly = np.setdiff1d(np.arange(len(testrest)), ti, assume_unique=True)
+		matchedlabels = goldlabels[goldmatched]
+		gold = np.concatenate([matchedlabels, goldlabels[goldrest[gi]], goldlabels[goldrest[goldonly]], np.full(len(testonly), -1)])
+		test = np.concatenate([matchedlabels, testlabels[testrest[ti]], np.full(len(goldonly), -1), testlabels[testrest[testonly]]])
+		return ConfusionMatrix.from_pairs(gold, test, self.labels)
+
+
+def occurrences(keys):
+	""" Returns how many of the keys before each one are equal to it """
+	order = np.argsort(keys, kind="stable")
+	ordered = keys[order]
+	first = np.flatnonzero(np.concatenate(([True], ordered[1:] != ordered[:-1])))
+	ranks = np.empty(len(keys), dtype=np.int64)
+	ranks[order] = np.arange(len(keys)) - np.repeat(first, np.diff(np.append(first, len(keys))))
+	return ranks
+
+
+class ConfusionMatrix:
+	""" Counts of pairs of gold and test labels, in a dense matrix indexed by the
+		labels of a vocabulary, where index 0 is for a missing label. Matrices
+		of different files merge into one, as scorer.Totals do. """
+
+	def __init__(self, labels=(), counts=None):
+		self.labels = [None] + list(labels)
+		self.index = {label: i for i, label in enumerate(self.labels)}
+		n = len(self.labels)
+		self.counts = np.zeros((n, n), dtype=np.int64) if counts is None else counts
+
+	@classmethod
+	def from_pairs(cls, gold, test, labels):
+		""" Returns the ConfusionMatrix of the pairs of gold and test labels, indices
+			into labels or -1 for a missing label """
+		n = len(labels) + 1
+		codes = (np.asarray(gold, dtype=np.int64) + 1) * n + (np.asarray(test, dtype=np.int64) + 1)
+		return cls(labels, np.bincount(codes, minlength=n * n).reshape(n, n))
+
+	def merge(self, other):
+		""" Returns the ConfusionMatrix of the pairs of both, with the labels of
+			self followed by the new labels of other """
+		merged = ConfusionMatrix(self.labels[1:] + [label for label in other.labels[1:] if label not in self.index])
+		ours = np.arange(len(self.labels))
+		theirs = np.array([merged.index[label] for label in other.labels], dtype=np.int64)
+		merged.counts[np.ix_(ours, ours)] += self.counts
+		merged.counts[np.ix_(theirs, theirs)] += other.counts
+		return merged
+
+	def pairs(self):
+		""" Returns (gold label, test label, count) for each pair that occurs, with
+			None for a missing label """
+		gold, test = np.nonzero(self.counts)
+		return [(self.labels[g], self.labels[t], int(self.counts[g, t])) for g, t in zip(gold.tolist(), test.tolist())]
+
+	def label_scores(self):
+		""" Returns (label, gold count, test count, precision, recall, F-measure) for
+			each label found in either tree, in percent """
+		correct = np.diagonal(self.counts)[1:]
+		gold, test = self.counts.sum(axis=1)[1:], self.counts.sum(axis=0)[1:]
+		precision, recall = percent(correct, test), percent(correct, gold)
+		total = precision + recall
+		fmeasure = np.divide(2 * precision * recall, total, out=np.zeros_like(total), where=total > 0)
+		rows = zip(self.labels[1:], gold.tolist(), test.tolist(), precision.tolist(), recall.tolist(), fmeasure.tolist())
+		return [row for row in rows if row[1] or row[2]]
+
+
+def ratio(part, whole):
+	""" part / whole, 0 where whole is 0 """
+	whole = np.asarray(whole, dtype=np.float64)
+	return np.divide(part, whole, out=np.zeros_like(whole), where=whole > 0)
+
+
+def percent(part, whole):
+	""" 100 * part / whole, 0 where whole is 0 """
+	return 100.0 * ratio(part, whole)
+
+
+class ResultsDatabase:
+	""" The Results of the reports in a folder, in an SQLite database with a row for
+		each report. The size and time of the report are saved with its results, which
+		aren't loaded if the report has been written since. Can be used from several
+		threads; the results are committed when the database is closed. """
+
+	def __init__(self, folder):
+		self.connection = sqlite3.connect(str(folder / DATABASE), check_same_thread=False)
+		self.lock = threading.Lock()
+		columns = ", ".join("{} BLOB".format(saved) for saved in SAVED_ROWS)
+		with self.lock:
+			self.connection.execute(
+				"CREATE TABLE IF NOT EXISTS results (report TEXT PRIMARY KEY, size INTEGER, "
+				"mtime INTEGER, labels TEXT, {})".format(columns)
+			)
+
+	def save(self, pout, results):
+		""" Saves the Results of the report pout, which has been written """
+		stat = pout.stat()
+		rows = [np.stack([results[name] for name in names]).tobytes() for names in SAVED_ROWS.values()]
+		with self.lock:
+			self.connection.execute(
+				"INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, {})".format(", ".join("?" * len(rows))),
+				[pout.name, stat.st_size, stat.st_mtime_ns, json.dumps(results.labels)] + rows,
+			)
+
+	def load(self, pout):
+		""" Returns the Results of the report pout, None if they haven't been saved since
+			it was written """
+		with self.lock:
+			row = self.connection.execute("SELECT * FROM results WHERE report = ?", (pout.name,)).fetchone()
+		stat = pout.stat()
+		if row is None or (row[1], row[2]) != (stat.st_size, stat.st_mtime_ns):
+			return None
+		labels = json.loads(row[3])
+		arrays = {}
+		for (saved, names), blob in zip(SAVED_ROWS.items(), row[4:]):
+			dtype = np.int64 if saved == "offsets" else np.int32
+			arrays.update(zip(names, np.frombuffer(blob, dtype=dtype).reshape(len(names), -1)))
+		arrays["file_offsets"] = np.array([0, len(arrays["id"])], dtype=np.int64)
+		return Results(arrays, labels, [pout.name])
+
+	def close(self):
+		with self.lock:
+			self.connection.commit()
+			self.connection.close()
@@ -0,0 +1,666 @@
+#!/usr/bin/env python
+"""
+	In-process bracket scorer compatible with evalb.
+
+	evalb (https://nlp.cs.nyu.edu/evalb/) compares a file of gold trees to
+	a file of test trees, one bracketed tree per line, and reports labeled
+	bracketing recall, precision, crossing brackets and tagging accuracy for
+	each sentence and in total. This module does the same without starting
+	a process, following evalb.c closely so that the numbers and the report
+	text are the same, byte for byte:
+
+	+ Lines are read as evalb reads them, in chunks of at most 4999 bytes,
+	  and compared as bytes, so labels and words are never decoded.
+	+ Labels of phrases are cut at the first "-" or "=", so NP-OBJ is
+	  scored as NP. Preterminal labels are compared as they are.
+	+ Preterminals with a DELETE_LABEL label are removed with their word,
+	  phrases with such a label are not counted. Phrases without words
+	  are not counted either.
+	+ EQ_LABEL and EQ_WORD pairs are equal in both directions, but the
+	  pairs are not chained.
+	+ Each gold bracket is matched to the first unmatched test bracket with
+	  the same span and label, with brackets in the order they are opened.
+	+ A sentence is skipped if the test tree has no words and is an error
+	  sentence if the words differ or it can't be read. Neither counts
+	  towards the totals.
+	+ After MAX_ERROR + 1 errors scoring stops and the report ends
+	  without a summary, as evalb exits.
+	+ Lines that evalb reads in a way that depends on its memory, such as
+	  a line ending inside a bracket, which runs on into what is left of
+	  earlier lines, are read as evalb compiled with gcc on Linux reads them,
+	  as long as no more than four brackets are closed below the top level.
+	  Past that evalb writes over its own variables.
+
+	The parameters are read from a parameter file such as stillingar.prm.
+	DEBUG 1 adds the terminals and brackets of each sentence to the report,
+	which results.py reads back from a report written by evalb. QUOTE_LABEL and DEBUG 2
+	are not supported.
+
+	To score two files and write the report:
+
+	params = scorer.Parameters.from_file(pathlib.Path("stillingar.prm"))
+	report = scorer.score_files(pgold, ptest, params)
+	pout.write_bytes(report.output)
+
+"""
+
+import math
+import re
+
+# Same as in evalb.c
+DEFAULT_MAX_ERROR = 10
+DEFAULT_CUT_LEN = 40
+LINE_LEN = 5000 - 1	# Longest line read at once by fgets
+
+OK, ERROR, SKIP = 0, 1, 2	# Status of a sentence
+UNMATCHED, MATCHED, DELETED, UNDEFINED = 0, 1, 5, 9	# Result of a terminal or a bracket
+
+SPACE = frozenset(b" \t\n\v\f\r")
+TERMINATOR = SPACE | frozenset(b"()")
+
+# A terminal, an opening bracket with its label, a closing bracket or anything else,
+# told apart by the last group matched
+TOKEN = re.compile(rb"\(([^\s()]*)\s+([^\s()]*)\)|\(([^\s()]*)|(\))|(\S)")
+TERMINAL, OPEN, CLOSE, OTHER = 2, 3, 4, 5
+
+class EvalbAbort(Exception):
+	""" Raised when more than MAX_ERROR errors have occurred and evalb would exit """
+
+class Parameters:
+	""" Settings of an evalb parameter file """
+
+	def __init__(self):
+		self.debug = 0
+		self.max_error = DEFAULT_MAX_ERROR
+		self.cutoff_len = DEFAULT_CUT_LEN
+		self.labeled = 1
+		self.delete_labels = []
+		self.delete_labels_for_length = set()
+		self.eq_labels = set()
+		self.eq_words = set()
+
+	@classmethod
+	def from_file(cls, path):
+		""" Reads a parameter file the way evalb does """
+		params = cls()
+		for number, line in enumerate(path.read_bytes().split(b"\n"), start=1):
+			line = line[:1] + line[1:].rstrip()
+			if line.startswith(b"#") or len(line) < 3:
+				continue
+			parts = line.split(None, 1)
+			if len(parts) < 2:
+				raise ValueError("Empty value in parameter file {} ({})".format(path, number))
+			params.set(parts[0].decode("ascii", "replace"), parts[1])
+		return params
+
+	def set(self, param, value):
+		if param == "DEBUG":
+			self.debug = atoi(value)
+			if self.debug > 1:
+				raise ValueError("DEBUG {} is not supported".format(self.debug))
+		elif param == "MAX_ERROR":
+			self.max_error = atoi(value)
+		elif param == "CUTOFF_LEN":
+			self.cutoff_len = atoi(value)
+		elif param == "LABELED":
+			self.labeled = atoi(value)
+		elif param == "DELETE_LABEL":
+			self.delete_labels.append(value)
+		elif param == "DELETE_LABEL_FOR_LENGTH":
+			self.delete_labels_for_length.add(value)
+		elif param == "QUOTE_LABEL":
+			raise ValueError("QUOTE_LABEL is not supported")
+		elif param in ("EQ_LABEL", "EQ_WORD"):
+			values = value.split()
+			if len(values) != 2:
+				# Ignored by evalb, with a warning
+				return
+			pairs = self.eq_labels if param == "EQ_LABEL" else self.eq_words
+			pairs.add((values[0], values[1]))
+			pairs.add((values[1], values[0]))
+		# evalb warns about unknown keywords and goes on
+
+	def label_comp(self, s1, s2):
+		return s1 == s2 or (s1, s2) in self.eq_labels
+
+	def word_comp(self, s1, s2):
+		return s1 == s2 or (s1, s2) in self.eq_words
+
+def atoi(value):
+	""" Returns the integer at the start of value, like atoi in C """
+	value = value.lstrip()
+	end = 1 if value[:1] in (b"-", b"+") else 0
+	while end < len(value) and value[end:end + 1].isdigit():
+		end += 1
+	try:
+		return int(value[:end])
+	except ValueError:
+		return 0
+
+def modify_label(label):
+	""" Cuts a phrase label at the first "-" or "=" """
+	for i, c in enumerate(label):
+		if c in b"-=":
+			return label[:i]
+	return label
+
+def read_lines(data):
+	""" Splits the contents of a file into lines the way evalb reads them with fgets,
+		so lines longer than LINE_LEN bytes are read in several parts """
+	pos = 0
+	while pos < len(data):
+		end = data.find(b"\n", pos, pos + LINE_LEN)
+		end = pos + LINE_LEN if end < 0 else end + 1
+		yield data[pos:end]
+		pos = end
+
+class Parse:
+	""" Terminals and brackets of one tree. A terminal is [word, label, result]
+		and a bracket [start, end, label, result], where end is exclusive.
+		Brackets are in the order they are opened, as in evalb. """
+
+	def __init__(self):
+		self.terminals = []
+		self.brackets = []
+		self.length = 0	# Number of words, not counting DELETE_LABEL_FOR_LENGTH
+
+class SentenceResult:
+	""" Scores of one sentence, the numbers of a per-sentence line of an evalb report """
+
+	__slots__ = ("id", "length", "status", "recall", "precision", "matched", "goldbrackets",
+		"testbrackets", "crossing", "words", "correcttags", "tagaccuracy", "gold", "test")
+
+	def __init__(self, id, length, status, matched, goldbrackets, testbrackets, crossing, words, correcttags, gold, test):
+		self.id = id
+		self.length = length
+		self.status = status
+		self.matched = matched
+		self.goldbrackets = goldbrackets
+		self.testbrackets = testbrackets
+		self.crossing = crossing
+		self.words = words
+		self.correcttags = correcttags
+		self.recall = 0.0 if goldbrackets == 0 else 100.0 * matched / goldbrackets
+		self.precision = 0.0 if testbrackets == 0 else 100.0 * matched / testbrackets
+		self.tagaccuracy = 0.0 if words == 0 else 100.0 * correcttags / words
+		self.gold = gold
+		self.test = test
+
+	def line(self):
+		""" Returns the line of this sentence in an evalb report """
+		return (
+			b"%4d  %3d    %d  " % (self.id, self.length, self.status)
+			+ b"%6.2f %6.2f   %3d    %3d  %3d    %3d" % (
+				self.recall, self.precision, self.matched, self.goldbrackets, self.testbrackets, self.crossing
+			)
+			+ b"   %4d  %4d   %6.2f\n" % (self.words, self.correcttags, self.tagaccuracy)
+		)
+
+class Totals:
+	""" Sums over the sentences of a report, for all sentences or those up to a length """
+
+	def __init__(self):
+		self.goldbrackets = self.testbrackets = self.matched = 0
+		self.sentences = self.errors = self.skipped = self.complete = 0
+		self.words = self.correcttags = 0
+		self.crossing = self.nocrossing = self.twocrossing = 0
+
+	def add(self, status, words, goldbrackets, testbrackets, matched, crossing, correcttags):
+		self.sentences += 1
+		if status == ERROR:
+			self.errors += 1
+		elif status == SKIP:
+			self.skipped += 1
+		else:
+			self.goldbrackets += goldbrackets
+			self.testbrackets += testbrackets
+			self.matched += matched
+			if goldbrackets == testbrackets == matched:
+				self.complete += 1
+			self.words += words
+			self.crossing += crossing
+			if crossing == 0:
+				self.nocrossing += 1
+			if crossing <= 2:
+				self.twocrossing += 1
+			self.correcttags += correcttags
+
+	def merge(self, other):
+		""" Returns the Totals of the sentences of both. Merging is associative, so the
+			Totals of the parts of a corpus, however it was split up, merge into those
+			of the whole """
+		merged = Totals()
+		for name, value in vars(self).items():
+			setattr(merged, name, value + getattr(other, name))
+		return merged
+
+	@property
+	def valid(self):
+		return self.sentences - self.errors - self.skipped
+
+	def summary(self):
+		""" Returns the numbers of a summary block of an evalb report as a dict """
+		r = 100.0 * self.matched / self.goldbrackets if self.goldbrackets > 0 else 0.0
+		p = 100.0 * self.matched / self.testbrackets if self.testbrackets > 0 else 0.0
+		valid = self.valid
+		return {
+			"sentences": self.sentences,
+			"errors": self.errors,
+			"skipped": self.skipped,
+			"valid": valid,
+			"recall": r,
+			"precision": p,
+			"fmeasure": 2 * p * r / (p + r) if p + r > 0 else math.nan,
+			"complete": 100.0 * self.complete / valid if valid > 0 else 0.0,
+			"crossing": 1.0 * self.crossing / valid if valid > 0 else 0.0,
+			"nocrossing": 100.0 * self.nocrossing / valid if valid > 0 else 0.0,
+			"twocrossing": 100.0 * self.twocrossing / valid if valid > 0 else 0.0,
+			"tagging": 100.0 * self.correcttags / self.words if self.words > 0 else 0.0,
+		}
+
+	def block(self, title):
+		""" Returns a summary block of an evalb report """
+		s = self.summary()
+		# 0/0 in C, printed as -nan by glibc
+		fmeasure = b"  -nan" if math.isnan(s["fmeasure"]) else b"%6.2f" % s["fmeasure"]
+		return b"".join((
+			b"\n-- %s --\n" % title,
+			b"Number of sentence        = %6d\n" % s["sentences"],
+			b"Number of Error sentence  = %6d\n" % s["errors"],
+			b"Number of Skip  sentence  = %6d\n" % s["skipped"],
+			b"Number of Valid sentence  = %6d\n" % s["valid"],
+			b"Bracketing Recall         = %6.2f\n" % s["recall"],
+			b"Bracketing Precision      = %6.2f\n" % s["precision"],
+			b"Bracketing FMeasure       = %s\n" % fmeasure,
+			b"Complete match            = %6.2f\n" % s["complete"],
+			b"Average crossing          = %6.2f\n" % s["crossing"],
+			b"No crossing               = %6.2f\n" % s["nocrossing"],
+			b"2 or less crossing        = %6.2f\n" % s["twocrossing"],
+			b"Tagging accuracy          = %6.2f\n" % s["tagging"],
+		))
+
+class Report:
+	""" Result of comparing a gold file to a test file.
+		sentences has a SentenceResult for each line, total and cutoff the totals for all
+		sentences and for those of length up to CUTOFF_LEN. errors has (line, message)
+		for each error evalb would print. output is the report as evalb writes it. """
+
+	def __init__(self, params):
+		self.params = params
+		self.sentences = []
+		self.total = Totals()
+		self.cutoff = Totals()
+		self.errors = []
+		self.aborted = False
+		self.output = b""
+
+	def summary(self):
+		""" Returns the summary numbers for all sentences, None if scoring was aborted """
+		return None if self.aborted else self.total.summary()
+
+HEAD = (
+	b"  Sent.                        Matched  Bracket   Cross        Correct Tag\n"
+	b" ID  Len.  Stat. Recal  Prec.  Bracket gold test Bracket Words  Tags Accracy\n"
+	b"============================================================================\n"
+)
+
+class Scorer:
+	""" Compares gold and test trees with the given Parameters, see the module docstring """
+
+	def __init__(self, params):
+		self.params = params
+		self.delete_labels = frozenset(params.delete_labels)
+		# Phrase labels equal to a DELETE_LABEL label, for massage
+		self.deleted = self.delete_labels | frozenset(s1 for s1, s2 in params.eq_labels if s2 in self.delete_labels)
+		self.modified = {}	# Phrase label -> modify_label(label)
+		# evalb reads every line into the same buffer, and a line that ends inside
+		# a bracket is read on into what is left of the lines before it
+		self.buffer = bytearray(LINE_LEN + 1)
+		# evalb's stack of open brackets, which can go below zero, where it is
+		# read as zeros and kept from one line to the next
+		self.stack = {}
+
+	def error(self, report, line, message):
+		""" Records an error, raising EvalbAbort when there have been too many """
+		report.errors.append((line, message))
+		if len(report.errors) - 1 > self.params.max_error:
+			raise EvalbAbort(message)
+
+	def score(self, goldlines, testlines):
+		""" Scores lines of gold trees against lines of test trees, as read by read_lines,
+			and returns a Report """
+		report = Report(self.params)
+		out = [HEAD]
+		testlines = iter(testlines)
+		try:
+			line = 0
+			for line, goldline in enumerate(goldlines, start=1):
+				status = [OK]
+				gold = self.read_line(goldline, report, line, status)
+				testline = next(testlines, None)
+				if testline is None:
+					status[0] = ERROR
+					self.error(report, line, "Number of lines unmatch (too many lines in gold file)")
+					break
+				test = self.read_line(testline, report, line, status)
+				result = self.calc_result(gold, test, report, line, status[0])
+				self.add_totals(report, result)
+				report.sentences.append(result)
+				out.append(result.line())
+				if self.params.debug >= 1:
+					out.append(self.dsp_info(gold, test))
+			else:
+				line += 1
+			if next(testlines, None) is not None:
+				self.error(report, line, "Number of lines unmatch (too many lines in test file)")
+		except EvalbAbort:
+			report.aborted = True
+			report.output = b"".join(out)
+			return report
+		out.append(self.print_total(report))
+		report.output = b"".join(out)
+		return report
+
+	def read_line(self, buff, report, line, status):
+		""" Reads the terminals and brackets of a tree, like read_line in evalb.c """
+		self.buffer[len(buff)] = 0
+		self.buffer[:len(buff)] = buff
+		tokens = [(m.lastindex, m.group(m.lastindex - 1 if m.lastindex == 2 else m.lastindex), m.group(2)) for m in TOKEN.finditer(buff)]
+		if all(kind != OTHER for kind, label, word in tokens) and (not tokens or buff.rstrip().endswith(b")")):
+			return self.read_tokens(tokens, report, line, status)
+		# Anything evalb might complain about is read byte by byte, as evalb does
+		return self.read_bytes(report, line, status)
+
+	def read_tokens(self, tokens, report, line, status):
+		""" Reads a well-formed line from its tokens, with the same result as read_bytes """
+		parse = Parse()
+		terminals = parse.terminals
+		brackets = parse.brackets
+		delete_labels = self.delete_labels
+		delete_labels_for_length = self.params.delete_labels_for_length
+		stack = self.stack
+		ends = {}	# Ends set by evalb before the bracket is opened
+		top = 0
+		for kind, label, word in tokens:
+			if kind == TERMINAL:
+				if label not in delete_labels_for_length:
+					parse.length += 1
+				if label not in delete_labels:
+					terminals.append([word, label, UNDEFINED])
+			elif kind == OPEN:
+				brackets.append([len(terminals), ends.get(len(brackets), -1), label, UNDEFINED])
+				stack[top] = len(brackets) - 1
+				top += 1
+			else:
+				b = stack.get(top - 1, 0)
+				if top < 0:
+					status[0] = ERROR
+					self.error(report, line, "Bracketing unbalance (too many close bracket)")
+				top -= 1
+				if b < len(brackets):
+					brackets[b][1] = len(terminals)
+				else:
+					ends[b] = len(terminals)
+		if top != 0:
+			status[0] = ERROR
+			self.error(report, line, "Bracketing is unbalanced (too many open bracket)")
+		return parse
+
+	def read_bytes(self, report, line, status):
+		""" Reads the terminals and brackets of the tree in the buffer byte by byte.
+			As in evalb, a label or a word doesn't end at the end of the line. """
+		parse = Parse()
+		terminals = parse.terminals
+		brackets = parse.brackets
+		stack = self.stack
+		ends = {}	# Ends set by evalb before the bracket is opened
+		top = 0
+		buff = bytes(self.buffer)
+		n = len(buff)
+		p = 0
+		while p < n and buff[p] != 0:
+			c = buff[p]
+			if c in SPACE:
+				p += 1
+			elif c == 40:	# (
+				p += 1
+				start = p
+				while p < n and buff[p] not in TERMINATOR:
+					p += 1
+				label = buff[start:p].split(b"\0", 1)[0]	# C strings end at the first NUL
+				if p < n and buff[p] in SPACE:
+					q = p + 1
+					while q < n and buff[q] in SPACE:
+						q += 1
+					start = q
+					while q < n and buff[q] not in TERMINATOR:
+						q += 1
+					word = buff[start:q].split(b"\0", 1)[0]
+					closed = q < n and buff[q] == 41	# )
+					if closed:
+						if label not in self.params.delete_labels_for_length:
+							parse.length += 1
+						if label not in self.delete_labels:
+							terminals.append([word, label, UNDEFINED])
+						p = q + 1
+						continue
+					if not (q < n and buff[q] == 40):
+						status[0] = ERROR
+						self.error(report, line, "More than two elements in a bracket")
+				# Non-terminal
+				brackets.append([len(terminals), ends.get(len(brackets), -1), label, UNDEFINED])
+				stack[top] = len(brackets) - 1
+				top += 1
+			elif c == 41:	# )
+				b = stack.get(top - 1, 0)
+				if top < 0:
+					status[0] = ERROR
+					self.error(report, line, "Bracketing unbalance (too many close bracket)")
+				top -= 1
+				if b < len(brackets):
+					brackets[b][1] = len(terminals)
+				else:
+					ends[b] = len(terminals)
+				p += 1
+			else:
+				# evalb doesn't move past the character and stops after too many errors
+				while True:
+					status[0] = ERROR
+					self.error(report, line, "Reading sentence")
+		if top != 0:
+			status[0] = ERROR
+			self.error(report, line, "Bracketing is unbalanced (too many open bracket)")
+		return parse
+
+	def calc_result(self, gold, test, report, line, status):
+		""" Compares two parsed trees, like calc_result in evalb.c """
+		params = self.params
+		terminals1, terminals2 = gold.terminals, test.terminals
+		wn1, wn2 = len(terminals1), len(terminals2)
+
+		if wn2 == 0:
+			return SentenceResult(line, gold.length, SKIP, 0, 0, 0, 0, 0, 0, gold, test)
+		if wn1 != wn2:
+			self.error(report, line, "Length unmatch ({}|{})".format(wn1, wn2))
+			return SentenceResult(line, gold.length, ERROR, 0, 0, 0, 0, 0, 0, gold, test)
+		if [t[0] for t in terminals1] != [t[0] for t in terminals2]:
+			for t1, t2 in zip(terminals1, terminals2):
+				if not params.word_comp(t1[0], t2[0]):
+					self.error(report, line, "Words unmatch ({}|{})".format(
+						t1[0].decode("utf-8", "replace"), t2[0].decode("utf-8", "replace")))
+					return SentenceResult(line, gold.length, ERROR, 0, 0, 0, 0, 0, 0, gold, test)
+
+		self.massage(gold.brackets)
+		self.massage(test.brackets)
+		brackets1 = [b for b in gold.brackets if b[3] != DELETED]
+		brackets2 = [b for b in test.brackets if b[3] != DELETED]
+
+		# Each gold bracket matches the first unmatched test bracket with the same span and label
+		spans2 = {}
+		for b2 in brackets2:
+			spans2.setdefault((b2[0], b2[1]), []).append(b2)
+		match = 0
+		for b1 in brackets1:
+			for b2 in spans2.get((b1[0], b1[1]), ()):
+				if b2[3] == UNMATCHED and (params.labeled == 0 or params.label_comp(b1[2], b2[2])):
+					b1[3] = b2[3] = MATCHED
+					match += 1
+					break
+
+		# Test brackets crossing a gold bracket. Brackets over a single word never cross.
+		crossing = 0
+		spans1 = [(b1[0], b1[1]) for b1 in brackets1 if b1[1] - b1[0] > 1]
+		for b2 in brackets2:
+			s2, e2 = b2[0], b2[1]
+			if e2 - s2 > 1 and any(s1 < s2 < e1 < e2 or s2 < s1 < e2 < e1 for s1, e1 in spans1):
+				crossing += 1
+
+		correct = 0
+		eq_labels = params.eq_labels
+		for t1, t2 in zip(terminals1, terminals2):
+			if t1[1] == t2[1] or (t1[1], t2[1]) in eq_labels:
+				t1[2] = t2[2] = MATCHED
+				correct += 1
+			else:
+				t1[2] = t2[2] = UNMATCHED
+
+		return SentenceResult(line, gold.length, status, match, len(brackets1), len(brackets2), crossing, wn1, correct, gold, test)
+
+	def massage(self, brackets):
+		""" Cuts phrase labels and marks empty and deleted brackets, like massage_data in evalb.c """
+		modified = self.modified
+		for b in brackets:
+			if b[0] == b[1]:
+				b[3] = DELETED
+				continue
+			label = modified.get(b[2])
+			if label is None:
+				label = modified[b[2]] = modify_label(b[2])
+			b[2] = label
+			b[3] = DELETED if label in self.deleted else UNMATCHED
+
+	def add_totals(self, report, result):
+		params = self.params
+		args = (result.status, result.words, result.goldbrackets, result.testbrackets, result.matched, result.crossing, result.correcttags)
+		report.total.add(*args)
+		if result.length <= params.cutoff_len:
+			report.cutoff.add(*args)
+
+	def dsp_info(self, gold, test):
+		""" Returns the terminals and brackets of a sentence, like dsp_info in evalb.c """
+		terminals1, terminals2 = gold.terminals, test.terminals
+		brackets1, brackets2 = gold.brackets, test.brackets
+		out = [
+			b"-<1>---(wn1=%3d, bn1=%3d)-           " % (len(terminals1), len(brackets1)),
+			b"-<2>---(wn2=%3d, bn2=%3d)-\n" % (len(terminals2), len(brackets2)),
+		]
+		for i in range(max(len(terminals1), len(terminals2))):
+			if i < len(terminals1) and terminals1[i][0]:
+				word, label, result = terminals1[i]
+				out.append(b"%3d : %d : %-6s  %-16s      " % (i, result, label, word))
+			else:
+				out.append(b" " * 40)
+			if i < len(terminals2) and terminals2[i][0]:
+				word, label, result = terminals2[i]
+				out.append(b"%3d : %d : %-6s  %-16s\n" % (i, result, label, word))
+			else:
+				out.append(b"\n")
+		out.append(b"\n")
+		for i in range(max(len(brackets1), len(brackets2))):
+			if i < len(brackets1):
+				start, end, label, result = brackets1[i]
+				out.append(b"%3d : %d : %3d  %3d  %-6s      " % (i, result, start, end, label))
+			else:
+				out.append(b" " * 32)
+			if i < len(brackets2):
+				start, end, label, result = brackets2[i]
+				out.append(b"%3d : %d : %3d  %3d  %-6s\n" % (i, result, start, end, label))
+			else:
+				out.append(b"\n")
+		out.append(b"\n========\n")
+		return b"".join(out)
+
+	def print_total(self, report):
+		""" Returns the totals and summary of a report, like print_total in evalb.c """
+		total = report.total
+		out = [b"============================================================================\n"]
+		if total.goldbrackets > 0 and total.testbrackets > 0:
+			out.append(b"                %6.2f %6.2f %6d %5d %5d  %5d" % (
+				100.0 * total.matched / total.goldbrackets,
+				100.0 * total.matched / total.testbrackets,
+				total.matched,
+				total.goldbrackets,
+				total.testbrackets,
+				total.crossing,
+			))
+		out.append(b"  %5d %5d   %6.2f" % (
+			total.words,
+			total.correcttags,
+			100.0 * total.correcttags / total.words if total.words > 0 else 0.0,
+		))
+		out.append(b"\n=== Summary ===\n")
+		out.append(total.block(b"All"))
+		out.append(report.cutoff.block(b"len<=%d" % self.params.cutoff_len))
+		return b"".join(out)
+
+def score_files(pgold, ptest, params):
+	""" Scores a file of gold trees against a file of test trees and returns a Report """
+	scorer = Scorer(params)
+	return scorer.score(read_lines(pgold.read_bytes()), read_lines(ptest.read_bytes()))
+
+def output_lines(output):
+	""" Returns the lines of an evalb report after its head, with the lines of the
+		sentences first """
+	return output[len(HEAD):].splitlines(keepends=True) if output.startswith(HEAD) else []
+
+def read_result(lines, pos, id, params):
+	""" Reads the line of a sentence at lines[pos] of an evalb report, numbered id,
+		followed by its terminals and brackets when DEBUG is 1 or more, which end
+		with a line of "=". Returns the SentenceResult and the position after it,
+		or None if there is no whole sentence at pos. """
+	if pos >= len(lines) or lines[pos].startswith(b"="):
+		return None
+	fields = lines[pos].split()
+	result = SentenceResult(id, int(fields[1]), int(fields[2]), int(fields[5]), int(fields[6]),
+		int(fields[7]), int(fields[8]), int(fields[9]), int(fields[10]), None, None)
+	pos += 1
+	if params.debug >= 1:
+		try:
+			pos = lines.index(b"========\n", pos) + 1
+		except ValueError:
+			return None
+	return result, pos
+
+def split_output(output, counts, params):
+	""" Splits the report of evalb run once on several files put one after another,
+		with counts[i] lines in file i, into the reports evalb writes for each file.
+		The sentences are numbered from 1 in each file and the totals are summed
+		again from the per-sentence lines. A file whose sentences aren't all in the
+		output, as when evalb stopped after too many errors, gets None. """
+	scorer = Scorer(params)
+	lines = output_lines(output)
+	pos = 0
+	reports = []
+	for count in counts:
+		report = Report(params)
+		out = [HEAD]
+		for id in range(1, count + 1):
+			read = read_result(lines, pos, id, params)
+			if read is None:
+				break
+			result, end = read
+			scorer.add_totals(report, result)
+			report.sentences.append(result)
+			out.append(result.line())
+			out.extend(lines[pos + 1:end])
+			pos = end
+		else:
+			out.append(scorer.print_total(report))
+			report.output = b"".join(out)
+			reports.append(report)
+			continue
+		# The output ends here
+		reports.extend([None] * (len(counts) - len(reports)))
+		break
+	return reports
+
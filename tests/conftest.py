@@ -0,0 +1,37 @@
+"""
+	Fixtures shared by the tests. The modules of the pipeline are imported
+	from the root of the repository, as the scripts import each other.
+
+	tests/data/gold/sample.br and tests/data/test/sample.br are a few
+	sentences of the devset with some changes, and tests/data/sample.rsl is
+	the report evalb writes for them with stillingar.prm:
+
+	evalb -p stillingar.prm tests/data/gold/sample.br tests/data/test/sample.br > tests/data/sample.rsl
+
+"""
+
+import pathlib
+import shutil
+import sys
+
+import pytest
+
+ROOT = pathlib.Path(__file__).absolute().parent.parent
+DATA = ROOT / "tests" / "data"
+
+sys.path.insert(0, str(ROOT))
+
+import scorer  # noqa: E402
+
+
+@pytest.fixture
+def params():
+	return scorer.Parameters.from_file(ROOT / "stillingar.prm")
+
+
+@pytest.fixture
+def sample(tmp_path):
+	""" A copy of the gold and test folders, which treebank.py writes its treebanks into """
+	for side in ("gold", "test"):
+		shutil.copytree(DATA / side, tmp_path / side)
+	return tmp_path
@@ -0,0 +1,158 @@
+import os
+import shutil
+
+import pytest
+
+import helpers
+import treefiles
+
+from conftest import DATA
+
+# Annotald files, with the bracketed files that the converters wrote for them before
+# they made all schemas in one pass; exclude has the general schema with exclude set
+ANNOTALD = DATA / "annotald"
+OUTPUTS = {"general": ("general", ".br"), "split": ("split", ".br"), "func": ("func", ".fbr")}
+
+# IceParser output, with the bracketed file written for it before it was divided into chunks
+ICEPARSER = DATA / "iceparser"
+
+
+def outputs(folder):
+	""" The outputs of annotald_to_general_multi for all schemas, in folders in folder """
+	result = {}
+	for schema, (name, suffix) in OUTPUTS.items():
+		(folder / name).mkdir(exist_ok=True)
+		result[schema] = (folder / name, suffix)
+	return result
+
+
+def assert_same_files(folder, expected):
+	names = sorted(p.name for p in expected.iterdir())
+	assert sorted(p.name for p in folder.iterdir() if not p.name.startswith(".")) == names
+	for name in names:
+		assert (folder / name).read_bytes() == (expected / name).read_bytes(), name
+
+
+def annotald_copy(folder):
+	""" Copies the Annotald files to folder """
+	folder.mkdir()
+	for pin in ANNOTALD.glob("*.gld"):
+		shutil.copy(pin, folder)
+	return folder
+
+
+def transformed(capsys):
+	""" The files reported as transformed since the last call """
+	return sorted(line.split(": ")[1] for line in capsys.readouterr().out.splitlines() if line.startswith("Transforming file: "))
+
+
+def test_all_schemas_in_one_pass(tmp_path):
+	assert not helpers.annotald_to_general_multi(ANNOTALD, outputs(tmp_path), ".gld")
+	for name, suffix in OUTPUTS.values():
+		assert_same_files(tmp_path / name, ANNOTALD / name)
+
+
+def test_exclude(tmp_path):
+	(tmp_path / "exclude").mkdir()
+	helpers.annotald_to_general(ANNOTALD, tmp_path / "exclude", ".gld", ".br", exclude=True)
+	assert_same_files(tmp_path / "exclude", ANNOTALD / "exclude")
+
+
+def test_only_changed_files_are_transformed(tmp_path, capsys):
+	infolder = annotald_copy(tmp_path / "in")
+	out = outputs(tmp_path)
+
+	def run(**kwargs):
+		helpers.annotald_to_general_multi(infolder, out, ".gld", **kwargs)
+		return transformed(capsys)
+
+	assert run() == ["sample_1.gld", "sample_2.gld"]
+	assert run() == []
+	# Touched but not changed
+	stat = (infolder / "sample_1.gld").stat()
+	os.utime(infolder / "sample_1.gld", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+	assert run() == []
+	pin = infolder / "sample_2.gld"
+	pin.write_text(pin.read_text(encoding="utf-8").rsplit("\n\n", 1)[0] + "\n", encoding="utf-8")
+	assert run() == ["sample_2.gld"]
+	assert (tmp_path / "general" / "sample_2.br").read_text(encoding="utf-8") == "".join(
+		(ANNOTALD / "general" / "sample_2.br").read_text(encoding="utf-8").splitlines(keepends=True)[:-1]
+	)
+	(tmp_path / "split" / "sample_1.br").unlink()
+	assert run() == ["sample_1.gld"]
+	assert (tmp_path / "split" / "sample_1.br").read_bytes() == (ANNOTALD / "split" / "sample_1.br").read_bytes()
+	assert run(exclude=True) == ["sample_1.gld", "sample_2.gld"]
+	assert run(exclude=True, overwrite=True) == ["sample_1.gld", "sample_2.gld"]
+
+
+def test_failed_file_leaves_no_output(tmp_path):
+	infolder = annotald_copy(tmp_path / "in")
+	# A tree that converts and one that doesn't
+	(infolder / "broken.gld").write_text(
+		(ANNOTALD / "sample_1.gld").read_text(encoding="utf-8").split("\n\n")[0] + "\n\n( (S0 (BOGUS (no_kk x (lemma x)))))\n",
+		encoding="utf-8",
+	)
+	errors = helpers.annotald_to_general_multi(infolder, outputs(tmp_path), ".gld")
+	assert [name for name, error in errors] == ["broken.gld"]
+	for name, suffix in OUTPUTS.values():
+		assert_same_files(tmp_path / name, ANNOTALD / name)
+
+
+def test_whole_text(tmp_path):
+	""" general_clean_multi returns what the converters write """
+	trees = treefiles.read_annotald(ANNOTALD / "sample_1.gld")
+	texts = helpers.general_clean_multi(trees)
+	for schema, (name, suffix) in OUTPUTS.items():
+		assert texts[schema] == (ANNOTALD / name / ("sample_1" + suffix)).read_text(encoding="utf-8")
+
+
+def test_schemas_alone_and_together():
+	trees = treefiles.read_annotald(ANNOTALD / "sample_1.gld") + treefiles.read_annotald(ANNOTALD / "sample_2.gld")
+	together = helpers.general_clean_multi(trees)
+	# Again, with the memoized tokens and label tables filled
+	assert helpers.general_clean_multi(trees) == together
+	for schema in helpers.SCHEMAS:
+		assert helpers.general_clean_multi(trees, (schema,)) == {schema: together[schema]}
+
+
+def test_annotald_token():
+	assert helpers.annotald_token("(NP-SUBJ") == (helpers.OPEN, "(NP-SUBJ", 0)
+	assert helpers.annotald_token("dagur)))") == (helpers.CLOSE, "dagur", 3)
+	assert helpers.annotald_token("\\(") == (helpers.WORD, "&#40;", 0)
+	assert helpers.annotald_token("\\))") == (helpers.CLOSE, "&#41;", 1)
+	assert helpers.annotald_token("(META") == (helpers.SKIPLINE, "(META", 0)
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_iceparser(tmp_path, jobs):
+	helpers.icenlp_to_general(ICEPARSER / "sample.parsed", tmp_path, jobs=jobs)
+	assert (tmp_path / "sample.br").read_bytes() == (ICEPARSER / "sample.br").read_bytes()
+
+
+def test_iceparser_chunks():
+	pin = ICEPARSER / "sample.parsed"
+	whole = helpers.read_icenlp(pin)
+	for numchunks in range(1, 20):
+		chunks = helpers.icenlp_chunks(pin, numchunks)
+		assert [tree for chunk in chunks for tree in helpers.read_icenlp(pin, *chunk)] == whole, numchunks
+
+
+def test_lazy_conversion(tmp_path, capsys):
+	out = outputs(tmp_path)
+	lazy = helpers.LazyConversion(ANNOTALD, out, ".gld")
+	try:
+		assert lazy.files() == ["sample_1", "sample_2"]
+		lazy.request("sample_2")
+		assert lazy.get("sample_1") == {schema: folder / ("sample_1" + suffix) for schema, (folder, suffix) in out.items()}
+		lazy.get("sample_2")
+	finally:
+		lazy.close()
+	assert transformed(capsys) == ["sample_1.gld", "sample_2.gld"]
+	for name, suffix in OUTPUTS.values():
+		assert_same_files(tmp_path / name, ANNOTALD / name)
+	# The same manifests as annotald_to_general_multi, so nothing is transformed again
+	helpers.annotald_to_general_multi(ANNOTALD, out, ".gld")
+	lazy = helpers.LazyConversion(ANNOTALD, out, ".gld")
+	lazy.get("sample_1")
+	lazy.close()
+	assert transformed(capsys) == []
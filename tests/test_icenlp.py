@@ -0,0 +1,91 @@
+import re
+import sys
+
+import pytest
+
+import helpers
+
+# Stand-ins for icetagger.sh and iceparser.sh. The tagger tags each token as x and,
+# like the real tools may, holds its output back until the end of its input; the
+# parser brackets each tagged line as it comes in.
+TAGGER = r"""
+import re, sys
+lines = [" ".join(token + " x" for token in re.findall(r"\w+|[^\w\s]", line)) for line in sys.stdin]
+sys.stdout.write("".join(line + "\n" for line in lines))
+"""
+PARSER = r"""
+import sys
+for line in sys.stdin:
+	print("[S " + line.strip() + " S]", flush=True)
+"""
+FAILING = r"""
+import sys
+sys.stdin.read()
+sys.exit(3)
+"""
+
+
+def tool(folder, script, code):
+	""" Writes code as an executable script folder/script for the Python running the tests """
+	folder.mkdir(exist_ok=True)
+	ptool = folder / script
+	ptool.write_text("#!{}\n{}".format(sys.executable, code), encoding="utf-8")
+	ptool.chmod(0o755)
+	return folder
+
+
+@pytest.fixture
+def tools(tmp_path, monkeypatch):
+	monkeypatch.setattr(helpers, "TAGFOLDER", tool(tmp_path / "icetagger", helpers.TAGGER, TAGGER))
+	monkeypatch.setattr(helpers, "IPFOLDER", tool(tmp_path / "iceparser", helpers.ICEPARSER, PARSER))
+	return tmp_path
+
+
+def fake_parse(line):
+	""" What the fake tools give for a sentence """
+	line = line.replace(helpers.ICENLP_MARK, helpers.ICENLP_MARK.lower())
+	return "[S " + " ".join(token + " x" for token in re.findall(r"\w+|[^\w\s]", line)) + " S]"
+
+
+def test_documents_containing_the_mark(tools):
+	documents = [
+		("a", ["Hún kom."]),
+		("b", ["Orðið ICENLPSKIL er hér.", "Og ICENLPSKIL."]),
+		("c", ["ICENLPSKIL"]),
+		("d", []),
+		("e", ["Veður"]),
+	]
+	with helpers.IceNLPProcess(helpers.TAGFOLDER, helpers.TAGGER, []) as tagger:
+		output = list(tagger.stream(documents))
+	assert [key for key, lines in output] == ["a", "b", "c", "d", "e"]
+	assert output[1][1] == ["Orðið x icenlpskil x er x hér x . x", "Og x icenlpskil x . x"]
+	assert output[2][1] == ["icenlpskil x"]
+	assert output[3][1] == []
+
+
+def test_tool_failing(tools):
+	tool(tools / "icetagger", helpers.TAGGER, FAILING)
+	with helpers.IceNLPProcess(helpers.TAGFOLDER, helpers.TAGGER, []) as tagger:
+		with pytest.raises(RuntimeError, match="exit code 3"):
+			list(tagger.stream([("a", ["Hún kom."])]))
+
+
+def test_get_icenlpparse(tools, monkeypatch):
+	texts = {
+		"a.txt": "Hún kom.\n\nVeður er gott í dag.\n",
+		"b.txt": "Og ICENLPSKIL.\n",
+		"c.txt": "\n",
+	}
+	(tools / "text").mkdir()
+	for name, text in texts.items():
+		(tools / "text" / name).write_text(text, encoding="utf-8")
+	cache = tools / "cache.sqlite"
+	for out in ("out", "cached"):
+		(tools / out).mkdir()
+		helpers.get_icenlpparse(tools / "text", tools / out, cache=cache)
+		# The second run finds every sentence in the cache and doesn't start the tools
+		monkeypatch.setattr(helpers, "iceparse", None)
+	for name, text in texts.items():
+		expected = "".join(fake_parse(line) + "\n" for line in text.splitlines() if line.strip())
+		for out in ("out", "cached"):
+			assert (tools / out / name.replace(".txt", ".psd")).read_text(encoding="utf-8") == expected, (out, name)
@@ -0,0 +1,32 @@
+import copy
+
+import matching
+import scorer
+import treebank
+
+from conftest import DATA
+from test_scorer import SAMPLE
+
+
+def test_matcher_scores_as_evalb(sample, params):
+	gold = treebank.load_treebank(sample / "gold", ".br")
+	test = treebank.load_treebank(sample / "test", ".br")
+	scores = matching.Matcher(gold, test).score(params)
+	assert len(scores) == 15
+	summary = scores.summary()
+	for name, value in SAMPLE.items():
+		assert abs(summary[name] - value) < 1e-9, name
+
+
+def test_sweep(sample, params):
+	gold = treebank.load_treebank(sample / "gold", ".br")
+	test = treebank.load_treebank(sample / "test", ".br")
+	matcher = matching.Matcher(gold, test)
+	first, unlabeled = matching.sweep(matcher, params, [[], [("LABELED", b"0")]])
+	assert vars(first.totals()) == vars(matcher.score(params).totals())
+	# The same as the scorer with the setting in the parameter file
+	variant = copy.deepcopy(params)
+	variant.set("LABELED", b"0")
+	report = scorer.score_files(DATA / "gold" / "sample.br", DATA / "test" / "sample.br", variant)
+	assert vars(unlabeled.totals()) == vars(report.total)
+	assert unlabeled.summary()["recall"] > first.summary()["recall"]
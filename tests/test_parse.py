@@ -0,0 +1,83 @@
+import os
+import shutil
+import signal
+import time
+
+import pytest
+
+import helpers
+
+from conftest import DATA
+
+# Lines to parse and the trees written for them. sample.psd was written by
+# parse_text_file with Greynir 3.9.0 and tokenizer 3.6.4, and annoparse hasn't
+# been run on it; where annoparse is installed, test_same_as_annoparse checks it
+# and sample.psd should then be written again with
+# annoparse -i tests/data/annoparse/sample.txt -o tests/data/annoparse/sample.psd -s
+ANNOPARSE = DATA / "annoparse"
+
+
+def test_parse_text_file(tmp_path):
+	pout = tmp_path / "sample.psd"
+	trees = helpers.parse_text_file(ANNOPARSE / "sample.txt", pout)
+	assert pout.read_bytes() == (ANNOPARSE / "sample.psd").read_bytes()
+	# The trees of each non-empty line, for the parse cache, two for the line of two sentences
+	assert [len(trees[i]) for i in range(4)] == [1, 1, 2, 1]
+
+
+@pytest.mark.skipif(shutil.which(helpers.ANNOPARSE) is None, reason="annoparse is not installed")
+def test_same_as_annoparse(tmp_path):
+	(tmp_path / "annoparse").mkdir()
+	(tmp_path / "greynir").mkdir()
+	helpers.annoparse_file(ANNOPARSE / "sample.txt", tmp_path / "annoparse" / "sample.psd")
+	helpers.parse_text_file(ANNOPARSE / "sample.txt", tmp_path / "greynir" / "sample.psd")
+	assert (tmp_path / "greynir" / "sample.psd").read_bytes() == (tmp_path / "annoparse" / "sample.psd").read_bytes()
+
+
+def fake_parse_lines(lines):
+	""" Stands in for helpers.parse_lines in the child of TimedParser: "hægt" takes an hour,
+		"hrun" stops the process and "merki" is killed by a signal """
+	for line in lines:
+		if line.startswith("hægt"):
+			time.sleep(3600)
+		elif line.startswith("hrun"):
+			os._exit(7)
+		elif line.startswith("merki"):
+			os.kill(os.getpid(), signal.SIGKILL)
+		yield ["  (S0\n    (x {}))".format(line)]
+
+
+@pytest.fixture
+def fake_greynir(monkeypatch):
+	monkeypatch.setattr(helpers, "load_greynir", lambda: None)
+	monkeypatch.setattr(helpers, "parse_lines", fake_parse_lines)
+	yield
+	helpers.close_timed_parser()
+
+
+def test_timed_parser(fake_greynir):
+	parser = helpers.TimedParser(timeout=0.5)
+	try:
+		parsed = list(parser.parse_lines(["a", "hægt", "b", "hrun", "merki", "c"]))
+	finally:
+		parser.close()
+	assert parsed[0] == ["  (S0\n    (x a))"] and parsed[2] == ["  (S0\n    (x b))"] and parsed[5] == ["  (S0\n    (x c))"]
+	assert parsed[1] is None
+	assert [parsed[3].exitcode, parsed[4].exitcode] == [7, -signal.SIGKILL]
+
+
+def test_timeouts_and_crashes_are_written_as_s0x(fake_greynir, tmp_path):
+	ptext = tmp_path / "texti.txt"
+	ptext.write_text("Fyrsta.\nhægt og rólega.\nhrun (hér)\n\nSíðasta.\n", encoding="utf-8")
+	pout = tmp_path / "texti.psd"
+	trees = helpers.parse_text_file(ptext, pout, timeout=0.5)
+	# Only the parsed lines go into the parse cache
+	assert sorted(trees) == [0, 3]
+	assert pout.read_text(encoding="utf-8") == (
+		"( (META (ID-LOCAL texti.psd,.1))\n  (S0\n    (x Fyrsta.)))\n\n"
+		"( (META (ID-LOCAL texti.psd,.2))\n  (S0-X\n    (x hægt)\n    (x og)\n    (x rólega)\n    (grm .)))\n\n"
+		"( (META (ID-LOCAL texti.psd,.3))\n  (S0-X\n    (x hrun)\n    (grm \\()\n    (x hér)\n    (grm \\))))\n\n"
+		"( (META (ID-LOCAL texti.psd,.4))\n  (S0\n    (x Síðasta.)))\n\n"
+	)
+	assert (tmp_path / helpers.TIMEOUT_LOG).read_text(encoding="utf-8") == "texti.psd\t2\t4\t15\thægt og rólega.\n"
+	assert (tmp_path / helpers.CRASH_LOG).read_text(encoding="utf-8") == "texti.psd\t3\t7\thrun (hér)\n"
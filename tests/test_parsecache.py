@@ -0,0 +1,32 @@
+import itertools
+
+import parsecache
+
+
+def test_lookup_and_put(tmp_path):
+	with parsecache.ParseCache(tmp_path / "cache.sqlite", "Greynir 1.0") as cache:
+		assert cache.lookup(["Hún kom.", "Veður"]) == [None, None]
+		cache.put("Hún kom.", ["(S0 (S (IP (NP-SUBJ (n Hún)) (VP (s kom)))) (p .))"])
+		# Found under the normalized text
+		assert cache.lookup(["Hún  kom. ", "Veður"]) == [["(S0 (S (IP (NP-SUBJ (n Hún)) (VP (s kom)))) (p .))"], None]
+		assert (cache.hits, cache.lookups) == (1, 4)
+		assert cache.summary() == "Parse cache: 1 of 4 sentences found (25.00%)"
+	# Kept between runs, but not for another parser
+	with parsecache.ParseCache(tmp_path / "cache.sqlite", "Greynir 1.0") as cache:
+		assert cache.lookup(["Hún kom."]) == [["(S0 (S (IP (NP-SUBJ (n Hún)) (VP (s kom)))) (p .))"]]
+	with parsecache.ParseCache(tmp_path / "cache.sqlite", "Greynir 2.0") as cache:
+		assert cache.lookup(["Hún kom."]) == [None]
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+	clock = itertools.count(1)
+	monkeypatch.setattr(parsecache.time, "time_ns", lambda: next(clock))
+	# Each parse is 5 bytes as json
+	with parsecache.ParseCache(tmp_path / "cache.sqlite", "Greynir 1.0", maxbytes=15) as cache:
+		for sentence in ("a", "b", "c", "d", "e"):
+			cache.put(sentence, "(" + sentence + ")")
+		cache.lookup(["a", "c"])
+		assert cache.evict() == 2
+		# a and c were looked up after e was put, b and d are the oldest
+		assert cache.lookup(["a", "b", "c", "d", "e"]) == ["(a)", None, "(c)", None, "(e)"]
+		assert cache.evict() == 0
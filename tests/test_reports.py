@@ -0,0 +1,64 @@
+import helpers
+import scorer
+
+from conftest import DATA, ROOT
+
+
+def compare(folder, files, monkeypatch):
+	""" Writes the gold and test trees of files, a dict of name -> (gold lines, test lines),
+		scores them with the built-in scorer and combines the reports. Returns the text
+		of allresults.out. """
+	monkeypatch.setattr(helpers, "EVALBPARAMS", ROOT / "stillingar.prm")
+	for side in ("gold", "test", "reports"):
+		(folder / side).mkdir()
+	for name, (gold, test) in files.items():
+		(folder / "gold" / (name + ".br")).write_text("".join(gold), encoding="utf-8")
+		(folder / "test" / (name + ".br")).write_text("".join(test), encoding="utf-8")
+	helpers.get_results(folder / "gold", folder / "test", folder / "reports", [(".br", ".br", ".out")], builtin=True)
+	helpers.combine_reports(folder / "reports", [".out"])
+	return (folder / "reports" / "allresults.out").read_text(encoding="utf-8")
+
+
+def sample_lines(side):
+	with (DATA / side / "sample.br").open(encoding="utf-8") as f:
+		return f.readlines()
+
+
+def sentence_block(text, name, id):
+	""" Returns the line of sentence id of the report name in the per-sentence results,
+		with the lines of the phrases found only in the gold or test tree after it """
+	lines = text[text.index(name + "\n"):].splitlines()
+	start = next(i for i, line in enumerate(lines) if line.startswith("\t{}\t".format(id)))
+	end = next(i for i in range(start + 1, len(lines)) if not lines[i].startswith("\t\t"))
+	return [line.split() for line in lines[start:end]]
+
+
+def test_phrase_differences(tmp_path, monkeypatch):
+	gold, test = sample_lines("gold"), sample_lines("test")
+	text = compare(tmp_path, {
+		"news_1": (gold[:7], test[:7]),
+		# A phrase twice in the gold tree and once in the test tree is listed once
+		"unary_1": (["(S0 (S (NP (NP (n Veður)))))\n"], ["(S0 (S (NP (n Veður))))\n"]),
+	}, monkeypatch)
+	assert sentence_block(text, "news_1.out", 1) == [["1", "100.00", "100.00", "100.00", "3.00", "100.00"]]
+	assert sentence_block(text, "news_1.out", 7)[1:] == [["VP", "0-3", "NP", "1-2"], ["NP", "1-3", "NP", "2-3"]]
+	assert sentence_block(text, "unary_1.out", 1)[1:] == [["NP", "0-1"]]
+
+
+def test_genres_are_micro_averaged(tmp_path, monkeypatch, params):
+	gold, test = sample_lines("gold"), sample_lines("test")
+	text = compare(tmp_path, {"news_1": (gold[:7], test[:7]), "blog_1": (gold[7:], test[7:])}, monkeypatch)
+	blocks = text.split("\n\n\t\n\n")
+	assert blocks[1].lstrip().startswith("blog\n") and blocks[2].lstrip().startswith("news\n")
+	files = [
+		(DATA / "gold" / "sample.br", DATA / "test" / "sample.br"),
+		(tmp_path / "gold" / "blog_1.br", tmp_path / "test" / "blog_1.br"),
+		(tmp_path / "gold" / "news_1.br", tmp_path / "test" / "news_1.br"),
+	]
+	for block, (pgold, ptest) in zip(blocks, files):
+		summary = scorer.score_files(pgold, ptest, params).summary()
+		assert "Fjöldi setninga: {}\n".format(summary["sentences"]) in block
+		for name, value in (("Recall", "recall"), ("Precision", "precision"), ("Fskor", "fmeasure")):
+			assert "{}: {:.2f}\n".format(name, summary[value]) in block
+	# Summed over the sentences of both genres, not averaged over them
+	assert "Recall: 90.28\n" in blocks[0]
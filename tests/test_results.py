@@ -0,0 +1,30 @@
+import numpy as np
+
+import results
+import scorer
+
+from conftest import DATA
+
+
+def test_report_and_scorer_agree(params):
+	report = scorer.score_files(DATA / "gold" / "sample.br", DATA / "test" / "sample.br", params)
+	fromscorer = results.report_results("sample.rsl", report)
+	fromtext = results.read_report("sample.rsl", (DATA / "sample.rsl").read_bytes(), params)
+	# The labels are numbered differently, -1 is no label
+	labels = np.array(fromscorer.labels + [None], dtype=object)
+	otherlabels = np.array(fromtext.labels + [None], dtype=object)
+	for name in results.ARRAYS:
+		if name.endswith(("_tag", "_label")):
+			assert labels[fromscorer[name]].tolist() == otherlabels[fromtext[name]].tolist(), name
+		else:
+			assert np.array_equal(fromscorer[name], fromtext[name]), name
+	assert vars(fromtext.totals()) == vars(report.total)
+
+
+def test_bracket_counts(params):
+	part = results.read_report("sample.rsl", (DATA / "sample.rsl").read_bytes(), params)
+	counts = results.Results.concatenate([part, part]).bracket_counts()
+	assert counts.shape == (30, 3)
+	assert counts.sum(axis=0).tolist() == [130, 144, 142]
+	# The error and the skipped sentence
+	assert not counts[11].any() and not counts[12].any()
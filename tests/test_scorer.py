@@ -0,0 +1,69 @@
+import scorer
+
+from conftest import DATA
+
+SAMPLE = {
+	"sentences": 15,
+	"errors": 1,
+	"skipped": 1,
+	"valid": 13,
+	"recall": 65 / 72 * 100,
+	"precision": 65 / 71 * 100,
+	"complete": 9 / 13 * 100,
+	"crossing": 1 / 13,
+	"nocrossing": 12 / 13 * 100,
+	"twocrossing": 100.0,
+	"tagging": 41 / 42 * 100,
+}
+
+
+def score_sample(params):
+	return scorer.score_files(DATA / "gold" / "sample.br", DATA / "test" / "sample.br", params)
+
+
+def test_report_is_the_same_as_evalb(params):
+	report = score_sample(params)
+	assert report.output == (DATA / "sample.rsl").read_bytes()
+	assert report.errors == [(12, "Words unmatch (Hún|Hann)")]
+	assert not report.aborted
+
+
+def test_summary(params):
+	summary = score_sample(params).summary()
+	for name, value in SAMPLE.items():
+		assert abs(summary[name] - value) < 1e-9, name
+	assert round(summary["fmeasure"], 2) == 90.91
+
+
+def test_sentences(params):
+	report = score_sample(params)
+	assert [result.status for result in report.sentences] == [scorer.OK] * 11 + [scorer.ERROR, scorer.SKIP, scorer.OK, scorer.OK]
+	last = report.sentences[-1]
+	assert (last.matched, last.goldbrackets, last.testbrackets, last.crossing, last.words, last.correcttags) == (4, 7, 7, 1, 5, 4)
+
+
+def test_totals_merge(params):
+	report = score_sample(params)
+	args = [
+		(result.status, result.words, result.goldbrackets, result.testbrackets, result.matched, result.crossing, result.correcttags)
+		for result in report.sentences
+	]
+	parts = []
+	for start, end in ((0, 4), (4, 12), (12, 15)):
+		totals = scorer.Totals()
+		for a in args[start:end]:
+			totals.add(*a)
+		parts.append(totals)
+	merged = parts[0].merge(parts[1]).merge(parts[2])
+	assert vars(merged) == vars(report.total)
+	assert vars(parts[0].merge(parts[1].merge(parts[2]))) == vars(merged)
+	assert vars(scorer.Totals().merge(report.total)) == vars(report.total)
+
+
+def test_split_output(params):
+	""" The report of the sample twice over splits into two reports of the sample """
+	gold = (DATA / "gold" / "sample.br").read_bytes()
+	test = (DATA / "test" / "sample.br").read_bytes()
+	twice = scorer.Scorer(params).score(scorer.read_lines(gold * 2), scorer.read_lines(test * 2))
+	expected = (DATA / "sample.rsl").read_bytes()
+	assert [report.output for report in scorer.split_output(twice.output, [15, 15], params)] == [expected, expected]
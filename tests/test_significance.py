@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import significance
+
+# matched, gold and test brackets of the sentences of two parsers
+A = np.array([[4, 4, 4], [4, 6, 6], [5, 6, 5], [7, 8, 8], [0, 0, 0], [4, 7, 7], [6, 6, 6], [3, 5, 4], [9, 10, 11], [2, 4, 3]])
+B = np.array([[4, 4, 4], [3, 6, 5], [5, 6, 6], [7, 8, 8], [0, 0, 0], [3, 7, 6], [6, 6, 6], [3, 5, 4], [8, 10, 10], [2, 4, 4]])
+
+
+def test_scores():
+	recall, precision, fmeasure = significance.scores(A.sum(axis=0))
+	assert recall == pytest.approx(44 / 56 * 100)
+	assert precision == pytest.approx(44 / 54 * 100)
+	assert fmeasure == pytest.approx(80.0)
+	assert significance.scores([0, 0, 0]) == (0.0, 0.0, 0.0)
+
+
+def test_bootstrap_intervals():
+	intervals = significance.bootstrap_intervals(A, resamples=1000, seed=1)
+	assert intervals["recall"] == pytest.approx((67.44186046511628, 88.33514492753622))
+	assert intervals["precision"] == pytest.approx((71.4217032967033, 90.38690476190476))
+	assert intervals["fmeasure"] == pytest.approx((69.99757281553399, 88.69600280504908))
+	assert all(np.isnan(bound) for bounds in significance.bootstrap_intervals(A[:0]).values() for bound in bounds)
+
+
+def test_p_values():
+	assert significance.paired_bootstrap(A, B, resamples=1000, seed=1) == 4 / 1001
+	assert significance.approximate_randomization(A, B, resamples=1000, seed=1) == 73 / 1001
+	assert significance.paired_bootstrap(A, A, resamples=1000, seed=1) == 1.0
+	assert significance.approximate_randomization(A, A, resamples=1000, seed=1) == 1.0
+	with pytest.raises(ValueError):
+		significance.paired_bootstrap(A, B[1:])
+
+
+def test_blocks_dont_change_results(monkeypatch):
+	""" The resamples are the same however many are drawn at a time """
+	expected = (
+		significance.bootstrap_intervals(A, resamples=1000, seed=1),
+		significance.paired_bootstrap(A, B, resamples=1000, seed=1),
+		significance.approximate_randomization(A, B, resamples=1000, seed=1),
+	)
+	monkeypatch.setattr(significance, "BLOCK", 25)
+	assert (
+		significance.bootstrap_intervals(A, resamples=1000, seed=1),
+		significance.paired_bootstrap(A, B, resamples=1000, seed=1),
+		significance.approximate_randomization(A, B, resamples=1000, seed=1),
+	) == expected
@@ -0,0 +1,59 @@
+import annotald.util as util
+import pytest
+
+import treefiles
+
+TREES = (
+	"( (IP-MAT (NP-SBJ (PRO-N Hún)) (VBDI kom) (. .)) (ID 1))\n"
+	"\n"
+	"/*\n"
+	"Athugasemd\n"
+	"*/\n"
+	"( (IP-MAT (NP-SBJ (N-N Veður)) (. .)) (ID 2))\n"
+	"<+ parser mode +>\n"
+	"\n"
+	"  \n"
+	"\n"
+	"( (FRAG (NP (N-N Styrkir) (CONJ og) (NS-N sjóðir))) (ID 3))\n"
+	"\n"
+)
+
+TEXTS = {
+	"lf": TREES,
+	"crlf": TREES.replace("\n", "\r\n"),
+	"cr": TREES.replace("\n", "\r"),
+	"mixed": TREES.replace("\n\n", "\r\n\r\n", 1).replace("*/\n", "*/\r"),
+	"no final newline": TREES.rstrip("\n"),
+	"final cr": TREES.rstrip("\n") + "\r",
+	"whitespace only": "\n  \r\n",
+	"empty": "",
+}
+
+
+@pytest.fixture(params=TEXTS.values(), ids=TEXTS.keys())
+def treefile(request, tmp_path):
+	pin = tmp_path / "trees.psd"
+	pin.write_bytes(request.param.encode("utf-8"))
+	return pin
+
+
+def test_mmap_lines(treefile):
+	assert list(treefiles.mmap_lines(treefile)) == treefile.read_text(encoding="utf-8").split("\n")
+
+
+def test_iter_annotald_is_the_same_as_scrubtext(treefile):
+	""" The same trees as the converters got from the whole file before """
+	expected = util.scrubText(treefile.read_text(encoding="utf-8")).strip().split("\n\n")
+	assert list(treefiles.iter_annotald(treefile)) == expected
+
+
+def test_raw_trees(treefile):
+	expected = treefile.read_text(encoding="utf-8").split("\n\n")
+	assert list(treefiles.raw_trees(treefile, size=7)) == expected
+
+
+def test_unterminated_comment(tmp_path):
+	pin = tmp_path / "trees.psd"
+	pin.write_text("( (IP-MAT (VBDI kom)) (ID 1))\r\n/*\r\n", encoding="utf-8")
+	with pytest.raises(util.AnnotaldException):
+		list(treefiles.iter_annotald(pin))
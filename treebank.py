@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""
+	Compact array-backed treebank for bracketed files.
+
+	The converters in helpers.py write one bracketed tree per line, e.g.
+
+	(S0 (S (NP (n Styrkir) (C (c og)) (n sjóðir))))
+
+	A treebank holds all trees in a folder of such files (with a given suffix)
+	as flat NumPy arrays, so that scoring and searching don't have to parse
+	the text again on every run. Each constituent, phrase or preterminal,
+	is a node with a parent index, a label id and a token span [start, end).
+
+	The arrays are stored as .npy files in a directory next to the bracketed
+	files, ".treebank-br" for ".br" files, and are memory-mapped when loaded,
+	so loading a treebank reads almost nothing until the arrays are used.
+	A treebank is built by load_treebank the first time a stage asks for it
+	after the bracketed files have changed, not by the converters, so runs
+	that don't use it don't pay for it.
+
+	The treebank is read by matching.py and helpers.compare_systems only.
+	scorer.py and helpers.get_results read the bracketed text, as evalb must
+	see malformed lines as they are and the treebank mends unbalanced brackets.
+	treesearch.py reads the Annotald files, as it needs the full trees with
+	terminal variants and lemmas, which the general schema leaves out.
+
+	Arrays (ragged arrays are stored flat with offsets, like CSR matrices):
+		file_offsets	trees of file f are file_offsets[f]:file_offsets[f+1]
+		tree_offsets	nodes of tree t are tree_offsets[t]:tree_offsets[t+1]
+		token_offsets	tokens of tree t are token_offsets[t]:token_offsets[t+1]
+		parent	index of the parent node within its tree, -1 for the root
+		label	index into the labels vocabulary
+		start, end	token span of the node within its tree
+		tokens	index into the words vocabulary
+	Nodes are in preorder, so a parent always comes before its children.
+
+"""
+
+import array
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+# Increase when the layout of the arrays changes
+TREEBANK_VERSION = 2
+
+ARRAYS = ("file_offsets", "tree_offsets", "token_offsets", "parent", "label", "start", "end", "tokens")
+
+# An opening bracket with its label, which follows it directly, a closing bracket or a word
+BRACKET_TOKEN = re.compile(r"\([^\s()]*|\)|[^\s()]+")
+
+
+def treebank_path(folder, suffix):
+	""" Returns the path of the treebank for files with suffix in folder """
+	# Not ".treebank.br", which would look like a bracketed file when iterating over the folder
+	return folder / ".treebank-{}".format(suffix.lstrip("."))
+
+
+class TreebankBuilder:
+	""" Collects bracketed trees into the arrays of a Treebank. The numbers are
+		kept in typed arrays, not lists of Python ints, so a corpus takes about as
+		much memory while it is collected as the saved treebank. """
+
+	def __init__(self):
+		self.files = []
+		self.labels = {}
+		self.words = {}
+		self.file_offsets = array.array("q", [0])
+		self.tree_offsets = array.array("q", [0])
+		self.token_offsets = array.array("q", [0])
+		self.parent = array.array("i")
+		self.label = array.array("i")
+		self.start = array.array("i")
+		self.end = array.array("i")
+		self.tokens = array.array("i")
+
+	def add_file(self, name, lines):
+		""" Adds the trees of a bracketed file, one per line """
+		for line in lines:
+			self.add_tree(line)
+		self.files.append(name)
+		self.file_offsets.append(len(self.tree_offsets) - 1)
+
+	def add_tree(self, line):
+		""" Adds a single bracketed tree. Unbalanced trees are read as far as
+			they go, extra closing brackets are ignored and open phrases closed
+			at the end of the line. An empty line gives a tree without nodes.
+			As in evalb, a label directly follows its opening bracket, so
+			"( word)" is a preterminal with an empty label. """
+		first = len(self.parent)
+		numtokens = 0
+		open_nodes = []	# Stack of open node indices within the tree
+		for item in BRACKET_TOKEN.findall(line):
+			if item[0] == "(":
+				self.parent.append(open_nodes[-1] if open_nodes else -1)
+				self.label.append(self.labels.setdefault(item[1:], len(self.labels)))
+				self.start.append(numtokens)
+				self.end.append(numtokens)
+				open_nodes.append(len(self.parent) - 1 - first)
+			elif item == ")":
+				if open_nodes:
+					self.end[first + open_nodes.pop()] = numtokens
+			else:
+				self.tokens.append(self.words.setdefault(item, len(self.words)))
+				numtokens += 1
+		for node in open_nodes:
+			self.end[first + node] = numtokens
+		self.tree_offsets.append(len(self.parent))
+		self.token_offsets.append(len(self.tokens))
+
+	def build(self):
+		""" Returns the collected trees as a Treebank """
+		arrays = {
+			"file_offsets": np.array(self.file_offsets, dtype=np.int64),
+			"tree_offsets": np.array(self.tree_offsets, dtype=np.int64),
+			"token_offsets": np.array(self.token_offsets, dtype=np.int64),
+			"parent": np.array(self.parent, dtype=np.int32),
+			"label": np.array(self.label, dtype=np.int32),
+			"start": np.array(self.start, dtype=np.int32),
+			"end": np.array(self.end, dtype=np.int32),
+			"tokens": np.array(self.tokens, dtype=np.int32),
+		}
+		return Treebank(arrays, list(self.labels), list(self.words), self.files)
+
+
+class Treebank:
+	""" Trees of a folder of bracketed files as flat arrays, see the module docstring """
+
+	def __init__(self, arrays, labels, words, files, source=None):
+		for name in ARRAYS:
+			setattr(self, name, arrays[name])
+		self.labels = labels
+		self.words = words
+		self.files = files
+		self.source = source	# Stamp of the bracketed files, see source_stamp
+		self.label_ids = {label: i for i, label in enumerate(labels)}
+		self.file_ids = {name: i for i, name in enumerate(files)}
+
+	@classmethod
+	def from_folder(cls, folder, suffix):
+		""" Reads all files with suffix in folder, in sorted order """
+		builder = TreebankBuilder()
+		for p in source_files(folder, suffix):
+			with p.open() as lines:
+				builder.add_file(p.stem, (line.rstrip("\n") for line in lines))
+		tb = builder.build()
+		tb.source = source_stamp(folder, suffix)
+		return tb
+
+	@classmethod
+	def load(cls, path):
+		""" Loads a treebank saved with save(), with the arrays memory-mapped """
+		meta = json.loads((path / "meta.json").read_text())
+		if meta["version"] != TREEBANK_VERSION:
+			raise ValueError("Treebank {} has version {}, expected {}".format(path, meta["version"], TREEBANK_VERSION))
+		arrays = {name: np.load(path / (name + ".npy"), mmap_mode="r") for name in ARRAYS}
+		return cls(arrays, meta["labels"], meta["words"], meta["files"], meta["source"])
+
+	def save(self, path):
+		""" Saves the treebank as a directory of .npy files, replacing any earlier one """
+		tmp = path.with_name(path.name + ".tmp")
+		if tmp.exists():
+			shutil.rmtree(tmp)
+		tmp.mkdir()
+		for name in ARRAYS:
+			np.save(tmp / (name + ".npy"), getattr(self, name))
+		meta = {
+			"version": TREEBANK_VERSION,
+			"labels": self.labels,
+			"words": self.words,
+			"files": self.files,
+			"source": self.source,
+		}
+		(tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False))
+		if path.exists():
+			shutil.rmtree(path)
+		os.replace(tmp, path)
+
+	@property
+	def num_trees(self):
+		return len(self.tree_offsets) - 1
+
+	def file_trees(self, name):
+		""" Returns the range of tree indices in the file with the given stem """
+		f = self.file_ids[name]
+		return range(int(self.file_offsets[f]), int(self.file_offsets[f + 1]))
+
+	def nodes(self, t):
+		""" Returns the range of node indices of tree t """
+		return range(int(self.tree_offsets[t]), int(self.tree_offsets[t + 1]))
+
+	def words_of(self, t):
+		""" Returns the words of tree t """
+		return [self.words[w] for w in self.tokens[self.token_offsets[t]:self.token_offsets[t + 1]]]
+
+	def brackets(self, t):
+		""" Returns (label, start, end) for each node of tree t, in preorder """
+		nodes = self.nodes(t)
+		return [
+			(self.labels[label], int(start), int(end))
+			for label, start, end in zip(
+				self.label[nodes.start:nodes.stop],
+				self.start[nodes.start:nodes.stop],
+				self.end[nodes.start:nodes.stop],
+			)
+		]
+
+	def tree_of_node(self, nodes):
+		""" Returns the tree index of each of the given global node indices """
+		return np.searchsorted(self.tree_offsets, nodes, side="right") - 1
+
+	def trees_with_label(self, label):
+		""" Returns the indices of trees containing a node with the given label """
+		label_id = self.label_ids.get(label)
+		if label_id is None:
+			return np.zeros(0, dtype=np.int64)
+		return np.unique(self.tree_of_node(np.flatnonzero(self.label == label_id)))
+
+	def bracketed(self, t):
+		""" Returns tree t in bracketed form again """
+		nodes = self.nodes(t)
+		words = self.words_of(t)
+		parts = []
+		children = {}
+		for n in nodes:
+			p = int(self.parent[n])
+			children.setdefault(p, []).append(n - nodes.start)
+
+		def write(i):
+			n = nodes.start + i
+			parts.append("(" + self.labels[self.label[n]])
+			kids = children.get(i, [])
+			pos = int(self.start[n])
+			for k in kids:
+				kstart = int(self.start[nodes.start + k])
+				parts.extend(words[pos:kstart])
+				write(k)
+				pos = int(self.end[nodes.start + k])
+			parts.extend(words[pos:int(self.end[n])])
+			parts[-1] = parts[-1] + ")"
+
+		for root in children.get(-1, []):
+			write(root)
+		return " ".join(parts)
+
+
+def source_files(folder, suffix):
+	""" Returns the bracketed files with suffix in folder, sorted """
+	return sorted(p for p in folder.iterdir() if p.suffix == suffix and p.is_file())
+
+
+def source_stamp(folder, suffix):
+	""" Returns the names, sizes and modification times of the bracketed files,
+		to tell whether a saved treebank is still up to date """
+	stamp = []
+	for p in source_files(folder, suffix):
+		st = p.stat()
+		stamp.append([p.name, st.st_size, st.st_mtime_ns])
+	return stamp
+
+
+def build_treebank(folder, suffix):
+	""" Builds and saves the treebank for the files with suffix in folder """
+	tb = Treebank.from_folder(folder, suffix)
+	tb.save(treebank_path(folder, suffix))
+	return tb
+
+
+def load_treebank(folder, suffix):
+	""" Loads the treebank for the files with suffix in folder,
+		building it first if it's missing or the files have changed since it was built """
+	path = treebank_path(folder, suffix)
+	if path.exists():
+		try:
+			tb = Treebank.load(path)
+			if tb.source == source_stamp(folder, suffix):
+				return tb
+		except (ValueError, KeyError, OSError):
+			pass
+	return build_treebank(folder, suffix)
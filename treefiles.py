@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+	Readers for Annotald files that yield one tree at a time, so that memory use
+	follows the largest tree and not the size of the file, e.g. for the whole
+	GreynirCorpus dump as one .psd file.
+
+	iter_annotald gives the trees as annotald.util.scrubText and readTrees
+	would, which is how the converters in helpers.py read them. raw_trees gives
+	the text between empty lines as it is, as treesearch.py reads it.
+
+	Only the standard library and annotald.util are imported, so that
+	standalone tools don't pay for the imports of helpers.py.
+
+"""
+
+import mmap
+import os
+
+import annotald.util as util
+
+
+def raw_trees(pin, size=1 << 20):
+	""" Yields the trees of a text file one at a time, the same as
+		pin.read_text().split("\\n\\n"), reading size characters at a time """
+	with pin.open(encoding="utf-8") as f:
+		rest = ""
+		for chunk in iter(lambda: f.read(size), ""):
+			*trees, rest = (rest + chunk).split("\n\n")
+			yield from trees
+		yield rest
+
+
+def read_annotald(pin):
+	""" Reads an Annotald file and returns a list of its trees """
+	return list(iter_annotald(pin))
+
+
+def iter_annotald(pin):
+	""" Yields the trees in an Annotald file one at a time.
+		Gives the same trees as scrubText(pin.read_text()).strip().split("\\n\\n"),
+		like readTrees() in annotald.treedrawing, but the file is read through mmap and
+		scrubbed line by line, so memory use follows the largest tree, not the file size. """
+	held = None	# Latest tree with content, is stripped if it turns out to be the last one
+	blanks = []	# Whitespace-only trees after held
+	for tree in split_trees(scrubbed_lines(pin)):
+		if not tree.strip():
+			if held is not None:
+				blanks.append(tree)
+			continue
+		if held is None:
+			# First tree, whitespace at the start of the file is stripped
+			tree = tree.lstrip()
+		else:
+			yield held
+			yield from blanks
+			blanks = []
+		held = tree
+	if held is None:
+		# Nothing but whitespace, same as "".split("\n\n")
+		yield ""
+	else:
+		yield held.rstrip()
+
+
+def split_trees(lines):
+	""" Joins lines into trees separated by empty lines, as text.split("\\n\\n") would """
+	tree = []
+	for line in lines:
+		if not line and tree:
+			yield "\n".join(tree)
+			tree = []
+		else:
+			tree.append(line)
+	if tree:
+		yield "\n".join(tree)
+
+
+def scrubbed_lines(pin):
+	""" Yields the lines of an Annotald file through mmap, leaving out
+		comments and parser-mode lines as annotald.util.scrubText does """
+	comment = False
+	for line in mmap_lines(pin):
+		if line.startswith("/*") or line.startswith("/~*"):
+			comment = True
+		elif line.startswith("<+"):
+			# Ignore parser-mode comments
+			pass
+		elif not comment:
+			yield line
+		elif line.startswith("*/") or line.startswith("*~/"):
+			comment = False
+	if comment:
+		raise util.AnnotaldException("Unterminated comment in input file {}!".format(pin.name))
+
+
+def mmap_lines(pin):
+	""" Yields the lines of a UTF-8 text file without line endings, as
+		pin.read_text().split("\\n") would, including the empty line after a final newline.
+		Line endings are read as read_text() reads them, so "\\r\\n" and a lone "\\r"
+		end a line too. The file is mapped to memory rather than read, so only the
+		current line is held as a string. """
+	with pin.open("rb") as f:
+		if os.fstat(f.fileno()).st_size == 0:
+			# Empty files can't be mapped
+			yield ""
+			return
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+			line = b""
+			for line in iter(mm.readline, b""):
+				text = line.decode("utf-8")
+				if text.endswith("\n"):
+					text = text[:-2] if text.endswith("\r\n") else text[:-1]
+				# Universal newlines, as read_text() reads the file
+				yield from text.split("\r")
+			if line.endswith(b"\n"):
+				yield ""
@@ -30,6 +30,7 @@ from collections import defaultdict
 
 from annotald.annotree import AnnoTree as AT
 from reynir.simpletree import SimpleTree, AnnoTree
+import treefiles
 #from reynir.simpletree import AnnoTreeToSimpleTree
 
 ALLTREES = defaultdict(set)
@@ -79,8 +80,7 @@ def collect(infolder, searchpart):
 			print(">>>>>>>>>>>>>>>>>>>>{} files finished!".format(i))
 		pin = infolder / p
 		#print(p.stem)
-		treetext = pin.read_text()
-		for each in treetext.split("\n\n"):
+		for each in treefiles.raw_trees(pin):
 			if not each:
 				# Empty line before EOF
 				continue